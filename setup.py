@@ -34,6 +34,16 @@ if __name__ == '__main__':
         url='https://github.com/thesquelched/suggestive',
         keywords='suggestive mpd lastfm music',
         download_url=download_url(),
+        python_requires='>=3.7',
+        classifiers=[
+            'Programming Language :: Python :: 3',
+            'Programming Language :: Python :: 3 :: Only',
+            'Programming Language :: Python :: 3.7',
+            'Programming Language :: Python :: 3.8',
+            'Programming Language :: Python :: 3.9',
+            'Programming Language :: Python :: 3.10',
+            'Programming Language :: Python :: 3.11',
+        ],
 
         packages=find_packages(
             exclude='tests',
@@ -41,6 +51,7 @@ if __name__ == '__main__':
         entry_points={
             'console_scripts': [
                 'suggestive = suggestive.app:main',
+                'suggestive-bench = suggestive.bench.runner:main',
             ],
         },
 
@@ -54,9 +65,9 @@ if __name__ == '__main__':
         install_requires=[
             'alembic>=0.6.0',
             'pylastfm>=0.2.0',
-            'python-mpd2>=0.5.1',
+            'python-mpd2>=1.0',
             'requests>=1.2.3',
-            'SQLAlchemy>=0.9.6',
+            'SQLAlchemy>=1.4',
             'urwid>=1.1.1',
             'unidecode',
             'figgis>=1.8.1',
@@ -0,0 +1,30 @@
+"""Add unique index on scrobble time and info
+
+Revision ID: b928344df489
+Revises: bb1854a2dbf8
+Create Date: 2026-10-19 09:12:31.402116
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b928344df489'
+down_revision = 'bb1854a2dbf8'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+
+def upgrade():
+    # Remove existing duplicates, keeping the earliest copy of each scrobble,
+    # so that the unique index can be created
+    op.execute(
+        'DELETE FROM scrobble WHERE id NOT IN ('
+        'SELECT MIN(id) FROM scrobble GROUP BY time, scrobble_info_id)')
+
+    op.create_index('ix_scrobble_time_scrobble_info_id', 'scrobble',
+                    ['time', 'scrobble_info_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_scrobble_time_scrobble_info_id')
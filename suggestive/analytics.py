@@ -1,15 +1,13 @@
 import logging
 import re
 import sys
-from unidecode import unidecode
-from sqlalchemy import func, Integer, distinct
-from sqlalchemy.orm import subqueryload
 from collections import defaultdict
 from datetime import datetime
 
 import suggestive.mstat as mstat
+import suggestive.stats as stats
+from suggestive.catalog import catalog
 from suggestive.db.session import session_scope
-from suggestive.db.model import Album, Track, Scrobble, LastfmTrackInfo
 
 
 logger = logging.getLogger(__name__)
@@ -39,15 +37,11 @@ class BaseOrder(OrderDecorator):
     """Initialize all albums with unity order"""
 
     def order(self, albums, session, mpd):
-        db_albums = session.query(Album).\
-            options(
-                subqueryload(Album.artist),
-            ).\
-            all()
+        all_albums = catalog.album_records()
 
         ordered = defaultdict(lambda: 1.0)
-        ordered.update({db_album: 0 if db_album.ignored else 1.0
-                        for db_album in db_albums})
+        ordered.update({album: 0 if album.ignored else 1.0
+                        for album in all_albums})
         return ordered
 
 
@@ -63,6 +57,8 @@ class AlbumFilter(OrderDecorator):
         return '<AlbumFilter({})>'.format(self.name)
 
     def order(self, albums, session, mpd):
+        from unidecode import unidecode
+
         return {
             album: order for album, order in albums.items()
             if re.search(self.name_rgx, album.name) or
@@ -82,10 +78,12 @@ class ArtistFilter(OrderDecorator):
         return '<ArtistFilter({})>'.format(self.name)
 
     def order(self, albums, session, mpd):
+        from unidecode import unidecode
+
         return {
             album: order for album, order in albums.items()
-            if re.search(self.name_rgx, album.artist.name) or
-            re.search(self.name_rgx, unidecode(album.artist.name))
+            if re.search(self.name_rgx, album.artist_name) or
+            re.search(self.name_rgx, unidecode(album.artist_name))
         }
 
 
@@ -97,7 +95,7 @@ class SortOrder(OrderDecorator):
         self.reverse = (not bool(reverse))
 
     def _format(self, album):
-        artist = album.artist.name
+        artist = album.artist_name
         if self.ignore_artist_the and artist.lower().startswith('the '):
             artist = artist[4:] + ', ' + artist[:3]
 
@@ -118,19 +116,33 @@ class ModifiedOrder(OrderDecorator):
         self.reverse = bool(reverse)
 
     @classmethod
-    def get_date(cls, album, mpd):
-        track_info = mpd.search('album', album.name)
-        if not track_info:
-            return None
+    def album_dates(cls, mpd):
+        """
+        Return a dict of lower-cased album name to the date its most recently
+        modified track was modified, from a single listing of the MPD library
+        """
+        dates = {}
+        for info in mpd.listallinfo():
+            album, modified = info.get('album'), info.get('last-modified')
+            if not (album and modified):
+                continue
+
+            # Multiple album tags
+            if isinstance(album, list):
+                album = album[0]
+
+            key = album.lower()
+            date = datetime.strptime(modified, cls.FMT)
+            if key not in dates or date > dates[key]:
+                dates[key] = date
 
-        dates = (datetime.strptime(info['last-modified'], cls.FMT)
-                 for info in track_info)
-        return max(dates)
+        return dates
 
     def order(self, albums, session, mpd):
+        dates = self.album_dates(mpd)
         sorted_albums = sorted(
             albums,
-            key=lambda album: self.get_date(album, mpd),
+            key=lambda album: dates.get(album.name.lower(), datetime.min),
             reverse=self.reverse)
         return {album: i for i, album in enumerate(sorted_albums, 1)}
 
@@ -174,23 +186,14 @@ class FractionLovedOrder(OrderDecorator):
             self.f_min, self.f_max, self.penalize)
 
     def order(self, albums, session, mpd):
-        results = session.query(Album).\
-            join(Track).\
-            outerjoin(LastfmTrackInfo).\
-            add_columns(func.count(Track.id),
-                        func.sum(LastfmTrackInfo.loved, type_=Integer)).\
-            group_by(Album.id).\
-            all()
-
         neworder = defaultdict(lambda: 1.0, albums.items())
+        by_id = {album.id: album for album in albums}
 
-        for album, n_tracks, n_loved in results:
+        for album_id, (n_tracks, n_loved, _) in catalog.album_totals().items():
+            album = by_id.get(album_id)
             if album not in neworder or n_tracks == 0:
                 continue
 
-            if n_loved is None:
-                n_loved = 0
-
             f_loved = n_loved / n_tracks
             if not (self.f_min <= f_loved <= self.f_max):
                 del neworder[album]
@@ -247,18 +250,12 @@ class PlaycountOrder(OrderDecorator):
             self.plays_min, self.plays_max)
 
     def order(self, albums, session, mpd):
-        results = session.query(Album).\
-            join(Track).\
-            outerjoin(Scrobble).\
-            add_columns(
-                func.count(distinct(Track.id)),
-                func.count(Scrobble.id)).\
-            group_by(Album.id).\
-            all()
-
         neworder = defaultdict(lambda: 1.0, albums.items())
+        by_id = {album.id: album for album in albums}
 
-        for album, n_tracks, n_scrobbles in results:
+        for album_id, (n_tracks, _, n_scrobbles) in \
+                catalog.album_totals().items():
+            album = by_id.get(album_id)
             if album not in neworder or n_tracks == 0:
                 continue
 
@@ -281,21 +278,34 @@ class Analytics(object):
     def __init__(self, conf):
         self.conf = conf
 
-    def order_albums(self, orderers=None):
+    @stats.timed
+    def order_albums(self, orderers=None, cancelled=None):
+        """
+        Return the list of album suggestions produced by applying each orderer
+        in turn.  If the threading.Event `cancelled` is set before all of the
+        orderers have been applied, return None instead
+        """
         mpd = mstat.initialize_mpd(self.conf)
+        catalog.ensure_loaded(self.conf)
 
         if orderers is None:
             orderers = [BaseOrder()]
 
         ordered = {}
-        with session_scope(self.conf, commit=False) as session:
+        with session_scope(self.conf, read_only=True) as session:
             for album_orderer in orderers:
-                ordered = album_orderer.order(ordered, session, mpd)
+                if cancelled is not None and cancelled.is_set():
+                    logger.debug('Album ordering cancelled')
+                    return None
+
+                name = '{}.order'.format(album_orderer.__class__.__name__)
+                with stats.timer(name):
+                    ordered = album_orderer.order(ordered, session, mpd)
 
         # Order by score, then by artist name, then by album name
         sorted_order = sorted(
             ordered.items(),
-            reverse=True,
-            key=lambda item: (item[1], item[0]))
+            key=lambda item: (item[0].artist_name or '', item[0].name))
+        sorted_order.sort(key=lambda item: item[1], reverse=True)
 
         return [Suggestion(album, order) for album, order in sorted_order]
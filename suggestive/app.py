@@ -5,17 +5,22 @@ Main application/UI
 import asyncio
 import argparse
 import urwid
+from mpd import MPDError
 import logging
 from logging.handlers import RotatingFileHandler
 import threading
 import os
 import gzip
+import time
 
 from suggestive.db.session import initialize as initialize_session
-from suggestive import widget, signals, mstat, migrate
+from suggestive.catalog import catalog
+from suggestive import (
+    widget, signals, mstat, migrate, stats, profiling, memory)
 from suggestive.threads import (
-    MpdObserver, EventDispatcher, DatabaseUpdater, ScrobbleInitializeThread)
-from suggestive.config import Config
+    DatabaseUpdater, DatabaseWriter, ScrobbleInitializeThread)
+from suggestive.events import MpdObserver, EventDispatcher
+from suggestive.config import Config, expand
 from suggestive.command import CommanderEdit, Commandable, typed
 from suggestive.search import LazySearcher
 from suggestive.error import CommandError
@@ -39,12 +44,15 @@ class MainView(urwid.Frame):
     """
 
     __metaclass__ = urwid.signals.MetaSignals
-    signals = [signals.SET_FOOTER, signals.SET_FOCUS]
+    signals = [signals.SET_FOOTER, signals.SET_FOCUS, signals.REDRAW]
 
     def __init__(self, conf, loop):
         self._conf = conf
 
-        self._buffers = self.initialize_buffers(loop)
+        self._loop = loop
+        self._factories = self.buffer_factories()
+        self._buffers = {}
+        self.initialize_buffers()
         self._buffer_list = self.create_buffer_list()
 
         super(MainView, self).__init__(
@@ -61,66 +69,94 @@ class MainView(urwid.Frame):
 
     @property
     def buffers(self):
+        """Buffers that have been constructed so far"""
         return self._buffers
 
     @property
     def library(self):
-        return self.buffers['library']
+        return self.buffer('library')
 
     @property
     def playlist(self):
-        return self.buffers['playlist']
+        return self.buffer('playlist')
 
     @property
     def scrobbles(self):
-        return self.buffers['scrobbles']
+        return self.buffer('scrobbles')
 
     def __iter__(self):
         return iter(self._buffer_list)
 
-    def initialize_buffers(self, loop):
+    def buffer_factories(self):
+        return {
+            'library': self.create_library_buffer,
+            'playlist': self.create_playlist_buffer,
+            'scrobbles': self.create_scrobbles_buffer,
+        }
+
+    def buffer(self, name):
+        """
+        Return the named buffer, constructing it if it hasn't been used yet.
+        Return None for an unknown buffer name
+        """
+        if name not in self._buffers:
+            factory = self._factories.get(name)
+            if factory is None:
+                return None
+
+            logger.debug('Constructing buffer {}'.format(name))
+            self._buffers[name] = factory(self._loop)
+
+        return self._buffers[name]
+
+    def loaded_buffer(self, name):
+        """Return the named buffer only if it has already been constructed"""
+        return self._buffers.get(name)
+
+    def initialize_buffers(self):
+        """
+        Construct only the default buffers; the others are constructed when
+        first opened, or when their controller is needed
+        """
         default = set(self.conf.general.default_buffers)
         logger.debug('Default buffers: {}'.format(default))
 
-        buffers = {
-            'library': self.create_library_buffer(
-                loop, 'library' in default),
-            'playlist': self.create_playlist_buffer(
-                loop, 'playlist' in default),
-            'scrobbles': self.create_scrobbles_buffer(
-                loop, 'scrobbles' in default),
-        }
+        for name in self._factories:
+            Controller.register_factory(
+                name, lambda name=name: self.buffer(name))
 
-        logger.debug('Controller registry: {}'.format(Controller._registry))
+        for name in ('library', 'playlist', 'scrobbles'):
+            if name in default:
+                self.buffer(name).active = True
 
-        return buffers
+        logger.debug('Controller registry: {}'.format(Controller._registry))
 
-    def create_library_buffer(self, loop, active=False):
+    def create_library_buffer(self, loop):
         buf = LibraryBuffer(self.conf, loop)
-        buf.active = active
         urwid.connect_signal(buf, signals.SET_FOCUS, self.update_focus)
         urwid.connect_signal(buf, signals.SET_FOOTER, self.update_footer)
+        urwid.connect_signal(buf, signals.REDRAW, self.redraw)
 
         return buf
 
-    def create_playlist_buffer(self, loop, active=False):
+    def create_playlist_buffer(self, loop):
         buf = PlaylistBuffer(self.conf, loop)
-        buf.active = active
         urwid.connect_signal(buf, signals.SET_FOCUS, self.update_focus)
         urwid.connect_signal(buf, signals.SET_FOOTER, self.update_footer)
+        urwid.connect_signal(buf, signals.REDRAW, self.redraw)
 
         return buf
 
-    def create_scrobbles_buffer(self, loop, active=False):
+    def create_scrobbles_buffer(self, loop):
         buf = ScrobbleBuffer(self.conf, loop)
-        buf.active = active
         urwid.connect_signal(buf, signals.SET_FOCUS, self.update_focus)
         urwid.connect_signal(buf, signals.SET_FOOTER, self.update_footer)
+        urwid.connect_signal(buf, signals.REDRAW, self.redraw)
 
         return buf
 
     def toggle_buffer(self, name):
-        buf = self.buffers.get(name)
+        buf = self.buffer(name)
         if not buf:
             raise CommandError('Unknown buffer: {}'.format(name))
 
@@ -152,12 +188,13 @@ class MainView(urwid.Frame):
             buffer_list = VerticalBufferList()
 
         for bufname in ('library', 'playlist', 'scrobbles'):
-            buf = self.buffers[bufname]
+            buf = self.loaded_buffer(bufname)
+            active = buf is not None and buf.active
             logger.debug('Buffer {} is {}'.format(
                 bufname,
-                'active' if buf.active else 'not active'))
+                'active' if active else 'not active'))
 
-            if buf.active:
+            if active:
                 buffer_list.add(buf)
 
         return buffer_list
@@ -180,6 +217,9 @@ class MainView(urwid.Frame):
     def update_focus(self, to_focus):
         self.set_focus(to_focus)
 
+    def redraw(self):
+        urwid.emit_signal(self, signals.REDRAW)
+
 
 class Application(Commandable):
     """
@@ -193,8 +233,11 @@ class Application(Commandable):
         self.quit_event = threading.Event()
 
         self.loop = asyncio.get_event_loop()
+        self.loop.set_default_executor(
+            profiling.ProfiledExecutor(profiling.profiler))
         self.top = MainView(conf, self.loop)
         self.urwid_loop = self.main_loop()
+        urwid.connect_signal(self.top, signals.REDRAW, self.redraw)
 
         self.bindings = self.setup_bindings()
         self.commands = self.setup_commands()
@@ -213,7 +256,9 @@ class Application(Commandable):
         """
         Update the library buffer status footer
         """
-        self.top.library.update_status(*args, **kwArgs)
+        library = self.top.loaded_buffer('library')
+        if library is not None:
+            library.update_status(*args, **kwArgs)
 
     def update_footer(self, value, error=False):
         """Update the main window footer"""
@@ -239,53 +284,116 @@ class Application(Commandable):
             'database': self.update_database_event,
             'update': self.check_update_event,
         }
-        self.observer = MpdObserver(self.conf, events, self.quit_event)
-        self.dispatcher = EventDispatcher(self.quit_event)
+        self.dispatcher = EventDispatcher(events, self.loop, self.redraw)
+        self.observer = MpdObserver(self.conf, self.dispatcher)
+        self.writer = DatabaseWriter(self.quit_event)
+        self.updater = DatabaseUpdater(
+            self.conf,
+            self.quit_event,
+            self.threadsafe(self.update_database_status),
+            self.threadsafe(self.update_library_event),
+            delay=self.conf.general.database_update_delay)
+
+        self.writer.start()
+        self.updater.start()
+        self.tasks = [
+            self.loop.create_task(self.dispatcher.run()),
+            self.loop.create_task(self.observer.run()),
+        ]
+
+    def stop_event_system(self):
+        self.quit_event.set()
+        for task in self.tasks:
+            task.cancel()
+
+        self.dispatcher.queue.log_stats()
+        stats.registry.log_stats()
+
+    def threadsafe(self, func):
+        """
+        Return a function that may be called from any thread to run func on
+        the event loop, then redraw the screen
+        """
+        def run_and_redraw():
+            func()
+            self.redraw()
 
-        self.dispatcher.start()
-        self.observer.start()
+        return lambda: self.loop.call_soon_threadsafe(run_and_redraw)
 
-    def update_player_event(self):
-        if self.top.playlist.track_changed():
-            self.update_playlist_event()
+    def redraw(self):
+        """
+        Redraw the screen after changes made outside of urwid input handlers
+        and alarms
+        """
+        if self.urwid_loop.screen.started:
+            self.urwid_loop.draw_screen()
+
+    async def update_player_event(self):
+        playlist = self.top.loaded_buffer('playlist')
+        mpd = await self.observer.client()
+        if playlist is None or await playlist.async_track_changed(mpd):
+            await self.update_playlist_event()
         else:
-            self.top.playlist.update_playing_status()
+            await playlist.async_update_playing_status(mpd)
 
     def update_database_event(self):
-        self.update_library_status('Library (updating database...)')
-        updater = DatabaseUpdater(
-            self.conf,
-            self.quit_event,
-            self.update_library_event)
-        updater.start()
+        self.updater.request()
 
-    def check_update_event(self):
-        if 'updating_db' in self._mpd.status():
-            self.update_library_status('Library (updating MPD...)')
+    def update_database_status(self):
+        """
+        Show the state of the database update queue in the library status
+        """
+        status = self.updater.status
+        if status:
+            self.update_library_status('Library ({})'.format(status))
         else:
             self.update_library_status('Library')
 
+    async def check_update_event(self):
+        mpd = await self.observer.client()
+        if 'updating_db' in (await mpd.status()):
+            self.update_library_status('Library (updating MPD...)')
+        else:
+            self.update_database_status()
+
     @mstat.mpd_retry
     def start_mpd_update(self):
         self._mpd.update()
 
     def start_scrobble_initialize(self):
         scrobble_thread = ScrobbleInitializeThread(
-            self.conf, self.update_library_event, self.quit_event)
+            self.conf,
+            self.threadsafe(self.update_library_event),
+            self.quit_event)
         scrobble_thread.daemon = False
         scrobble_thread.start()
 
     def update_library_event(self):
         logger.info('Updating library')
-        self.urwid_loop.set_alarm_in(
-            0,
-            lambda *args: self.top.library.controller.update_model())
-        self.urwid_loop.set_alarm_in(0, self.top.scrobbles.reload)
-        self.update_library_status('Library')
-
-    def update_playlist_event(self):
-        self.urwid_loop.set_alarm_in(0, self.top.playlist.update)
-        self.urwid_loop.set_alarm_in(0, self.top.scrobbles.update)
+        library = self.top.loaded_buffer('library')
+        if library is not None:
+            self.urwid_loop.set_alarm_in(
+                0,
+                lambda *args: library.controller.update_model())
+
+        playlist = self.top.loaded_buffer('playlist')
+        if playlist is not None:
+            self.urwid_loop.set_alarm_in(
+                0,
+                lambda *args: playlist.controller.update_unknown_tracks())
+
+        scrobbles = self.top.loaded_buffer('scrobbles')
+        if scrobbles is not None:
+            self.urwid_loop.set_alarm_in(0, scrobbles.reload)
+
+        self.update_database_status()
+
+    async def update_playlist_event(self):
+        mpd = await self.observer.client()
+        for name in ('playlist', 'scrobbles'):
+            buf = self.top.loaded_buffer(name)
+            if buf is not None:
+                await buf.async_update(mpd)
 
     def dispatch(self, key):
         if key in self.bindings:
@@ -295,16 +403,37 @@ class Application(Commandable):
         else:
             return False
 
+    def save_mpd_playlist(self, name):
+        """
+        Save the MPD playlist, without constructing the playlist buffer if it
+        hasn't been used
+        """
+        playlist = self.top.loaded_buffer('playlist')
+        if playlist is not None:
+            playlist.save_playlist(name)
+            return
+
+        mpd = mstat.initialize_mpd(self.conf)
+        try:
+            mpd.rm(name)
+        except Exception:
+            pass
+
+        mpd.save(name)
+
     def exit(self):
         if self.conf.playlist.save_playlist_on_close:
-            playlist = self.conf.playlist.playlist_save_name
             try:
-                self.top.playlist.save_playlist(playlist)
+                self.save_mpd_playlist(self.conf.playlist.playlist_save_name)
             except Exception as ex:
                 logger.error('Unable to save playlist: {}'.format(ex))
                 pass
 
-        self.quit_event.set()
+        library = self.top.loaded_buffer('library')
+        if library is not None:
+            library.controller.save_snapshot()
+
+        self.stop_event_system()
         raise urwid.ExitMainLoop()
 
     def setup_bindings(self):
@@ -336,11 +465,115 @@ class Application(Commandable):
             'orientation': self.top.change_orientation,
             'or': self.top.change_orientation,
             'score': self.toggle_show_score,
-            'save': self.top.playlist.save_playlist,
-            'load': self.top.playlist.load_playlist,
-            'seek': self.top.playlist.seek,
+            'save': self.save_playlist,
+            'load': self.load_playlist,
+            'seek': self.seek,
+            'stats': self.show_stats,
+            'profile': self.profile,
+            'memory': self.memory,
         }
 
+    # The playlist buffer is only constructed once one of these is used
+    def save_playlist(self, name=None):
+        return self.top.playlist.save_playlist(name)
+
+    def load_playlist(self, name=None):
+        return self.top.playlist.load_playlist(name)
+
+    def seek(self, position=None):
+        return self.top.playlist.seek(position)
+
+    def show_stats(self, action=None):
+        """
+        Log the timing statistics, and show the operations that took the most
+        time in the footer.  `:stats reset` clears the statistics instead
+        """
+        if not stats.registry.enabled:
+            raise CommandError(
+                'Timing statistics are disabled; set timing_stats = true')
+
+        if action == 'reset':
+            stats.registry.reset()
+            self.update_footer('Timing statistics reset')
+            return
+        elif action is not None:
+            raise CommandError('Unknown stats action: {}'.format(action))
+
+        stats.registry.log_stats()
+        slowest = ', '.join(
+            '{} {}x{}'.format(name, timing.count,
+                              stats.format_seconds(timing.mean))
+            for name, timing in stats.registry.summary(limit=3))
+        self.update_footer('Slowest: {} (see log for details)'.format(
+            slowest or 'nothing timed yet'))
+
+    def profile(self, action=None, path=None):
+        """
+        `:profile start` starts profiling the application; `:profile stop
+        [file]` writes the profile to a pstats file and logs a summary
+        """
+        profiler = profiling.profiler
+        if action == 'start':
+            if profiler.running:
+                raise CommandError('Already profiling')
+
+            profiler.start()
+            self.update_footer('Profiling; use :profile stop to finish')
+        elif action == 'stop':
+            if not profiler.running:
+                raise CommandError('Not profiling')
+
+            report = profiler.stop()
+            if report is None:
+                raise CommandError('Nothing was profiled')
+
+            if path is None:
+                path = os.path.join(
+                    self.conf.general.conf_dir,
+                    time.strftime('profile-%Y%m%d-%H%M%S.pstats'))
+            path = expand(path)
+
+            try:
+                report.dump_stats(path)
+            except OSError as exc:
+                raise CommandError('Unable to write profile: {}'.format(exc))
+
+            logger.info('Wrote profile to %s:\n%s', path,
+                        profiling.summary(report))
+            self.update_footer('Wrote profile to {}'.format(path))
+        else:
+            raise CommandError('Usage: profile start|stop [file]')
+
+    def memory(self, action=None):
+        """
+        Log the allocation sites and live model, view and database objects
+        that changed since the last `:memory`; `:memory stop` stops tracing
+        allocations
+        """
+        tracker = memory.tracker
+        if action == 'stop':
+            if not tracker.tracing:
+                raise CommandError('Not tracing memory')
+
+            tracker.stop()
+            self.update_footer('Stopped tracing memory')
+            return
+        elif action is not None:
+            raise CommandError('Usage: memory [stop]')
+
+        report = tracker.take()
+        logger.info('Memory report:\n%s', report)
+
+        if report.baseline:
+            self.update_footer(
+                'Tracing memory; use :memory again to compare (see log)')
+        else:
+            self.update_footer('Traced memory: {} ({}); see log for '
+                               'details'.format(
+                                   memory.format_size(report.traced),
+                                   memory.format_size(report.traced_change,
+                                                      sign=True)))
+
     def clear_playlist(self):
         self.top.playlist.clear_mpd_playlist()
         if self.top.current_buffer() is self.top.playlist:
@@ -446,12 +679,25 @@ class Application(Commandable):
         screen.set_terminal_properties(colors=self.conf.general.colormode)
 
     def continuously_update_playlist_status(self, *args):
-        text = self.top.playlist.status_text()
-        self.top.playlist.update_status(text)
+        self.loop.create_task(self.update_playlist_status())
         self.urwid_loop.set_alarm_in(
             1,
             self.continuously_update_playlist_status)
 
+    async def update_playlist_status(self):
+        mpd = self.observer.mpd
+        playlist = self.top.loaded_buffer('playlist')
+        if mpd is None or playlist is None:
+            return
+
+        try:
+            await playlist.async_update_playing_status(mpd)
+        except (MPDError, OSError) as exc:
+            logger.debug('Could not update playlist status: %s', exc)
+            return
+
+        self.redraw()
+
     def main_loop(self):
         mainloop = urwid.MainLoop(
             self.top,
@@ -507,14 +753,16 @@ def initialize_logging(conf):
     logging.getLogger('mpd').setLevel(logging.ERROR)
     logging.getLogger('requests').setLevel(logging.ERROR)
 
-    # SQLAlchemy query logging
-    if conf.general.log_sql_queries:
+    # SQLAlchemy query logging.  Per-scope summaries are logged by
+    # suggestive.db.session; individual statements only when verbose
+    if conf.general.log_sql_queries and conf.general.verbose:
         logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
 
 def run(args):
     conf = Config(args)
     initialize_logging(conf)
+    stats.registry.enabled = conf.general.timing_stats
 
     first_time = not os.path.exists(conf.general.database)
     if first_time:
@@ -536,6 +784,9 @@ def run(args):
         print('Reinitialize scrobbles from LastFM...')
         mstat.reinitialize_scrobbles(conf)
 
+    # Buffers and orderers read artists, albums and tracks from the catalog
+    catalog.ensure_loaded(conf)
+
     try:
         logger.debug('Starting event loop')
         app = Application(args, conf)
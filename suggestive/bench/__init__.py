@@ -0,0 +1,4 @@
+"""
+Benchmarking tools: synthetic data, local stand-ins for the MPD and LastFM
+servers, and a scenario runner
+"""
@@ -0,0 +1,3 @@
+from suggestive.bench.runner import main
+
+main()
@@ -0,0 +1,370 @@
+"""
+Generate reproducible synthetic data at any scale: a suggestive SQLite
+database, the matching MPD catalog and a LastFM-style scrobble stream.
+
+The same parameters (including the seed) always produce the same data, e.g.
+
+    dataset = Dataset(artists=2000, albums_per_artist=10, tracks_per_album=12,
+                      scrobbles=500000, seed=1)
+    dataset.write_database(conf)
+"""
+
+from suggestive.db.session import initialize, session_scope
+from suggestive.db.model import (
+    Artist, Album, Track, LastfmTrackInfo, ScrobbleInfo, Scrobble, LoadStatus)
+
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+SYLLABLES = (
+    'ba', 'ko', 'ri', 'tel', 'mon', 'sa', 'vor', 'lin', 'da', 'quo', 'ne',
+    'phi', 'zu', 'gar', 'em', 'tho', 'wil', 'ya', 'cre', 'dos', 'fi', 'hal',
+)
+
+# Non-ASCII replacements for letters, used to add unicode to names
+UNICODE_LETTERS = {
+    'a': 'áàäå', 'e': 'éèëê', 'i': 'íïî', 'o': 'óöøô', 'u': 'úüû', 'n': 'ñ',
+    'c': 'ç', 's': 'ß',
+}
+
+# Rows per executemany() call when writing the database
+CHUNK_SIZE = 5000
+
+EPOCH = datetime(2015, 1, 1)
+
+
+class CatalogTrack(object):
+
+    """A track in the generated catalog"""
+
+    __slots__ = ('id', 'artist', 'album', 'title', 'number', 'filename',
+                 'seconds', 'modified', 'loved')
+
+    def __init__(self, id, artist, album, title, number, filename, seconds,
+                 modified, loved):
+        self.id = id
+        self.artist = artist
+        self.album = album
+        self.title = title
+        self.number = number
+        self.filename = filename
+        self.seconds = seconds
+        self.modified = modified
+        self.loved = loved
+
+    def mpd_info(self):
+        """Return the track as MPD would describe it, e.g. in listallinfo"""
+        return {
+            'file': self.filename,
+            'last-modified': self.modified.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'time': str(self.seconds),
+            'duration': '{:.3f}'.format(self.seconds),
+            'artist': self.artist,
+            'albumartist': self.artist,
+            'album': self.album,
+            'title': self.title,
+            'track': str(self.number),
+        }
+
+
+class GeneratedScrobble(object):
+
+    """A scrobble in the generated LastFM scrobble stream"""
+
+    __slots__ = ('artist', 'album', 'title', 'time', 'loved', 'track')
+
+    def __init__(self, artist, album, title, time, loved, track):
+        self.artist = artist
+        self.album = album
+        self.title = title
+        self.time = time
+        self.loved = loved
+
+        # The CatalogTrack that was played, whether or not the scrobble's
+        # names have typos
+        self.track = track
+
+
+class Dataset(object):
+
+    """
+    A deterministic synthetic music library and listening history.
+
+    unicode_density is the fraction of names containing non-ASCII letters, and
+    typo_rate is the fraction of scrobbles whose names differ slightly from
+    the catalog, which exercises fuzzy matching.  Scrobbles are ordered newest
+    first, like the LastFM API returns them
+    """
+
+    def __init__(self, artists=100, albums_per_artist=5, tracks_per_album=10,
+                 scrobbles=10000, unicode_density=0.1, typo_rate=0.05,
+                 loved_rate=0.05, seed=0, end=None):
+        self.n_artists = artists
+        self.albums_per_artist = albums_per_artist
+        self.tracks_per_album = tracks_per_album
+        self.n_scrobbles = scrobbles
+        self.unicode_density = unicode_density
+        self.typo_rate = typo_rate
+        self.loved_rate = loved_rate
+        self.seed = seed
+        self.end = end or EPOCH + timedelta(days=3 * 365)
+
+        self._random = random.Random(seed)
+        self.tracks = self._generate_catalog()
+        self.scrobbles = self._generate_scrobbles()
+
+    def __repr__(self):
+        return ('<Dataset(artists={}, albums={}, tracks={}, scrobbles={}, '
+                'seed={})>').format(
+                    self.n_artists,
+                    self.n_artists * self.albums_per_artist,
+                    len(self.tracks),
+                    len(self.scrobbles),
+                    self.seed)
+
+    ######################################################################
+    # Generation
+    ######################################################################
+
+    def _word(self, min_syllables=1, max_syllables=3):
+        rand = self._random
+        return ''.join(
+            rand.choice(SYLLABLES)
+            for _ in range(rand.randint(min_syllables, max_syllables)))
+
+    def _name(self, min_words, max_words):
+        rand = self._random
+        name = ' '.join(self._word().capitalize()
+                        for _ in range(rand.randint(min_words, max_words)))
+
+        if rand.random() < self.unicode_density:
+            name = self._add_unicode(name)
+
+        return name
+
+    def _add_unicode(self, name):
+        rand = self._random
+        positions = [i for i, char in enumerate(name)
+                     if char in UNICODE_LETTERS]
+        if not positions:
+            return name
+
+        chars = list(name)
+        for i in rand.sample(positions, max(1, len(positions) // 3)):
+            chars[i] = rand.choice(UNICODE_LETTERS[chars[i]])
+
+        return ''.join(chars)
+
+    def _typo(self, name):
+        """Return name with a single typo or change of case"""
+        rand = self._random
+        if len(name) < 2:
+            return name.upper()
+
+        i = rand.randrange(len(name) - 1)
+        kind = rand.randrange(4)
+        if kind == 0 and name[i] != name[i + 1]:
+            return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+        elif kind == 1:
+            return name[:i] + name[i + 1:]
+        elif kind == 2:
+            return name[:i] + name[i] + name[i:]
+        else:
+            return name.swapcase()
+
+    def _unique(self, seen, make_name):
+        """Generate names until one that isn't in seen comes up"""
+        name = make_name()
+        while name.lower() in seen:
+            name = '{} {}'.format(name, self._word(1, 1).capitalize())
+
+        seen.add(name.lower())
+        return name
+
+    def _generate_catalog(self):
+        rand = self._random
+        tracks = []
+        artists = set()
+
+        for _ in range(self.n_artists):
+            artist = self._unique(artists, lambda: self._name(1, 3))
+            albums = set()
+            for _ in range(self.albums_per_artist):
+                album = self._unique(albums, lambda: self._name(1, 4))
+                year = rand.randint(1960, 2015)
+                modified = EPOCH + timedelta(seconds=rand.randrange(
+                    int((self.end - EPOCH).total_seconds())))
+
+                titles = set()
+                for number in range(1, self.tracks_per_album + 1):
+                    title = self._unique(titles, lambda: self._name(1, 5))
+                    filename = '{}/{} - {}/{:02d} - {}.flac'.format(
+                        artist, year, album, number, title)
+
+                    tracks.append(CatalogTrack(
+                        id=len(tracks) + 1,
+                        artist=artist,
+                        album=album,
+                        title=title,
+                        number=number,
+                        filename=filename,
+                        seconds=rand.randint(90, 600),
+                        modified=modified,
+                        loved=rand.random() < self.loved_rate))
+
+        return tracks
+
+    def _generate_scrobbles(self):
+        if not self.tracks:
+            return []
+
+        rand = self._random
+        span = (self.end - EPOCH).total_seconds()
+
+        # Listening habits follow a rough power law; a few tracks get most of
+        # the plays
+        weights = [1.0 / (rank + 1) for rank in range(len(self.tracks))]
+        order = list(self.tracks)
+        rand.shuffle(order)
+
+        times = sorted(
+            (rand.uniform(0, span) for _ in range(self.n_scrobbles)),
+            reverse=True)
+        played = rand.choices(order, weights=weights, k=self.n_scrobbles)
+
+        scrobbles = []
+        seen = set()
+        for offset, track in zip(times, played):
+            # Scrobble times have second resolution and are unique per track
+            time = EPOCH + timedelta(seconds=int(offset))
+            while (time, track.id) in seen:
+                time -= timedelta(seconds=1)
+            seen.add((time, track.id))
+
+            artist, album, title = track.artist, track.album, track.title
+            if rand.random() < self.typo_rate:
+                field = rand.randrange(3)
+                if field == 0:
+                    artist = self._typo(artist)
+                elif field == 1:
+                    album = self._typo(album)
+                else:
+                    title = self._typo(title)
+
+            scrobbles.append(GeneratedScrobble(
+                artist, album, title, time, track.loved, track))
+
+        return scrobbles
+
+    ######################################################################
+    # Output
+    ######################################################################
+
+    @property
+    def loved_tracks(self):
+        return [track for track in self.tracks if track.loved]
+
+    def mpd_catalog(self):
+        """Return the MPD descriptions of every track in the catalog"""
+        return [track.mpd_info() for track in self.tracks]
+
+    def write_database(self, conf, track_fraction=1.0, scrobbles=True):
+        """
+        Create the suggestive database for conf, stamped with the newest
+        migration.  Only the first track_fraction of the catalog's tracks are
+        written, so that syncing with the MPD catalog has work to do.  If
+        scrobbles is False, scrobbles are not written either
+        """
+        from suggestive.migrate import HEAD_REVISION
+
+        path = conf.general.database
+        if os.path.exists(path):
+            os.remove(path)
+
+        initialize(conf)
+
+        n_tracks = int(len(self.tracks) * track_fraction)
+        tracks = self.tracks[:n_tracks]
+        logger.info('Writing %d of %d tracks to %s', n_tracks,
+                    len(self.tracks), path)
+
+        artist_ids, album_ids = {}, {}
+        artists, albums, track_rows, info_rows = [], [], [], []
+        for track in tracks:
+            if track.artist not in artist_ids:
+                artist_ids[track.artist] = len(artist_ids) + 1
+                artists.append({'id': artist_ids[track.artist],
+                                'name': track.artist})
+
+            key = (track.artist, track.album)
+            if key not in album_ids:
+                album_ids[key] = len(album_ids) + 1
+                albums.append({'id': album_ids[key],
+                               'name': track.album,
+                               'artist_id': artist_ids[track.artist],
+                               'ignored': False})
+
+            track_rows.append({'id': track.id,
+                               'name': track.title,
+                               'filename': track.filename,
+                               'is_duplicate': False,
+                               'album_id': album_ids[key],
+                               'artist_id': artist_ids[track.artist]})
+            info_rows.append({'track_id': track.id,
+                              'loved': track.loved,
+                              'banned': False})
+
+        with session_scope(conf) as session:
+            self._insert(session, Artist, artists)
+            self._insert(session, Album, albums)
+            self._insert(session, Track, track_rows)
+            self._insert(session, LastfmTrackInfo, info_rows)
+
+            if scrobbles:
+                self._write_scrobbles(session, {t.id for t in tracks})
+
+            self._insert(session, LoadStatus,
+                         [{'scrobbles_initialized': scrobbles}])
+
+            session.execute(text(
+                'CREATE TABLE alembic_version '
+                '(version_num VARCHAR(32) NOT NULL)'))
+            session.execute(
+                text('INSERT INTO alembic_version VALUES (:revision)'),
+                {'revision': HEAD_REVISION})
+
+    def _write_scrobbles(self, session, track_ids):
+        info_ids = {}
+        info_rows, scrobble_rows = [], []
+        for scrobble in self.scrobbles:
+            key = (scrobble.artist, scrobble.album, scrobble.title)
+            if key not in info_ids:
+                info_ids[key] = len(info_ids) + 1
+                info_rows.append({'id': info_ids[key],
+                                  'artist': scrobble.artist,
+                                  'album': scrobble.album,
+                                  'title': scrobble.title})
+
+            track_id = scrobble.track.id
+            scrobble_rows.append({
+                'time': scrobble.time,
+                'loved': scrobble.loved,
+                'scrobble_info_id': info_ids[key],
+                'track_id': track_id if track_id in track_ids else None,
+            })
+
+        self._insert(session, ScrobbleInfo, info_rows)
+        self._insert(session, Scrobble, scrobble_rows)
+
+    @staticmethod
+    def _insert(session, model, rows):
+        for start in range(0, len(rows), CHUNK_SIZE):
+            session.execute(model.__table__.insert(),
+                            rows[start:start + CHUNK_SIZE])
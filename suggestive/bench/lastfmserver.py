@@ -0,0 +1,294 @@
+"""
+A local stand-in for the LastFM web service, for benchmarks.  It serves the
+scrobbles and loved tracks of a generated Dataset through the API methods
+suggestive uses, and can add latency to every page and fail requests with
+rate-limit errors, e.g.
+
+    server = LastfmServer(dataset, latency=0.05, rate_limit_every=10)
+    server.start()
+    conf.lastfm.url = server.url
+    ...
+    server.stop()
+"""
+
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import ceil
+from urllib.parse import parse_qs, quote, urlparse
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# LastFM API error codes
+ERROR_INVALID_METHOD = 3
+ERROR_INVALID_PARAMETERS = 6
+ERROR_RATE_LIMIT = 29
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+DATE_FORMAT = '%d %b %Y, %H:%M'
+
+
+class ApiError(Exception):
+
+    """An error that is returned to the client as a LastFM error response"""
+
+    def __init__(self, code, message):
+        super(ApiError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def unix_timestamp(date):
+    """Return the UNIX timestamp of a naive datetime, as pylastfm does"""
+    return int((date - datetime(1970, 1, 1)).total_seconds())
+
+
+def music_url(*names):
+    return 'https://www.last.fm/music/{}'.format(
+        '/_/'.join(quote(name.replace(' ', '+')) for name in names))
+
+
+def format_date(timestamp):
+    return {
+        'uts': str(timestamp),
+        '#text': time.strftime(DATE_FORMAT, time.gmtime(timestamp)),
+    }
+
+
+def integer(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise ApiError(ERROR_INVALID_PARAMETERS,
+                       'Invalid parameter: {}'.format(name))
+
+
+class LastfmServer(object):
+
+    """
+    Serve a Dataset's scrobbles and loved tracks over HTTP.  Every page is
+    delayed by latency seconds, and if rate_limit_every is set, every nth
+    request fails with a rate-limit error
+    """
+
+    def __init__(self, dataset, latency=0.0, rate_limit_every=0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+
+        # (timestamp, artist, album, title), newest first
+        self.scrobbles = [
+            (unix_timestamp(scrobble.time), scrobble.artist, scrobble.album,
+             scrobble.title)
+            for scrobble in dataset.scrobbles
+        ]
+        self._negated_times = [-item[0] for item in self.scrobbles]
+
+        # (artist, title) -> timestamp, most recently loved first
+        self.loved = OrderedDict()
+        end = unix_timestamp(dataset.end)
+        for i, track in enumerate(dataset.loved_tracks):
+            self.loved[(track.artist, track.title)] = end - 60 * i
+
+        self.requests = Counter()
+        self.errors = 0
+
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}/2.0/'.format(host, port)
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serve from a background thread, and return the API URL"""
+        server = self
+
+        class Handler(RequestHandler):
+            lastfm = server
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.05},
+                                        name='LastfmServer', daemon=True)
+        self._thread.start()
+
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    ######################################################################
+    # API methods
+    ######################################################################
+
+    def call(self, params):
+        """Return the response to an API call"""
+        method = params.get('method')
+        handler = {
+            'user.getRecentTracks': self.recent_tracks,
+            'user.getLovedTracks': self.loved_tracks,
+            'track.love': self.love,
+            'track.unlove': self.unlove,
+        }.get(method)
+
+        with self._lock:
+            self.requests[method] += 1
+            total = sum(self.requests.values())
+            rate_limited = (self.rate_limit_every and
+                            total % self.rate_limit_every == 0)
+            if rate_limited:
+                self.errors += 1
+
+        if rate_limited:
+            raise ApiError(ERROR_RATE_LIMIT, 'Rate limit exceeded')
+        elif handler is None:
+            raise ApiError(ERROR_INVALID_METHOD, 'Invalid Method')
+        elif 'user' not in params and method.startswith('user.'):
+            raise ApiError(ERROR_INVALID_PARAMETERS,
+                           'Invalid parameters - missing user')
+
+        return handler(params)
+
+    def _page(self, items, params, start=0, end=None):
+        """
+        Return the requested page of items[start:end], and the pagination
+        attributes for the response
+        """
+        limit = min(integer(params, 'limit', DEFAULT_LIMIT), MAX_LIMIT)
+        page = max(integer(params, 'page', 1), 1)
+        if limit < 1:
+            raise ApiError(ERROR_INVALID_PARAMETERS, 'Invalid limit')
+
+        total = (len(items) if end is None else end) - start
+        attributes = {
+            'user': params['user'],
+            'page': str(page),
+            'perPage': str(limit),
+            'totalPages': str(int(ceil(total / limit))),
+            'total': str(total),
+        }
+
+        first = start + (page - 1) * limit
+        last = min(first + limit, start + total)
+        return items[first:last], attributes
+
+    def recent_tracks(self, params):
+        # Scrobbles are newest first, so the range is found by bisecting the
+        # negated timestamps
+        start = bisect_left(self._negated_times,
+                            -integer(params, 'to', 2 ** 32))
+        end = bisect_right(self._negated_times, -integer(params, 'from', 0))
+
+        with self._lock:
+            loved = set(self.loved)
+
+        page, attributes = self._page(self.scrobbles, params, start, end)
+
+        tracks = [{
+            'name': title,
+            'mbid': '',
+            'url': music_url(artist, title),
+            'date': format_date(timestamp),
+            'streamable': '0',
+            'loved': '1' if (artist, title) in loved else '0',
+            'image': [],
+            'album': {'#text': album, 'mbid': ''},
+            'artist': {
+                'name': artist,
+                'mbid': '',
+                'url': music_url(artist),
+                'image': [],
+            },
+        } for timestamp, artist, album, title in page]
+
+        return {'recenttracks': {'track': tracks, '@attr': attributes}}
+
+    def loved_tracks(self, params):
+        with self._lock:
+            loved = list(self.loved.items())
+
+        page, attributes = self._page(loved, params)
+
+        tracks = [{
+            'name': title,
+            'mbid': '',
+            'url': music_url(artist, title),
+            'date': format_date(timestamp),
+            'streamable': {'#text': '0', 'fulltrack': '0'},
+            'image': [],
+            'artist': {'name': artist, 'mbid': '', 'url': music_url(artist)},
+        } for (artist, title), timestamp in page]
+
+        return {'lovedtracks': {'track': tracks, '@attr': attributes}}
+
+    def _track_key(self, params):
+        try:
+            return params['artist'], params['track']
+        except KeyError:
+            raise ApiError(ERROR_INVALID_PARAMETERS,
+                           'Invalid parameters - missing artist or track')
+
+    def love(self, params):
+        key = self._track_key(params)
+        with self._lock:
+            self.loved[key] = int(time.time())
+            self.loved.move_to_end(key, last=False)
+
+        return {}
+
+    def unlove(self, params):
+        key = self._track_key(params)
+        with self._lock:
+            self.loved.pop(key, None)
+
+        return {}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    # The LastfmServer being served, set by LastfmServer.start
+    lastfm = None
+
+    def do_GET(self):
+        self.respond(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.respond(parse_qs(self.rfile.read(length).decode('utf8')))
+
+    def respond(self, query):
+        params = {key: values[-1] for key, values in query.items()}
+
+        if self.lastfm.latency:
+            time.sleep(self.lastfm.latency)
+
+        try:
+            data = self.lastfm.call(params)
+        except ApiError as exc:
+            data = {'error': exc.code, 'message': exc.message}
+
+        body = json.dumps(data).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
@@ -0,0 +1,656 @@
+"""
+An in-process stand-in for an MPD server, for integration tests and
+benchmarks.  It speaks enough of the MPD protocol for suggestive (library
+queries, the playlist, playback status, idle and command lists), serves a
+generated catalog and can add latency to every response, e.g.
+
+    server = MpdServer(Dataset(artists=500).mpd_catalog(), latency=0.002)
+    host, port = server.start_thread()
+    ...
+    server.stop_thread()
+"""
+
+import asyncio
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+PROTOCOL_VERSION = '0.21.0'
+
+# MPD ACK error codes
+ACK_ERROR_ARG = 2
+ACK_ERROR_UNKNOWN = 5
+ACK_ERROR_NO_EXIST = 50
+
+# Tag names as MPD sends them, in the order it sends them
+TAG_NAMES = OrderedDict([
+    ('last-modified', 'Last-Modified'),
+    ('time', 'Time'),
+    ('duration', 'duration'),
+    ('artist', 'Artist'),
+    ('albumartist', 'AlbumArtist'),
+    ('album', 'Album'),
+    ('title', 'Title'),
+    ('track', 'Track'),
+    ('date', 'Date'),
+    ('genre', 'Genre'),
+])
+
+SUBSYSTEMS = ('database', 'update', 'playlist', 'player', 'mixer', 'options')
+
+ARGUMENT_RGX = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+
+class CommandError(Exception):
+
+    """An error that is reported to the client as an ACK"""
+
+    def __init__(self, code, message):
+        super(CommandError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def parse_command(line):
+    """Split a command line into the command name and its arguments"""
+    args = []
+    for quoted, bare in ARGUMENT_RGX.findall(line):
+        if bare:
+            args.append(bare)
+        else:
+            args.append(re.sub(r'\\(.)', r'\1', quoted))
+
+    if not args:
+        raise CommandError(ACK_ERROR_UNKNOWN, 'No command given')
+
+    return args[0], args[1:]
+
+
+def format_song(info):
+    """Return the response lines describing a song"""
+    lines = ['file: {}'.format(info['file'])]
+    for key, name in TAG_NAMES.items():
+        if key in info:
+            lines.append('{}: {}'.format(name, info[key]))
+
+    return lines
+
+
+def tag_value(info, tag):
+    if tag == 'any':
+        return ' '.join(info.get(key, '') for key in TAG_NAMES)
+    elif tag == 'base':
+        return info['file']
+
+    return info.get(tag, '')
+
+
+class PlaylistEntry(object):
+
+    __slots__ = ('id', 'info', 'version')
+
+    def __init__(self, id, info, version):
+        self.id = id
+        self.info = info
+
+        # Playlist version at which this entry last changed position
+        self.version = version
+
+
+class MpdServer(object):
+
+    """
+    Serve a catalog (a list of MPD track info dicts, e.g. from
+    Dataset.mpd_catalog) over the MPD protocol.  Every response is delayed by
+    latency seconds; a command list counts as a single response
+    """
+
+    def __init__(self, catalog, latency=0.0):
+        self.latency = latency
+        self.catalog = []
+        self.by_file = {}
+
+        self.playlist = []
+        self.playlist_version = 1
+        self.next_id = 1
+        self.state = 'stop'
+        self.current = None
+        self.update_id = 0
+        self.updating = None
+
+        self.commands = 0
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+        # (changed subsystems, change event) for each connected client
+        self._clients = []
+
+        self.set_catalog(catalog, notify=False)
+
+    ######################################################################
+    # Server lifecycle
+    ######################################################################
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start listening, and return the (host, port) being served"""
+        self._server = await asyncio.start_server(self.handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def start_thread(self, host='127.0.0.1', port=0):
+        """
+        Serve from a new event loop in a background thread, so that
+        synchronous clients can be used from the calling thread.  Returns the
+        (host, port) being served
+        """
+        started = threading.Event()
+        address = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            address.extend(
+                self._loop.run_until_complete(self.start(host, port)))
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._shutdown())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='MpdServer',
+                                        daemon=True)
+        self._thread.start()
+        started.wait()
+
+        return tuple(address)
+
+    async def _shutdown(self):
+        """Stop listening, and drop the connections that are still open"""
+        await self.close()
+
+        tasks = [task for task in asyncio.all_tasks()
+                 if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop_thread(self):
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def call(self, func, *args):
+        """
+        Call func with the server's state, on the server's own loop if it is
+        running in a thread
+        """
+        if self._thread is None:
+            return func(*args)
+
+        done = threading.Event()
+        result = []
+
+        def wrapper():
+            result.append(func(*args))
+            done.set()
+
+        self._loop.call_soon_threadsafe(wrapper)
+        done.wait()
+        return result[0]
+
+    ######################################################################
+    # State changes
+    ######################################################################
+
+    def set_catalog(self, catalog, notify=True):
+        """Replace the library, e.g. to simulate a database update"""
+        self.catalog = list(catalog)
+        self.by_file = {info['file']: info for info in self.catalog}
+        if notify:
+            self.notify('database', 'update')
+
+    def notify(self, *subsystems):
+        """
+        Tell clients that the subsystems have changed; they are told when they
+        next idle if they aren't idling already
+        """
+        for changes, event in self._clients:
+            changes.update(subsystems)
+            event.set()
+
+    def _playlist_changed(self, start=0):
+        self.playlist_version += 1
+        for entry in self.playlist[start:]:
+            entry.version = self.playlist_version
+
+        self.notify('playlist')
+
+    def _entry(self, id):
+        for pos, entry in enumerate(self.playlist):
+            if entry.id == id:
+                return pos, entry
+
+        raise CommandError(ACK_ERROR_NO_EXIST, 'No such song')
+
+    def _position(self, arg):
+        pos = self._integer(arg)
+        if not 0 <= pos < len(self.playlist):
+            raise CommandError(ACK_ERROR_ARG, 'Bad song index')
+        return pos
+
+    @staticmethod
+    def _integer(arg):
+        try:
+            return int(arg)
+        except ValueError:
+            raise CommandError(ACK_ERROR_ARG,
+                               'Integer expected: {}'.format(arg))
+
+    def _play(self, entry):
+        self.current = entry
+        self.state = 'stop' if entry is None else 'play'
+        self.notify('player')
+
+    ######################################################################
+    # Connections
+    ######################################################################
+
+    async def handle(self, reader, writer):
+        writer.write('OK MPD {}\n'.format(PROTOCOL_VERSION).encode('utf8'))
+        client = (set(), asyncio.Event())
+        self._clients.append(client)
+        try:
+            await self.serve(client, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Dropped by _shutdown.  Finish normally, since asyncio streams
+            # can't report the exception of a cancelled connection handler
+            pass
+        finally:
+            self._clients.remove(client)
+            writer.close()
+
+    async def serve(self, client, reader, writer):
+        command_list = None
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+
+            line = line.decode('utf8').rstrip('\n')
+            if line in ('command_list_begin', 'command_list_ok_begin'):
+                command_list = []
+                list_ok = line == 'command_list_ok_begin'
+                continue
+            elif command_list is not None and line != 'command_list_end':
+                command_list.append(line)
+                continue
+
+            if line == 'close':
+                return
+            elif line == 'noidle':
+                # Only meaningful while idling, which is handled in idle()
+                continue
+            elif line.startswith('idle'):
+                response = await self.idle(client, line, reader)
+            elif command_list is not None:
+                response = self.run_list(command_list, list_ok)
+                command_list = None
+            else:
+                response = self.run_list([line], False)
+
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            writer.write(response.encode('utf8'))
+            await writer.drain()
+
+    def run_list(self, lines, list_ok):
+        """Run commands, and return the whole response"""
+        response = []
+        for index, line in enumerate(lines):
+            self.commands += 1
+            try:
+                name, args = parse_command(line)
+                response.extend(self.run(name, args))
+            except CommandError as exc:
+                name = line.split(' ', 1)[0]
+                response.append('ACK [{}@{}] {{{}}} {}'.format(
+                    exc.code, index, name, exc.message))
+                return '\n'.join(response) + '\n'
+
+            if list_ok:
+                response.append('list_OK')
+
+        response.append('OK')
+        return '\n'.join(response) + '\n'
+
+    def run(self, name, args):
+        handler = getattr(self, 'cmd_{}'.format(name), None)
+        if handler is None:
+            raise CommandError(ACK_ERROR_UNKNOWN,
+                               'unknown command "{}"'.format(name))
+
+        return handler(*args) or []
+
+    async def idle(self, client, line, reader):
+        """
+        Wait until one of the requested subsystems has changed, or the client
+        sends noidle
+        """
+        _, subsystems = parse_command(line)
+        wanted = set(subsystems or SUBSYSTEMS)
+        changes, event = client
+
+        noidle = asyncio.ensure_future(reader.readline())
+        try:
+            while not changes & wanted and not noidle.done():
+                event.clear()
+                waiter = asyncio.ensure_future(event.wait())
+                await asyncio.wait([waiter, noidle],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+        finally:
+            if not noidle.done():
+                noidle.cancel()
+            elif not noidle.result():
+                raise ConnectionError('Connection closed while idle')
+
+        changed = changes & wanted
+        changes.difference_update(changed)
+
+        lines = ['changed: {}'.format(subsystem)
+                 for subsystem in SUBSYSTEMS if subsystem in changed]
+        return '\n'.join(lines + ['OK']) + '\n'
+
+    ######################################################################
+    # Database commands
+    ######################################################################
+
+    def _filter(self, args, exact):
+        if len(args) % 2:
+            raise CommandError(ACK_ERROR_ARG, 'Incorrect number of filters')
+
+        pairs = [(tag.lower(), value if exact else value.lower())
+                 for tag, value in zip(args[::2], args[1::2])]
+
+        def matches(info):
+            for tag, value in pairs:
+                actual = tag_value(info, tag)
+                if exact and actual != value:
+                    return False
+                elif not exact and value not in actual.lower():
+                    return False
+            return True
+
+        return [info for info in self.catalog if matches(info)]
+
+    def cmd_list(self, tag=None, *args):
+        if tag is None:
+            raise CommandError(ACK_ERROR_ARG, 'too few arguments for "list"')
+
+        tag = tag.lower()
+        name = TAG_NAMES.get(tag, tag)
+        seen = set()
+        lines = []
+        for info in self._filter(args, exact=True):
+            value = tag_value(info, tag)
+            if value and value not in seen:
+                seen.add(value)
+                lines.append('{}: {}'.format(name, value))
+
+        return lines
+
+    def cmd_listallinfo(self, path=''):
+        path = path.strip('/')
+        lines = []
+        for info in self.catalog:
+            filename = info['file']
+            if not path or filename == path or \
+                    filename.startswith(path + '/'):
+                lines.extend(format_song(info))
+
+        if path and not lines:
+            raise CommandError(ACK_ERROR_NO_EXIST, 'No such directory')
+
+        return lines
+
+    def cmd_lsinfo(self, path=''):
+        path = path.strip('/')
+        if path in self.by_file:
+            return format_song(self.by_file[path])
+
+        directories, lines = OrderedDict(), []
+        prefix = path + '/' if path else ''
+        for info in self.catalog:
+            filename = info['file']
+            if not filename.startswith(prefix):
+                continue
+
+            rest = filename[len(prefix):]
+            if '/' in rest:
+                directories[prefix + rest.split('/', 1)[0]] = True
+            else:
+                lines.extend(format_song(info))
+
+        if path and not directories and not lines:
+            raise CommandError(ACK_ERROR_NO_EXIST, 'No such directory')
+
+        return ['directory: {}'.format(d) for d in directories] + lines
+
+    def cmd_find(self, *args):
+        lines = []
+        for info in self._filter(args, exact=True):
+            lines.extend(format_song(info))
+        return lines
+
+    def cmd_search(self, *args):
+        lines = []
+        for info in self._filter(args, exact=False):
+            lines.extend(format_song(info))
+        return lines
+
+    def cmd_update(self, path=''):
+        """
+        Start an update, which finishes once the current command has been
+        answered
+        """
+        self.update_id += 1
+        self.updating = self.update_id
+        self.notify('update')
+        asyncio.get_event_loop().call_soon(self._finish_update)
+        return ['updating_db: {}'.format(self.update_id)]
+
+    def _finish_update(self):
+        self.notify('update', 'database')
+        self.updating = None
+
+    ######################################################################
+    # Playlist commands
+    ######################################################################
+
+    def _format_entry(self, pos, entry):
+        return format_song(entry.info) + [
+            'Pos: {}'.format(pos), 'Id: {}'.format(entry.id)]
+
+    def _entries(self, positions=None):
+        if positions is None:
+            return enumerate(self.playlist)
+
+        if ':' in positions:
+            start, end = positions.split(':', 1)
+            start = self._integer(start)
+            end = self._integer(end) if end else len(self.playlist)
+        else:
+            start = self._position(positions)
+            end = start + 1
+
+        return ((pos, self.playlist[pos])
+                for pos in range(start, min(end, len(self.playlist))))
+
+    def cmd_playlistinfo(self, positions=None):
+        lines = []
+        for pos, entry in self._entries(positions):
+            lines.extend(self._format_entry(pos, entry))
+        return lines
+
+    def cmd_playlistid(self, id=None):
+        if id is None:
+            return self.cmd_playlistinfo()
+
+        pos, entry = self._entry(self._integer(id))
+        return self._format_entry(pos, entry)
+
+    def cmd_plchanges(self, version, positions=None):
+        version = self._integer(version)
+        lines = []
+        for pos, entry in self._entries(positions):
+            if entry.version > version:
+                lines.extend(self._format_entry(pos, entry))
+        return lines
+
+    def cmd_addid(self, uri, position=None):
+        info = self.by_file.get(uri)
+        if info is None:
+            raise CommandError(ACK_ERROR_NO_EXIST, 'No such song')
+
+        pos = len(self.playlist) if position is None else \
+            self._integer(position)
+        if not 0 <= pos <= len(self.playlist):
+            raise CommandError(ACK_ERROR_ARG, 'Bad song index')
+
+        entry = PlaylistEntry(self.next_id, info, self.playlist_version)
+        self.next_id += 1
+        self.playlist.insert(pos, entry)
+        self._playlist_changed(pos)
+
+        return ['Id: {}'.format(entry.id)]
+
+    def cmd_add(self, uri):
+        self.cmd_addid(uri)
+
+    def cmd_delete(self, positions):
+        entries = list(self._entries(positions))
+        if not entries:
+            return
+
+        start = entries[0][0]
+        del self.playlist[start:entries[-1][0] + 1]
+        if self.current in (entry for _, entry in entries):
+            self._play(None)
+        self._playlist_changed(start)
+
+    def cmd_deleteid(self, id):
+        pos, _ = self._entry(self._integer(id))
+        self.cmd_delete(str(pos))
+
+    def cmd_move(self, source, destination):
+        source = self._position(source)
+        destination = self._position(destination)
+
+        entry = self.playlist.pop(source)
+        self.playlist.insert(destination, entry)
+        self._playlist_changed(min(source, destination))
+
+    def cmd_clear(self):
+        self.playlist = []
+        self._play(None)
+        self._playlist_changed()
+
+    ######################################################################
+    # Playback commands
+    ######################################################################
+
+    def cmd_status(self):
+        lines = [
+            'volume: 100',
+            'repeat: 0',
+            'random: 0',
+            'single: 0',
+            'consume: 0',
+            'playlist: {}'.format(self.playlist_version),
+            'playlistlength: {}'.format(len(self.playlist)),
+            'state: {}'.format(self.state),
+        ]
+
+        if self.current is not None:
+            pos, entry = self._entry(self.current.id)
+            lines.extend([
+                'song: {}'.format(pos),
+                'songid: {}'.format(entry.id),
+                'time: 0:{}'.format(entry.info.get('time', 0)),
+                'elapsed: 0.000',
+            ])
+
+        if self.updating is not None:
+            lines.append('updating_db: {}'.format(self.updating))
+
+        return lines
+
+    def cmd_currentsong(self):
+        if self.current is None:
+            return []
+
+        pos, entry = self._entry(self.current.id)
+        return self._format_entry(pos, entry)
+
+    def cmd_play(self, position=None):
+        if position is None and self.current is None:
+            position = '0'
+
+        if position is not None:
+            self._play(self.playlist[self._position(position)])
+        else:
+            self._play(self.current)
+
+    def cmd_playid(self, id):
+        _, entry = self._entry(self._integer(id))
+        self._play(entry)
+
+    def cmd_stop(self):
+        self.state = 'stop'
+        self.notify('player')
+
+    def cmd_pause(self, pause='1'):
+        if self.current is not None:
+            self.state = 'pause' if pause == '1' else 'play'
+            self.notify('player')
+
+    def _skip(self, offset):
+        if self.current is None:
+            return
+
+        pos, _ = self._entry(self.current.id)
+        pos += offset
+        self._play(self.playlist[pos]
+                   if 0 <= pos < len(self.playlist) else None)
+
+    def cmd_next(self):
+        self._skip(1)
+
+    def cmd_previous(self):
+        self._skip(-1)
+
+    def cmd_seekcur(self, time):
+        self.notify('player')
+
+    def cmd_ping(self):
+        pass
+
+    def cmd_password(self, password):
+        pass
+
+    def cmd_commands(self):
+        return ['command: {}'.format(name[len('cmd_'):])
+                for name in sorted(dir(self)) if name.startswith('cmd_')]
@@ -0,0 +1,506 @@
+"""
+suggestive-bench: run benchmark scenarios against generated data and compare
+results.
+
+    suggestive-bench run --size medium --output after.json
+    suggestive-bench compare before.json after.json
+
+`suggestive-bench memory` measures the peak resident set size of loading
+libraries of different sizes, each in a fresh process
+"""
+
+from suggestive._version import __version__
+from suggestive.bench.datagen import Dataset
+from suggestive.bench.lastfmserver import LastfmServer
+from suggestive.bench.mpdserver import MpdServer
+from suggestive.bench.scenarios import SCENARIOS
+from suggestive.catalog import catalog
+from suggestive.config import Config
+from suggestive.db.session import Session, ReadSession, initialize
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import event
+from types import SimpleNamespace
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+RESULTS_VERSION = 1
+
+# Dataset parameters for each --size
+SIZES = {
+    'small': dict(artists=100, albums_per_artist=5, tracks_per_album=10,
+                  scrobbles=20000),
+    'medium': dict(artists=500, albums_per_artist=8, tracks_per_album=12,
+                   scrobbles=200000),
+    'large': dict(artists=2000, albums_per_artist=10, tracks_per_album=12,
+                  scrobbles=1000000),
+}
+
+# Library sizes, in tracks, measured by `suggestive-bench memory`
+RSS_TRACKS = [10000, 50000, 250000]
+RSS_ALBUMS_PER_ARTIST = 5
+RSS_TRACKS_PER_ALBUM = 10
+
+# Default fractional increase in wall time or peak memory that counts as a
+# regression
+DEFAULT_THRESHOLD = 0.1
+
+
+def listen_queries(callback):
+    """Call callback before each statement executed by either engine"""
+    for scoped in (Session, ReadSession):
+        event.listen(scoped.session_factory.kw['bind'],
+                     'before_cursor_execute', callback)
+
+
+class Environment(object):
+
+    """
+    Generated data, a scratch directory with a suggestive configuration, and
+    stand-in MPD and LastFM servers for scenarios to run against
+    """
+
+    def __init__(self, dataset, mpd_latency=0.0, lastfm_latency=0.0):
+        self.dataset = dataset
+        self.path = tempfile.mkdtemp(prefix='suggestive-bench-')
+        self.queries = 0
+
+        self.mpd = MpdServer(dataset.mpd_catalog(), latency=mpd_latency)
+        self.lastfm = LastfmServer(dataset, latency=lastfm_latency)
+        self.loop = asyncio.new_event_loop()
+
+        host, port = self.mpd.start_thread()
+        self.conf = self._config(host, port, self.lastfm.start())
+
+        with open(self.conf.general.session_file, 'w') as handle:
+            handle.write('bench')
+
+        # Database files by (track fraction, scrobbles)
+        self._templates = {}
+
+    def _config(self, mpd_host, mpd_port, lastfm_url):
+        path = self.path
+        return Config(configuration=dict(
+            general=dict(
+                conf_dir=path,
+                database=os.path.join(path, 'music.db'),
+                log=os.path.join(path, 'log.txt'),
+                session_file=os.path.join(path, 'session'),
+                library_snapshot=os.path.join(path, 'library.json'),
+                catalog_snapshot=os.path.join(path, 'catalog.bin'),
+            ),
+            mpd=dict(host=mpd_host, port=mpd_port),
+            lastfm=dict(user='bench', api_key='bench', api_secret='bench',
+                        url=lastfm_url, scrobble_days=10000),
+            appearance={},
+            playlist={},
+            library={},
+            scrobbles={},
+        ))
+
+    def close(self):
+        self._dispose()
+        self.mpd.stop_thread()
+        self.lastfm.stop()
+        self.loop.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    @staticmethod
+    def _dispose():
+        """Close every database connection"""
+        for scoped in (Session, ReadSession):
+            scoped.remove()
+            bind = scoped.session_factory.kw.get('bind')
+            if bind is not None:
+                bind.dispose()
+
+    def reset_database(self, track_fraction, scrobbles):
+        """
+        Replace the database with the generated library, and start counting
+        the queries made against it
+        """
+        key = (track_fraction, scrobbles)
+        database = self.conf.general.database
+
+        self._dispose()
+        if key not in self._templates:
+            self.dataset.write_database(self.conf, track_fraction, scrobbles)
+            self._dispose()
+
+            template = os.path.join(
+                self.path, 'template-{}-{}.db'.format(*key))
+            shutil.copyfile(database, template)
+            self._templates[key] = template
+        else:
+            shutil.copyfile(self._templates[key], database)
+
+        initialize(self.conf)
+        listen_queries(self._count_query)
+
+        self.queries = 0
+
+    def _count_query(self, *args):
+        self.queries += 1
+
+
+def run_once(env, name, measure_memory=False):
+    """
+    Run a scenario, and return its (wall time, queries, peak memory).  Peak
+    memory is only measured if requested, since tracing allocations slows
+    everything down
+    """
+    _, factory = SCENARIOS[name]
+    scenario = factory(env)
+
+    env.reset_database(scenario.track_fraction, scenario.scrobbles)
+    if scenario.catalog_loaded:
+        catalog.ensure_loaded(env.conf)
+    scenario.setup()
+    try:
+        gc.collect()
+        queries = env.queries
+
+        if measure_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        scenario.run()
+        elapsed = time.perf_counter() - start
+
+        peak = None
+        if measure_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return elapsed, env.queries - queries, peak
+    finally:
+        scenario.teardown()
+
+
+def run_scenario(env, name, repeat):
+    """Return the results of running a scenario repeat times"""
+    times = []
+    queries = None
+    for _ in range(repeat):
+        elapsed, queries, _ = run_once(env, name)
+        times.append(elapsed)
+
+    _, _, peak = run_once(env, name, measure_memory=True)
+
+    return {
+        'wall_time': statistics.median(times),
+        'wall_times': times,
+        'queries': queries,
+        'peak_memory': peak,
+    }
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process in bytes, or None if it
+    is unknown on this platform
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _run_in_process(configuration, name):
+    """
+    Run a scenario once against the current database, in a process that has
+    done nothing else, and return its results including peak RSS
+    """
+    conf = Config(configuration=configuration)
+    initialize(conf)
+
+    queries = []
+    listen_queries(lambda *args: queries.append(None))
+
+    env = SimpleNamespace(conf=conf, loop=asyncio.new_event_loop())
+    _, factory = SCENARIOS[name]
+    scenario = factory(env)
+
+    if scenario.catalog_loaded:
+        catalog.ensure_loaded(conf)
+    scenario.setup()
+    try:
+        baseline = peak_rss()
+        start = time.perf_counter()
+        scenario.run()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'wall_time': elapsed,
+            'wall_times': [elapsed],
+            'queries': len(queries),
+            'peak_memory': None,
+            'peak_rss': peak_rss(),
+            'baseline_rss': baseline,
+        }
+    finally:
+        scenario.teardown()
+        env.loop.close()
+
+
+def run_in_process(env, name):
+    """
+    Run a scenario in a fresh process, so that its peak RSS is not inflated
+    by anything run before it.  The database must already be set up
+    """
+    env._dispose()
+
+    # Children of a fork server start with their own peak RSS; spawned
+    # processes inherit this one's across exec on Linux
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        'forkserver' if 'forkserver' in methods else 'spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(
+            _run_in_process, env.conf.to_dict(), name).result()
+
+
+def write_results(args, data):
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(data, handle, indent=2, sort_keys=True)
+    else:
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+def run(args):
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit('Unknown scenarios: {}'.format(', '.join(unknown)))
+
+    parameters = dict(SIZES[args.size], seed=args.seed)
+    for name in ('artists', 'albums_per_artist', 'tracks_per_album',
+                 'scrobbles'):
+        if getattr(args, name) is not None:
+            parameters[name] = getattr(args, name)
+
+    print('Generating data: {}'.format(parameters), file=sys.stderr)
+    dataset = Dataset(**parameters)
+
+    env = Environment(dataset, args.mpd_latency, args.lastfm_latency)
+    results = {}
+    try:
+        for name in names:
+            print('Running {}...'.format(name), file=sys.stderr)
+            results[name] = result = run_scenario(env, name, args.repeat)
+            print('  {}'.format(format_result(result)), file=sys.stderr)
+    finally:
+        env.close()
+
+    data = {
+        'version': RESULTS_VERSION,
+        'suggestive': __version__,
+        'python': platform.python_version(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'dataset': parameters,
+        'mpd_latency': args.mpd_latency,
+        'lastfm_latency': args.lastfm_latency,
+        'results': results,
+    }
+
+    write_results(args, data)
+
+
+def memory(args):
+    if args.scenario not in SCENARIOS:
+        sys.exit('Unknown scenario: {}'.format(args.scenario))
+
+    results = {}
+    for tracks in args.tracks:
+        per_artist = RSS_ALBUMS_PER_ARTIST * RSS_TRACKS_PER_ALBUM
+        parameters = dict(
+            artists=max(1, tracks // per_artist),
+            albums_per_artist=RSS_ALBUMS_PER_ARTIST,
+            tracks_per_album=RSS_TRACKS_PER_ALBUM,
+            scrobbles=tracks,
+            seed=args.seed,
+        )
+        print('Generating {} tracks...'.format(tracks), file=sys.stderr)
+        env = Environment(Dataset(**parameters))
+        try:
+            env.reset_database(1.0, True)
+
+            print('Running {}...'.format(args.scenario), file=sys.stderr)
+            name = '{}_{}'.format(args.scenario, tracks)
+            results[name] = result = run_in_process(env, args.scenario)
+            print('  {}'.format(format_result(result)), file=sys.stderr)
+        finally:
+            env.close()
+
+    write_results(args, {
+        'version': RESULTS_VERSION,
+        'suggestive': __version__,
+        'python': platform.python_version(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'dataset': dict(tracks=args.tracks, seed=args.seed),
+        'mpd_latency': 0.0,
+        'lastfm_latency': 0.0,
+        'results': results,
+    })
+
+
+######################################################################
+# Comparison
+######################################################################
+
+def format_result(result):
+    text = '{:.4f}s, {} queries, {:.1f} MiB peak'.format(
+        result['wall_time'], result['queries'],
+        (result['peak_memory'] or 0) / 2 ** 20)
+
+    if result.get('peak_rss'):
+        text += ', {:.1f} MiB peak RSS'.format(result['peak_rss'] / 2 ** 20)
+
+    return text
+
+
+def regressions(before, after, threshold=DEFAULT_THRESHOLD):
+    """
+    Return a list of (scenario, metric, before, after) for each metric that got
+    worse between two sets of results.  Wall time, peak memory and peak RSS
+    regress if they grow by more than threshold; any increase in queries is a
+    regression
+    """
+    found = []
+    for name, new in sorted(after.items()):
+        old = before.get(name)
+        if old is None:
+            continue
+
+        for metric in ('wall_time', 'peak_memory', 'peak_rss'):
+            if old.get(metric) and new.get(metric) and \
+                    new[metric] > old[metric] * (1 + threshold):
+                found.append((name, metric, old[metric], new[metric]))
+
+        if new['queries'] > old['queries']:
+            found.append((name, 'queries', old['queries'], new['queries']))
+
+    return found
+
+
+def compare(args):
+    results = []
+    for path in (args.before, args.after):
+        with open(path) as handle:
+            data = json.load(handle)
+
+        if data.get('version') != RESULTS_VERSION:
+            sys.exit('{}: unsupported results version'.format(path))
+        results.append(data)
+
+    before, after = results
+    if before['dataset'] != after['dataset']:
+        print('Warning: results are for different datasets', file=sys.stderr)
+
+    for name in sorted(set(before['results']) & set(after['results'])):
+        old, new = before['results'][name], after['results'][name]
+        print('{:<24} {:>10.4f}s -> {:>10.4f}s ({:+.1%})  {:>7} -> {:<7} '
+              'queries'.format(
+                  name, old['wall_time'], new['wall_time'],
+                  new['wall_time'] / old['wall_time'] - 1,
+                  old['queries'], new['queries']))
+
+    found = regressions(before['results'], after['results'], args.threshold)
+    for name, metric, old, new in found:
+        print('REGRESSION: {} {}: {} -> {}'.format(name, metric, old, new))
+
+    sys.exit(1 if found else 0)
+
+
+def list_scenarios(args):
+    for name, (description, _) in SCENARIOS.items():
+        print('{:<24} {}'.format(name, description))
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            '{} is not a positive integer'.format(value))
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suggestive benchmarks')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Log progress to stderr')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='Run benchmark scenarios')
+    run_parser.add_argument('scenarios', nargs='*',
+                            help='Scenarios to run (default: all)')
+    run_parser.add_argument('--size', choices=sorted(SIZES), default='small',
+                            help='Dataset size')
+    run_parser.add_argument('--artists', type=int)
+    run_parser.add_argument('--albums-per-artist', type=int)
+    run_parser.add_argument('--tracks-per-album', type=int)
+    run_parser.add_argument('--scrobbles', type=int)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', '-r', type=positive_int, default=3,
+                            help='Timed runs per scenario')
+    run_parser.add_argument('--mpd-latency', type=float, default=0.0,
+                            help='Seconds added to each MPD response')
+    run_parser.add_argument('--lastfm-latency', type=float, default=0.0,
+                            help='Seconds added to each LastFM page')
+    run_parser.add_argument('--output', '-o', help='Results file')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser(
+        'compare', help='Compare two results files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument(
+        '--threshold', '-t', type=float, default=DEFAULT_THRESHOLD,
+        help='Fractional increase in time or memory that is a regression')
+    compare_parser.set_defaults(func=compare)
+
+    memory_parser = commands.add_parser(
+        'memory', help='Measure peak RSS at different library sizes')
+    memory_parser.add_argument(
+        '--tracks', type=int, nargs='+', default=RSS_TRACKS,
+        help='Library sizes, in tracks (default: {})'.format(
+            ' '.join(str(tracks) for tracks in RSS_TRACKS)))
+    memory_parser.add_argument('--scenario', default='library_load',
+                               help='Scenario to measure')
+    memory_parser.add_argument('--seed', type=int, default=0)
+    memory_parser.add_argument('--output', '-o', help='Results file')
+    memory_parser.set_defaults(func=memory)
+
+    list_parser = commands.add_parser('list', help='List scenarios')
+    list_parser.set_defaults(func=list_scenarios)
+
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s (%(name)s)| %(message)s')
+
+    args.func(args)
@@ -0,0 +1,291 @@
+"""
+Benchmark scenarios.  Each scenario times one of suggestive's expensive
+operations against the generated data of a bench Environment
+"""
+
+from suggestive.catalog import catalog, increment_generation
+from suggestive.db.session import session_scope
+from suggestive.mvc.base import Controller
+from suggestive.mvc import library, playlist
+from suggestive.search import LazySearcher
+import suggestive.analytics as analytics
+import suggestive.mstat as mstat
+import suggestive.threads as threads
+
+import logging
+import threading
+from collections import OrderedDict
+from functools import partial
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Orderers by the library command that adds them
+ORDERERS = OrderedDict([
+    ('loved', analytics.FractionLovedOrder),
+    ('playcount', analytics.PlaycountOrder),
+    ('modified', analytics.ModifiedOrder),
+    ('sort', analytics.SortOrder),
+    ('artist', partial(analytics.ArtistFilter, 'a')),
+    ('album', partial(analytics.AlbumFilter, 'a')),
+])
+
+PLAYLIST_SIZE = 5000
+
+
+class Scenario(object):
+
+    """
+    A benchmark scenario.  Before each run, the database is reset to the
+    generated library with the given fraction of its tracks, and with or
+    without scrobbles, and the catalog is loaded from it as it is when the
+    application starts.  Only run is timed
+    """
+
+    track_fraction = 1.0
+    scrobbles = True
+    catalog_loaded = True
+
+    def __init__(self, env):
+        self.env = env
+
+    @property
+    def conf(self):
+        return self.env.conf
+
+    def setup(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+    def teardown(self):
+        pass
+
+
+######################################################################
+# Database updates
+######################################################################
+
+class MpdSyncScenario(Scenario):
+
+    """Load the whole MPD library into an empty database"""
+
+    track_fraction = 0.0
+    scrobbles = False
+
+    def run(self):
+        mstat.update_mpd(self.conf)
+
+
+class IncrementalMpdSyncScenario(MpdSyncScenario):
+
+    """Load the 5% of the MPD library that is missing from the database"""
+
+    track_fraction = 0.95
+
+
+class ScrobbleInitScenario(Scenario):
+
+    """Load the whole scrobble history from LastFM"""
+
+    scrobbles = False
+
+    def setup(self):
+        self.quit_event = threading.Event()
+        self.writer = threads.DatabaseWriter(self.quit_event, timeout=0.05)
+        self.writer.start()
+
+    def run(self):
+        threads.ScrobbleInitializeThread(
+            self.conf, lambda: None, self.quit_event).run()
+
+    def teardown(self):
+        self.quit_event.set()
+        self.writer.join()
+
+
+class LovedSyncScenario(Scenario):
+
+    """Update loved tracks from LastFM"""
+
+    def setup(self):
+        self.lastfm = mstat.initialize_lastfm(self.conf)
+
+    def run(self):
+        loader = mstat.TrackInfoLoader(self.lastfm, self.conf)
+        with session_scope(self.conf) as session:
+            loader.load(session)
+
+
+######################################################################
+# Library
+######################################################################
+
+class CatalogLoadScenario(Scenario):
+
+    """Load the catalog of artists, albums and tracks from the database"""
+
+    catalog_loaded = False
+
+    def run(self):
+        catalog.load(self.conf)
+
+
+class CatalogOpenScenario(Scenario):
+
+    """Open the catalog from its snapshot"""
+
+    catalog_loaded = False
+
+    def setup(self):
+        # Generated databases have no generation, so they have no snapshot
+        with session_scope(self.conf) as session:
+            increment_generation(session)
+
+        catalog.load(self.conf)
+        catalog.save()
+        catalog.clear()
+
+    def run(self):
+        if not catalog.open(self.conf):
+            raise RuntimeError('Unable to open the catalog snapshot')
+
+
+def default_orderers(conf):
+    """Return the orderers that the library starts with"""
+    orderers = [analytics.BaseOrder()]
+    for command in conf.library.default_order:
+        name = command.split()[0]
+        if name in ORDERERS:
+            orderers.append(ORDERERS[name]())
+        else:
+            logger.warning('Default order %s is not benchmarked', command)
+
+    return orderers
+
+
+class OrderScenario(Scenario):
+
+    """Order the library with the default orderer chain"""
+
+    def __init__(self, env, orderer=None):
+        super(OrderScenario, self).__init__(env)
+        self.orderer = orderer
+
+    def setup(self):
+        if self.orderer is None:
+            self.orderers = default_orderers(self.conf)
+        else:
+            self.orderers = [analytics.BaseOrder(), self.orderer()]
+
+        self.analytics = analytics.Analytics(self.conf)
+
+    def run(self):
+        self.analytics.order_albums(self.orderers)
+
+
+class LibraryViewScenario(Scenario):
+
+    """Build the library view from the default order"""
+
+    def setup(self):
+        suggestions = analytics.Analytics(self.conf).order_albums(
+            default_orderers(self.conf))
+
+        self.model = library.LibraryModel([
+            library.AlbumModel(suggestion.album, suggestion.order)
+            for suggestion in suggestions
+        ])
+        self.controller = library.LibraryController(
+            self.model, self.conf, self.env.loop)
+
+    def run(self):
+        self.view = library.LibraryView(
+            self.model, self.controller, self.conf)
+
+    def teardown(self):
+        Controller._registry.clear()
+
+
+class LibraryLoadScenario(LibraryViewScenario):
+
+    """Order the library, then build its model, controller and view"""
+
+    def setup(self):
+        pass
+
+    def run(self):
+        super(LibraryLoadScenario, self).setup()
+        super(LibraryLoadScenario, self).run()
+
+
+class SearchScenario(LibraryViewScenario):
+
+    """Search the whole library view for a pattern that matches nothing"""
+
+    def setup(self):
+        super(SearchScenario, self).setup()
+        super(SearchScenario, self).run()
+
+    def run(self):
+        searcher = LazySearcher('no such album')
+        self.view.search(searcher)
+        assert searcher.next_item(self.view.body, 0) is None
+
+
+######################################################################
+# Playlist
+######################################################################
+
+class PlaylistUpdateScenario(Scenario):
+
+    """Update the playlist model after 5000 tracks are added to the playlist"""
+
+    def setup(self):
+        self.controller = playlist.PlaylistController(
+            playlist.PlaylistModel(), self.conf, self.env.loop)
+
+        self.env.mpd.call(self.fill_playlist)
+
+    def fill_playlist(self):
+        for track in self.env.dataset.tracks[:PLAYLIST_SIZE]:
+            self.env.mpd.cmd_addid(track.filename)
+
+    def run(self):
+        self.controller.update_model()
+
+    def teardown(self):
+        self.env.mpd.call(self.env.mpd.cmd_clear)
+        Controller._registry.clear()
+
+
+def scenario(cls, description=None, **kwArgs):
+    """Return a (description, factory) pair for a scenario"""
+    return description or cls.__doc__, partial(cls, **kwArgs)
+
+
+# Scenario (description, factory) pairs by name
+SCENARIOS = OrderedDict([
+    ('mpd_sync', scenario(MpdSyncScenario)),
+    ('mpd_sync_incremental', scenario(IncrementalMpdSyncScenario)),
+    ('scrobble_init', scenario(ScrobbleInitScenario)),
+    ('loved_sync', scenario(LovedSyncScenario)),
+    ('catalog_load', scenario(CatalogLoadScenario)),
+    ('catalog_open', scenario(CatalogOpenScenario)),
+    ('order_albums', scenario(OrderScenario)),
+])
+SCENARIOS.update(
+    ('order_{}'.format(name), scenario(
+        OrderScenario,
+        'Order the library with the {} orderer'.format(name),
+        orderer=orderer))
+    for name, orderer in ORDERERS.items()
+)
+SCENARIOS.update([
+    ('library_view', scenario(LibraryViewScenario)),
+    ('library_load', scenario(LibraryLoadScenario)),
+    ('playlist_update', scenario(PlaylistUpdateScenario)),
+    ('search', scenario(SearchScenario)),
+])
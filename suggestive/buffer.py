@@ -129,7 +129,8 @@ class Buffer(urwid.Frame, Commandable):
     signals = [
         signals.SET_FOOTER,
         signals.SET_FOCUS,
-        signals.SET_STATUS
+        signals.SET_STATUS,
+        signals.REDRAW,
     ]
 
     def __init__(self, *args, **kwArgs):
@@ -154,6 +155,13 @@ class Buffer(urwid.Frame, Commandable):
     def update_footer(self, footer, focus=False):
         urwid.emit_signal(self, signals.SET_FOOTER, footer, focus)
 
+    def redraw(self):
+        """
+        Request a redraw for changes made outside of input handlers, e.g. in
+        callbacks of executor futures
+        """
+        urwid.emit_signal(self, signals.REDRAW)
+
     def setup_bindings(self):
         return {}
 
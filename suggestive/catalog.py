@@ -0,0 +1,609 @@
+"""
+Process-wide in-memory catalog of artists, albums and tracks.  The catalog is
+loaded from the database once, then kept up to date by the loaders and the
+love and ignore writers, so that buffers and orderers can look up albums and
+tracks without running any SQL.
+
+Each table is stored column by column, in arrays where possible, with a dict
+of id to row number.  Writers tell the catalog what they changed through
+their session; the changes are applied once the session commits, and
+discarded if it rolls back.
+
+Every session that changes the catalog also increments the generation of the
+database, which is stored as SQLite's user_version.  The catalog is saved to a
+snapshot (see suggestive.catalog_snapshot) after each database update, and
+opened from it at startup if the database is still at the same generation
+"""
+
+import logging
+import random
+import threading
+from array import array
+from collections import defaultdict
+from sqlalchemy import event, func, select, text
+from sqlalchemy.orm import Session as OrmSession
+
+import suggestive.catalog_snapshot as catalog_snapshot
+import suggestive.stats as stats
+from suggestive.db.model import (
+    Album, Artist, Track, Scrobble, LastfmTrackInfo)
+from suggestive.db.session import ReadSession, session_scope
+from suggestive.records import AlbumRecord, TrackRecord
+from suggestive.util import partition
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Maximum number of values bound to a single IN (...) clause
+SQL_CHUNK_SIZE = 500
+
+# Compact a table once this fraction of its rows have been deleted
+COMPACT_FRACTION = 0.5
+
+# Session.info key of the catalog changes waiting for the session to commit
+PENDING = 'catalog_changes'
+
+# SQLite's user_version is a signed 32-bit integer
+MAX_GENERATION = 2 ** 31 - 1
+
+# Snapshot arrays of each table column
+ALBUM_COLUMNS = (
+    ('names', 'album_names'),
+    ('artist_ids', 'album_artist_ids'),
+    ('ignored', 'album_ignored'),
+)
+TRACK_COLUMNS = (
+    ('names', 'track_names'),
+    ('filenames', 'track_filenames'),
+    ('album_ids', 'track_album_ids'),
+    ('artist_ids', 'track_artist_ids'),
+    ('loved', 'track_loved'),
+    ('plays', 'track_plays'),
+)
+
+
+class Table(object):
+
+    """
+    Rows stored column by column.  Columns with an array typecode are arrays,
+    in which missing ids are stored as 0; the others are lists.  Deleted rows
+    are left in place until there are enough of them to compact the table
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')
+        self.rows = {}
+        self.deleted = 0
+        for name, typecode in self.columns:
+            setattr(self, name, [] if typecode is None else array(typecode))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, id):
+        return id in self.rows
+
+    def assign(self, ids, **columns):
+        """Replace the rows with the given ids and columns"""
+        self.ids = ids
+        self.rows = dict(zip(ids, range(len(ids))))
+        self.deleted = 0
+        for name, _ in self.columns:
+            setattr(self, name, columns[name])
+
+    def set(self, id, *values):
+        """Insert or replace the row with the given id, and return its row"""
+        row = self.rows.get(id)
+        if row is None:
+            row = self.rows[id] = len(self.ids)
+            self.ids.append(id)
+            for (name, _), value in zip(self.columns, values):
+                getattr(self, name).append(value)
+        else:
+            for (name, _), value in zip(self.columns, values):
+                getattr(self, name)[row] = value
+
+        return row
+
+    def delete(self, id):
+        """Delete the row with the given id, if there is one"""
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+
+        self.ids[row] = 0
+        for name, typecode in self.columns:
+            getattr(self, name)[row] = None if typecode is None else 0
+
+        self.deleted += 1
+        if self.deleted > len(self.ids) * COMPACT_FRACTION:
+            self.compact()
+
+    def compact(self):
+        """Remove the gaps left by deleted rows"""
+        live = sorted(self.rows.values())
+        columns = [(name, typecode, getattr(self, name))
+                   for name, typecode in self.columns]
+
+        self.ids = array('q', (self.ids[row] for row in live))
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+        self.deleted = 0
+        for name, typecode, column in columns:
+            values = (column[row] for row in live)
+            setattr(self, name,
+                    list(values) if typecode is None
+                    else array(typecode, values))
+
+
+def nullable(id):
+    return id or None
+
+
+def database_generation(session):
+    return session.execute(text('PRAGMA user_version')).scalar()
+
+
+def increment_generation(session):
+    """
+    Increment the generation of the database, and return the new one.  The
+    first generation of a database is random, so that the snapshot of a
+    database that has been replaced does not match its replacement
+    """
+    generation = database_generation(session)
+    if generation:
+        generation = generation % MAX_GENERATION + 1
+    else:
+        generation = random.randint(1, MAX_GENERATION)
+
+    session.execute(text('PRAGMA user_version = {:d}'.format(generation)))
+    return generation
+
+
+def plays_column():
+    """Correlated subquery of the number of scrobbles of a track"""
+    return select(func.count(Scrobble.id)).\
+        where(Scrobble.track_id == Track.id).\
+        scalar_subquery()
+
+
+class Catalog(object):
+
+    """
+    Artists, albums and tracks, with the loved and ignored flags and the
+    number of scrobbles of each track.  Reads and writes are serialized by a
+    lock, which is held for the whole of a load
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+        # Configuration, read engine and generation of the loaded database
+        self.conf = None
+        self.engine = None
+        self.generation = 0
+
+        # Artist names by id; artists are few, and never deleted
+        self.artists = {}
+        self.albums = Table(('names', None),
+                            ('artist_ids', 'q'),
+                            ('ignored', 'b'))
+        self.tracks = Table(('names', None),
+                            ('filenames', None),
+                            ('album_ids', 'q'),
+                            ('artist_ids', 'q'),
+                            ('loved', 'b'),
+                            ('plays', 'q'))
+
+        # Track ids by filename and by album id.  After the catalog is opened
+        # from a snapshot, the filenames are only indexed when first needed
+        self._filenames = {}
+        self.album_track_ids = defaultdict(set)
+
+    @property
+    def loaded(self):
+        return self.engine is not None
+
+    @property
+    def filenames(self):
+        with self.lock:
+            if self._filenames is None:
+                tracks = self.tracks
+                self._filenames = {tracks.filenames[row]: track_id
+                                   for track_id, row in tracks.rows.items()}
+
+            return self._filenames
+
+    def clear(self):
+        with self.lock:
+            self.engine = None
+            self.generation = 0
+            self.artists = {}
+            self.albums.clear()
+            self.tracks.clear()
+            self._filenames = {}
+            self.album_track_ids = defaultdict(set)
+
+    def invalidate(self):
+        """Forget the catalog, so that it is loaded again when next used"""
+        logger.debug('Invalidating catalog')
+        self.clear()
+
+    def ensure_loaded(self, conf):
+        """
+        Load the catalog if it has not been loaded yet, or if the database has
+        been initialized again since.  The catalog is opened from its
+        snapshot if that is up to date, and otherwise loaded from the
+        database and saved
+        """
+        engine = ReadSession.get_bind()
+        if self.engine is engine:
+            return
+
+        with self.lock:
+            if self.engine is not engine and not self.open(conf):
+                self.load(conf)
+                self.save()
+
+    @stats.timed
+    def load(self, conf):
+        """Load the whole catalog from the database"""
+        with self.lock:
+            self.clear()
+            with session_scope(conf, read_only=True) as session:
+                # Read first, so that a change committed during the load makes
+                # the generation out of date rather than the catalog
+                generation = database_generation(session)
+
+                self.artists = dict(session.query(Artist.id, Artist.name))
+                self._read_albums(session.query(
+                    Album.id, Album.name, Album.artist_id, Album.ignored))
+                self._read_tracks(self._track_query(session))
+                engine = session.get_bind()
+
+            self.conf = conf
+            self.engine = engine
+            self.generation = generation
+
+        logger.info('Loaded catalog of %d artists, %d albums and %d tracks',
+                    len(self.artists), len(self.albums), len(self.tracks))
+
+    @stats.timed
+    def open(self, conf):
+        """
+        Open the catalog from its snapshot.  Return False, leaving the catalog
+        empty, if there is no snapshot of the current database generation
+        """
+        with self.lock:
+            self.clear()
+            with session_scope(conf, read_only=True) as session:
+                generation = database_generation(session)
+                engine = session.get_bind()
+
+            # A new database has no generation, so it has no snapshot
+            columns = None
+            if generation:
+                columns = catalog_snapshot.read(
+                    conf.general.catalog_snapshot, generation)
+            if columns is None:
+                return False
+
+            self.artists = dict(zip(columns['artist_ids'],
+                                    columns['artist_names']))
+            self.albums.assign(columns['album_ids'], **{
+                column: columns[name] for column, name in ALBUM_COLUMNS})
+            self.tracks.assign(columns['track_ids'], **{
+                column: columns[name] for column, name in TRACK_COLUMNS})
+
+            self._filenames = None
+            for track_id, album_id in zip(self.tracks.ids,
+                                          self.tracks.album_ids):
+                self.album_track_ids[nullable(album_id)].add(track_id)
+
+            self.conf = conf
+            self.engine = engine
+            self.generation = generation
+
+        logger.info('Opened catalog of %d artists, %d albums and %d tracks '
+                    'from its snapshot', len(self.artists), len(self.albums),
+                    len(self.tracks))
+        return True
+
+    def save(self):
+        """
+        Save the catalog to its snapshot, unless it has not been loaded or the
+        database has no generation.  Return whether it was saved
+        """
+        with self.lock:
+            if not (self.loaded and self.generation):
+                return False
+
+            path = self.conf.general.catalog_snapshot
+            generation = self.generation
+
+            # Copy the columns, so that they can be written without the lock
+            columns = {
+                'artist_ids': list(self.artists),
+                'artist_names': list(self.artists.values()),
+            }
+            for table, table_columns, ids in (
+                    (self.albums, ALBUM_COLUMNS, 'album_ids'),
+                    (self.tracks, TRACK_COLUMNS, 'track_ids')):
+                if table.deleted:
+                    table.compact()
+
+                columns[ids] = table.ids[:]
+                for column, name in table_columns:
+                    values = getattr(table, column)
+                    columns[name] = (values[:] if isinstance(values, array)
+                                     else list(values))
+
+        return catalog_snapshot.write(path, generation, columns)
+
+    ######################################################################
+    # Reads
+    ######################################################################
+
+    def _album_record(self, row):
+        albums = self.albums
+        artist_id = nullable(albums.artist_ids[row])
+        return AlbumRecord(albums.ids[row], albums.names[row], artist_id,
+                           self.artists.get(artist_id),
+                           bool(albums.ignored[row]))
+
+    def _track_record(self, row):
+        tracks, albums = self.tracks, self.albums
+        album_id = nullable(tracks.album_ids[row])
+        artist_id = nullable(tracks.artist_ids[row])
+        album_row = albums.rows.get(album_id)
+
+        return TrackRecord(
+            tracks.ids[row], tracks.names[row], tracks.filenames[row],
+            album_id,
+            albums.names[album_row] if album_row is not None else None,
+            artist_id, self.artists.get(artist_id), bool(tracks.loved[row]))
+
+    def album_records(self):
+        """Return an AlbumRecord for each album"""
+        with self.lock:
+            return [self._album_record(row)
+                    for row in self.albums.rows.values()]
+
+    def album(self, album_id):
+        """Return the AlbumRecord with the given id, or None"""
+        with self.lock:
+            row = self.albums.rows.get(album_id)
+            return None if row is None else self._album_record(row)
+
+    def tracks_by_id(self, track_ids):
+        """Return a dict of id to TrackRecord for the given track ids"""
+        with self.lock:
+            rows = self.tracks.rows
+            return {track_id: self._track_record(rows[track_id])
+                    for track_id in track_ids if track_id in rows}
+
+    def tracks_by_filename(self, filenames):
+        """Return a dict of filename to TrackRecord for the given files"""
+        with self.lock:
+            rows, ids = self.tracks.rows, self.filenames
+            return {filename: self._track_record(rows[ids[filename]])
+                    for filename in filenames if filename in ids}
+
+    def album_tracks(self, album_id):
+        """Return the TrackRecords of an album, in order of id"""
+        with self.lock:
+            rows = self.tracks.rows
+            track_ids = self.album_track_ids.get(album_id, ())
+            return [self._track_record(rows[track_id])
+                    for track_id in sorted(track_ids)]
+
+    def album_totals(self):
+        """
+        Return a dict of album id to its number of tracks, loved tracks and
+        scrobbles
+        """
+        totals = {}
+        with self.lock:
+            rows = self.tracks.rows
+            loved, plays = self.tracks.loved, self.tracks.plays
+            for album_id, track_ids in self.album_track_ids.items():
+                album_rows = [rows[track_id] for track_id in track_ids]
+                totals[album_id] = (len(album_rows),
+                                    sum(loved[row] for row in album_rows),
+                                    sum(plays[row] for row in album_rows))
+
+        return totals
+
+    ######################################################################
+    # Changes
+    ######################################################################
+
+    def _read_albums(self, rows):
+        """Store album rows, and return the ids of their artists"""
+        artist_ids = set()
+        for album_id, name, artist_id, ignored in rows:
+            self.albums.set(album_id, name, artist_id or 0, bool(ignored))
+            artist_ids.add(artist_id)
+
+        return artist_ids
+
+    @staticmethod
+    def _track_query(session):
+        return session.query(
+            Track.id, Track.name, Track.filename, Track.album_id,
+            Track.artist_id, LastfmTrackInfo.loved, plays_column()).\
+            outerjoin(LastfmTrackInfo, LastfmTrackInfo.track_id == Track.id)
+
+    def _read_tracks(self, rows):
+        """Store track rows, and return the ids of their albums and artists"""
+        tracks = self.tracks
+        album_ids, artist_ids = set(), set()
+        for track_id, name, filename, album_id, artist_id, loved, plays \
+                in rows:
+            row = tracks.rows.get(track_id)
+            if row is not None:
+                self._unindex_track(row)
+
+            tracks.set(track_id, name, filename, album_id or 0,
+                       artist_id or 0, bool(loved), plays)
+            self.filenames[filename] = track_id
+            self.album_track_ids[album_id].add(track_id)
+
+            album_ids.add(album_id)
+            artist_ids.add(artist_id)
+
+        return album_ids, artist_ids
+
+    def _unindex_track(self, row):
+        tracks = self.tracks
+        track_id = tracks.ids[row]
+        album_id = nullable(tracks.album_ids[row])
+
+        self.filenames.pop(tracks.filenames[row], None)
+        album_tracks = self.album_track_ids.get(album_id)
+        if album_tracks is not None:
+            album_tracks.discard(track_id)
+            if not album_tracks:
+                del self.album_track_ids[album_id]
+
+    def apply(self, generation, changes):
+        """
+        Apply the changes committed by a session, which brought the database
+        to the given generation.  Changes made before the catalog is loaded
+        are already in the database it will be loaded from
+        """
+        with self.lock:
+            if not self.loaded:
+                return
+
+            try:
+                for change, args in changes:
+                    change(*args)
+            except Exception as exc:
+                logger.error('Unable to update catalog; reloading it when '
+                             'next used', exc_info=exc)
+                self.invalidate()
+            else:
+                self.generation = generation
+
+    def _defer(self, session, func, *args):
+        """
+        Apply a change once the session commits.  The first change made by a
+        session increments the database generation
+        """
+        pending = session.info.setdefault(PENDING, {})
+        if self not in pending:
+            pending[self] = (increment_generation(session), [])
+
+        pending[self][1].append((func, args))
+
+    def _update_tracks(self, filenames):
+        with session_scope(self.conf, read_only=True) as session:
+            album_ids, artist_ids = set(), set()
+            for chunk in partition(filenames, SQL_CHUNK_SIZE):
+                albums, artists = self._read_tracks(
+                    self._track_query(session).filter(
+                        Track.filename.in_(chunk)))
+                album_ids.update(albums)
+                artist_ids.update(artists)
+
+            # Albums and artists that were inserted along with the tracks
+            album_ids.difference_update(self.albums.rows)
+            album_ids.discard(None)
+            for chunk in partition(album_ids, SQL_CHUNK_SIZE):
+                artist_ids.update(self._read_albums(session.query(
+                    Album.id, Album.name, Album.artist_id, Album.ignored).
+                    filter(Album.id.in_(chunk))))
+
+            artist_ids.difference_update(self.artists)
+            artist_ids.discard(None)
+            for chunk in partition(artist_ids, SQL_CHUNK_SIZE):
+                self.artists.update(session.query(Artist.id, Artist.name).
+                                    filter(Artist.id.in_(chunk)))
+
+    def _delete_tracks(self, filenames):
+        for filename in filenames:
+            track_id = self.filenames.get(filename)
+            if track_id is not None:
+                self._unindex_track(self.tracks.rows[track_id])
+                self.tracks.delete(track_id)
+
+    def _delete_albums(self, album_ids):
+        for album_id in album_ids:
+            self.albums.delete(album_id)
+
+    def _set_loved(self, track_ids, loved):
+        tracks = self.tracks
+        for track_id in track_ids:
+            row = tracks.rows.get(track_id)
+            if row is not None:
+                tracks.loved[row] = bool(loved)
+
+    def _set_ignored(self, album_id, ignored):
+        row = self.albums.rows.get(album_id)
+        if row is not None:
+            self.albums.ignored[row] = bool(ignored)
+
+    def _update_plays(self, track_ids):
+        tracks = self.tracks
+        with session_scope(self.conf, read_only=True) as session:
+            for chunk in partition(track_ids, SQL_CHUNK_SIZE):
+                counts = dict.fromkeys(chunk, 0)
+                counts.update(session.query(Scrobble.track_id,
+                                            func.count(Scrobble.id)).
+                              filter(Scrobble.track_id.in_(chunk)).
+                              group_by(Scrobble.track_id))
+
+                for track_id, plays in counts.items():
+                    row = tracks.rows.get(track_id)
+                    if row is not None:
+                        tracks.plays[row] = plays
+
+    def _clear_plays(self):
+        plays = self.tracks.plays
+        for row in range(len(plays)):
+            plays[row] = 0
+
+    def update_tracks(self, session, filenames):
+        """Read the given tracks again once the session commits"""
+        self._defer(session, self._update_tracks, list(filenames))
+
+    def delete_tracks(self, session, filenames):
+        self._defer(session, self._delete_tracks, list(filenames))
+
+    def delete_albums(self, session, album_ids):
+        self._defer(session, self._delete_albums, list(album_ids))
+
+    def set_loved(self, session, track_ids, loved=True):
+        self._defer(session, self._set_loved, list(track_ids), loved)
+
+    def set_ignored(self, session, album_id, ignored=True):
+        self._defer(session, self._set_ignored, album_id, ignored)
+
+    def update_plays(self, session, track_ids):
+        """Count the scrobbles of the given tracks once the session commits"""
+        self._defer(session, self._update_plays, sorted(set(track_ids)))
+
+    def clear_plays(self, session):
+        self._defer(session, self._clear_plays)
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def apply_changes(session):
+    for changed, (generation, changes) in \
+            session.info.pop(PENDING, {}).items():
+        changed.apply(generation, changes)
+
+
+@event.listens_for(OrmSession, 'after_transaction_end')
+def discard_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(PENDING, None)
+
+
+# Catalog shared by the whole application
+catalog = Catalog()
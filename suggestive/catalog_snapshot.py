@@ -0,0 +1,215 @@
+"""
+Binary snapshot of the catalog, so that it can be opened at startup instead of
+being read from the database.
+
+A snapshot is a header, followed by fixed-width arrays of ids, flags, play
+counts and string offsets, followed by a blob of UTF-8 strings.  It is opened
+with mmap: the arrays are copied out of the mapping, and strings are only
+decoded when they are read.  The header records the generation of the
+database that the snapshot was written from
+"""
+
+import logging
+import mmap
+import os
+import struct
+from array import array
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MAGIC = b'SGCATLOG'
+VERSION = 1
+
+# Written in native byte order, which is checked against this mark
+BYTE_ORDER_MARK = 0x01020304
+
+# Magic, version, byte order mark, database generation, number of artists,
+# albums and tracks, and size of the string blob
+HEADER = struct.Struct('=8sIIqqqqq')
+
+# Arrays and the blob start on multiples of this many bytes
+ALIGNMENT = 8
+
+# Errors used to encode strings that are not valid UTF-8, e.g. filenames
+ENCODING_ERRORS = 'surrogateescape'
+
+
+def layout(n_artists, n_albums, n_tracks):
+    """
+    Return the (name, typecode, length) of each array in a snapshot, in file
+    order.  Arrays of string offsets have one more entry than there are rows,
+    the end of the last string
+    """
+    return [
+        ('artist_ids', 'q', n_artists),
+        ('artist_names', 'q', n_artists + 1),
+        ('album_ids', 'q', n_albums),
+        ('album_artist_ids', 'q', n_albums),
+        ('album_ignored', 'b', n_albums),
+        ('album_names', 'q', n_albums + 1),
+        ('track_ids', 'q', n_tracks),
+        ('track_album_ids', 'q', n_tracks),
+        ('track_artist_ids', 'q', n_tracks),
+        ('track_loved', 'b', n_tracks),
+        ('track_plays', 'q', n_tracks),
+        ('track_names', 'q', n_tracks + 1),
+        ('track_filenames', 'q', n_tracks + 1),
+    ]
+
+
+# Arrays that hold string offsets
+STRING_COLUMNS = ('artist_names', 'album_names', 'track_names',
+                  'track_filenames')
+
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class Strings(object):
+
+    """
+    A column of strings in a snapshot, which are decoded each time they are
+    read.  Strings that are replaced or appended are kept in memory
+    """
+
+    __slots__ = ('blob', 'offsets', 'size', 'changed', 'appended')
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        self.size = len(offsets) - 1
+        self.changed = {}
+        self.appended = []
+
+    def __len__(self):
+        return self.size + len(self.appended)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def __getitem__(self, row):
+        if row >= self.size:
+            return self.appended[row - self.size]
+
+        try:
+            return self.changed[row]
+        except KeyError:
+            start, end = self.offsets[row], self.offsets[row + 1]
+            return str(self.blob[start:end], 'utf-8', ENCODING_ERRORS)
+
+    def __setitem__(self, row, value):
+        if row >= self.size:
+            self.appended[row - self.size] = value
+        else:
+            self.changed[row] = value
+
+    def append(self, value):
+        self.appended.append(value)
+
+
+def write(path, generation, columns):
+    """
+    Atomically write a snapshot of the given columns, a dict of each name in
+    `layout` to its values.  The values of string columns are the strings
+    themselves rather than offsets
+    """
+    counts = [len(columns[name])
+              for name in ('artist_ids', 'album_ids', 'track_ids')]
+
+    blob = bytearray()
+    arrays = []
+    for name, typecode, length in layout(*counts):
+        values = columns[name]
+        if name in STRING_COLUMNS:
+            offsets = array(typecode, [len(blob)])
+            for value in values:
+                blob += value.encode('utf-8', ENCODING_ERRORS)
+                offsets.append(len(blob))
+            values = offsets
+
+        arrays.append(array(typecode, values))
+
+    temp_path = '{}.tmp'.format(path)
+    try:
+        with open(temp_path, 'wb') as handle:
+            handle.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_MARK,
+                                     generation, *counts, len(blob)))
+            for values in arrays + [blob]:
+                handle.write(bytes(aligned(handle.tell()) - handle.tell()))
+                handle.write(values)
+
+        os.replace(temp_path, path)
+    except OSError as exc:
+        logger.error('Unable to save catalog snapshot to %s', path,
+                     exc_info=exc)
+        return False
+
+    logger.debug('Saved catalog snapshot of generation %d', generation)
+    return True
+
+
+def read(path, generation):
+    """
+    Return a dict of the arrays and Strings columns in the snapshot at path,
+    or None if there is no usable snapshot of the given database generation
+    """
+    try:
+        with open(path, 'rb') as handle:
+            mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning('Unable to open catalog snapshot %s', path,
+                       exc_info=exc)
+        return None
+
+    if len(mapping) < HEADER.size:
+        logger.warning('Invalid catalog snapshot %s', path)
+        return None
+
+    (magic, version, mark, snapshot_generation, n_artists, n_albums, n_tracks,
+     blob_size) = HEADER.unpack_from(mapping)
+
+    if (magic, version, mark) != (MAGIC, VERSION, BYTE_ORDER_MARK):
+        logger.info('Ignoring catalog snapshot with unknown version')
+        return None
+
+    if snapshot_generation != generation:
+        logger.info('Ignoring catalog snapshot of generation %d; the database '
+                    'is at generation %d', snapshot_generation, generation)
+        return None
+
+    view = memoryview(mapping)
+    offset = HEADER.size
+    columns = {}
+    try:
+        for name, typecode, length in layout(n_artists, n_albums, n_tracks):
+            offset = aligned(offset)
+            size = length * array(typecode).itemsize
+            if offset + size > len(mapping):
+                raise ValueError('{} is truncated'.format(name))
+
+            columns[name] = (typecode, view[offset:offset + size])
+            offset += size
+
+        offset = aligned(offset)
+        if offset + blob_size != len(mapping):
+            raise ValueError('string blob is truncated')
+    except ValueError as exc:
+        logger.warning('Invalid catalog snapshot %s: %s', path, exc)
+        return None
+
+    # Strings are left in the mapping, which stays open as long as they do
+    blob = view[offset:]
+    for name, (typecode, data) in columns.items():
+        if name in STRING_COLUMNS:
+            columns[name] = Strings(blob, data.cast(typecode))
+        else:
+            columns[name] = array(typecode)
+            columns[name].frombytes(data)
+
+    return columns
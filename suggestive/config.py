@@ -16,6 +16,10 @@ CONFIG_PATHS = [
 ]
 VALID_BUFFERS = frozenset(('library', 'playlist', 'scrobbles'))
 VALID_ORIENTATIONS = frozenset(('horizontal', 'vertical'))
+JOURNAL_MODES = frozenset(('delete', 'truncate', 'persist', 'memory', 'wal',
+                           'off'))
+SYNCHRONOUS_MODES = frozenset(('off', 'normal', 'full', 'extra'))
+TEMP_STORES = frozenset(('default', 'file', 'memory'))
 
 
 def interpolate(value, config):
@@ -87,8 +91,21 @@ class GeneralConfig(FiggisConfig):
     log = Field(expand, default='{conf_dir}/log.txt')
     verbose = Field(bool, default=False)
     log_sql_queries = Field(bool, default=False)
+    timing_stats = Field(bool, default=False)
+    similar_query_threshold = Field(int, non_negative, default=50)
     session_file = Field(expand, default='{conf_dir}/session')
+    library_snapshot = Field(expand, default='{conf_dir}/library.json')
+    catalog_snapshot = Field(expand, default='{conf_dir}/catalog.bin')
     update_on_startup = Field(bool, default=False)
+    database_update_delay = Field(float, non_negative, default=2.0)
+
+    # SQLite tuning
+    journal_mode = Field(str.lower, default='wal', choices=JOURNAL_MODES)
+    synchronous = Field(str.lower, default='normal', choices=SYNCHRONOUS_MODES)
+    cache_size = Field(int, default=-32768)
+    mmap_size = Field(int, non_negative, default=268435456)
+    temp_store = Field(str.lower, default='memory', choices=TEMP_STORES)
+    busy_timeout = Field(int, non_negative, default=5000)
 
     @property
     def colormode(self):
@@ -102,6 +119,18 @@ class GeneralConfig(FiggisConfig):
     def sqlalchemy_url(self):
         return 'sqlite:///{}'.format(self.database)
 
+    @property
+    def sqlite_pragmas(self):
+        """Return the PRAGMA settings applied to every database connection"""
+        return [
+            ('journal_mode', self.journal_mode),
+            ('synchronous', self.synchronous),
+            ('cache_size', self.cache_size),
+            ('mmap_size', self.mmap_size),
+            ('temp_store', self.temp_store),
+            ('busy_timeout', self.busy_timeout),
+        ]
+
 
 class MpdConfig(FiggisConfig):
 
@@ -1,5 +1,5 @@
 from sqlalchemy import (func, Column, Integer, String,
-                        ForeignKey, DateTime, Boolean)
+                        ForeignKey, DateTime, Boolean, Index)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.hybrid import hybrid_property, Comparator
@@ -142,6 +142,13 @@ class Scrobble(Base):
     scrobble_info = relationship(
         'ScrobbleInfo', backref=backref('scrobbles', order_by=id))
 
+    # time is the leading column, so this index also serves MIN/MAX(time),
+    # ordering by time and time-windowed queries
+    __table_args__ = (
+        Index('ix_scrobble_time_scrobble_info_id', 'time', 'scrobble_info_id',
+              unique=True),
+    )
+
 
 class ArtistCorrection(Base):
     __tablename__ = 'artist_correction'
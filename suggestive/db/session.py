@@ -1,38 +1,215 @@
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, scoped_session
 
 from suggestive.db.model import Base
+import suggestive.stats as stats
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 
 Session = scoped_session(sessionmaker())
 
+# Sessions for threads that only read from the database.  All mutations are
+# made by a single writer thread (see suggestive.threads.DatabaseWriter)
+ReadSession = scoped_session(sessionmaker())
+
+
+def pragma_setter(pragmas):
+    """
+    Return a connection event listener that applies the given SQLite PRAGMA
+    settings to each new DBAPI connection
+    """
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+
+    return set_pragmas
+
+
+######################################################################
+# Query tracking
+######################################################################
+
+# Lists of bound parameters, e.g. the expansion of IN (...)
+PARAMETER_LIST = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+
+
+def normalize_statement(statement):
+    """
+    Return a statement with lists of bound parameters collapsed, so that
+    statements that only differ in the number of parameters are similar
+    """
+    return PARAMETER_LIST.sub('(?)', ' '.join(statement.split()))
+
+
+class QueryScope(object):
+
+    """Statements executed within a single session_scope"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.count = 0
+        self.elapsed = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.elapsed += elapsed
+        self.statements[normalize_statement(statement)] += 1
+
+    def similar(self, threshold):
+        """
+        Return (statement, count) pairs for the statements that were executed
+        more than threshold times, most frequent first
+        """
+        return [(statement, count)
+                for statement, count in self.statements.most_common()
+                if count > threshold]
+
+
+class QueryTracker(object):
+
+    """
+    Counts and times the statements executed within each session_scope, and
+    warns about scopes that execute more than `threshold` similar statements,
+    which usually means one query per row (N+1) where a single query would
+    do.  Statements are attributed to the innermost scope open on the
+    executing thread
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 0
+        self.log_summaries = False
+        self.local = threading.local()
+
+    def configure(self, config):
+        general = config.general
+        self.enabled = general.log_sql_queries or general.timing_stats
+        self.threshold = general.similar_query_threshold
+        self.log_summaries = general.log_sql_queries
+
+    def listen(self, engine):
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+
+    @property
+    def scopes(self):
+        try:
+            return self.local.scopes
+        except AttributeError:
+            self.local.scopes = []
+            return self.local.scopes
+
+    def enter(self, operation):
+        scope = QueryScope(operation)
+        self.scopes.append(scope)
+        return scope
+
+    def exit(self, scope):
+        self.scopes.remove(scope)
+
+        if self.log_summaries and scope.count:
+            logger.info('%s: %d statements in %.1fms', scope.operation,
+                        scope.count, scope.elapsed * 1000)
+
+        if self.threshold:
+            for statement, count in scope.similar(self.threshold):
+                logger.warning(
+                    '%s executed %d similar statements (N+1 queries?): %s',
+                    scope.operation, count, statement[:200])
+
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+
+        scopes = self.scopes
+        if scopes:
+            scope = scopes[-1]
+            scope.record(statement, elapsed)
+            if stats.registry.enabled:
+                stats.registry.record('sql.{}'.format(scope.operation),
+                                      elapsed)
+
+
+queries = QueryTracker()
+
+
+def caller(depth):
+    """Return the qualified name of a function on the call stack"""
+    code = sys._getframe(depth + 1).f_code
+    return getattr(code, 'co_qualname', code.co_name)
+
+
+######################################################################
+# Sessions
+######################################################################
 
 def initialize(config, echo=False):
     """
     Return a SQLAlchemy session object. Also create database if it doesn't
     already exist
     """
+    pragmas = config.general.sqlite_pragmas
+
     engine = create_engine(config.general.sqlalchemy_url, echo=bool(echo))
+    event.listen(engine, 'connect', pragma_setter(pragmas))
     Session.configure(bind=engine)
 
+    read_engine = create_engine(config.general.sqlalchemy_url,
+                                echo=bool(echo))
+    event.listen(read_engine, 'connect',
+                 pragma_setter(pragmas + [('query_only', 'ON')]))
+    ReadSession.configure(bind=read_engine)
+
+    queries.configure(config)
+    if queries.enabled:
+        queries.listen(engine)
+        queries.listen(read_engine)
+
     Base.metadata.create_all(engine)
 
 
 @contextmanager
-def session_scope(conf, commit=True):
+def session_scope(conf, commit=True, read_only=False, operation=None):
     """
     Context manager that yields an SQLAlchemy session object that automatically
     commits/rolls back upon completion, depending on whether or not an
-    exception was encountered
+    exception was encountered.  Read-only sessions are never committed, and
+    their connections refuse to write to the database.
+
+    If query tracking is enabled, the statements executed within the scope are
+    attributed to `operation`, which defaults to the calling function
     """
-    session = Session()
+    scope = None
+    if queries.enabled:
+        # Skip the contextmanager's __enter__
+        scope = queries.enter(operation or caller(2))
+
+    session = ReadSession() if read_only else Session()
     try:
         yield session
-        if commit:
+        if commit and not read_only:
             session.commit()
     except:
         session.rollback()
         raise
     finally:
         session.close()
+        if scope is not None:
+            queries.exit(scope)
@@ -0,0 +1,242 @@
+"""
+Asyncio MPD event observer and dispatcher
+"""
+
+import suggestive.mstat as mstat
+
+from mpd import MPDError
+import asyncio
+import threading
+import logging
+import time
+from collections import defaultdict, deque
+from queue import PriorityQueue
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class EventStats(object):
+
+    """Dispatch statistics for a single event type"""
+
+    def __init__(self):
+        self.dispatched = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def mean_latency(self):
+        if not self.dispatched:
+            return 0.0
+        return self.total_latency / self.dispatched
+
+    def record(self, latency):
+        self.dispatched += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def __str__(self):
+        return ('dispatched={} dropped={} mean_latency={:.1f}ms '
+                'max_latency={:.1f}ms').format(
+                    self.dispatched,
+                    self.dropped,
+                    self.mean_latency * 1000,
+                    self.max_latency * 1000)
+
+
+class PriorityEventQueue(PriorityQueue):
+
+    """
+    Priority queue of (priority, event name) items.  Events in `unique` are
+    coalesced, i.e. an event that is already waiting in the queue is dropped.
+    The time between enqueueing and dequeueing each event is recorded in
+    `stats`
+    """
+
+    unique = {'player', 'playlist', 'database'}
+
+    def __init__(self):
+        self.events = set()
+        self.enqueued = defaultdict(deque)
+        self.stats = defaultdict(EventStats)
+        self.set_lock = threading.Lock()
+        super(PriorityEventQueue, self).__init__()
+
+    def in_queue(self, event):
+        return (
+            event in self.events and
+            event in self.unique
+        )
+
+    def put(self, item, *args, **kwArgs):
+        with self.set_lock:
+            event = item[-1]
+            if self.in_queue(event):
+                logger.debug('{} already in queue'.format(item))
+                self.stats[event].dropped += 1
+                return
+
+            self.events.add(event)
+            self.enqueued[event].append(time.monotonic())
+            super(PriorityEventQueue, self).put(item, *args, **kwArgs)
+
+    def get(self, *args, **kwArgs):
+        item = super(PriorityEventQueue, self).get(*args, **kwArgs)
+        with self.set_lock:
+            event = item[-1]
+            latency = time.monotonic() - self.enqueued[event].popleft()
+            if not self.enqueued[event]:
+                self.events.discard(event)
+
+            self.stats[event].record(latency)
+            logger.debug('Dequeued %s after %.1fms', event, latency * 1000)
+            return item
+
+    def log_stats(self):
+        with self.set_lock:
+            for event, stats in sorted(self.stats.items()):
+                logger.info('Event %s: %s', event, stats)
+
+
+class EventDispatcher(object):
+
+    """
+    Run the callback for each event taken from the event queue on the
+    application event loop.  Callbacks may be plain functions or coroutine
+    functions; the dispatcher wakes up as soon as an event is posted, rather
+    than polling the queue
+    """
+
+    def __init__(self, events, loop, after_dispatch=None):
+        self.events = events
+        self.loop = loop
+        self.after_dispatch = after_dispatch
+
+        self.queue = PriorityEventQueue()
+        self.pending = asyncio.Event()
+
+    def post(self, priority, event):
+        """Queue an event for dispatch.  Must be called on the event loop"""
+        self.queue.put((priority, event))
+        self.pending.set()
+
+    async def dispatch(self, event):
+        callback = self.events.get(event)
+        if not callable(callback):
+            logger.error('Event {} has no associated callback'.format(event))
+            return
+
+        try:
+            result = callback()
+            if asyncio.iscoroutine(result):
+                await result
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error('Callback for event %s failed', event, exc_info=exc)
+
+    async def run(self):
+        while True:
+            await self.pending.wait()
+            self.pending.clear()
+
+            while not self.queue.empty():
+                _, event = self.queue.get_nowait()
+                await self.dispatch(event)
+
+            if self.after_dispatch is not None:
+                (self.after_dispatch)()
+
+
+class MpdObserver(object):
+
+    """
+    Wait for MPD events on an asyncio MPD connection, and post them to the
+    event dispatcher.  The same connection may be used to run MPD commands
+    from event callbacks; python-mpd2 interrupts the idle command to run them.
+
+    database: the song database has been modified after update.
+    update: a database update has started or finished. If the database was
+        modified during the update, the database event is also emitted.
+    stored_playlist: a stored playlist has been modified, renamed, created or
+        deleted
+    playlist: the current playlist has been modified
+    player: the player has been started, stopped or seeked
+    mixer: the volume has been changed
+    output: an audio output has been enabled or disabled
+    options: options like repeat, random, crossfade, replay gain
+    sticker: the sticker database has been modified.
+    subscription: a client has subscribed or unsubscribed to a channel
+    message: a message was received on a channel this client is subscribed to;
+        this event is only emitted when the queue is empty
+    """
+
+    order = (
+        'player',
+        'playlist',
+        'database',
+        'update',
+        'stored_playlist',
+        'mixer',
+        'output',
+        'options',
+        'sticker',
+        'subscription',
+        'message',
+    )
+
+    default_retry_delay = 5
+
+    def __init__(self, conf, dispatcher, retry_delay=None):
+        if retry_delay is None:
+            retry_delay = self.default_retry_delay
+
+        self.conf = conf
+        self.dispatcher = dispatcher
+        self.retry_delay = float(retry_delay)
+        self.priorities = self.build_priority()
+
+        self.mpd = None
+        self.connected = asyncio.Event()
+
+    def build_priority(self):
+        return {event: i for i, event in enumerate(self.order)}
+
+    def consume_event(self, event):
+        if event not in self.dispatcher.events:
+            logger.debug('Ignoring MPD event {}'.format(event))
+            return
+
+        priority = self.priorities.get(event, 0)
+        self.dispatcher.post(priority, event)
+
+    async def client(self):
+        """Return the MPD connection, once it has been established"""
+        await self.connected.wait()
+        return self.mpd
+
+    async def run(self):
+        while True:
+            try:
+                self.mpd = await mstat.initialize_async_mpd(self.conf)
+                self.connected.set()
+
+                logger.debug('MPD: idle')
+                async for changes in self.mpd.idle():
+                    logger.debug('Mpd changes: {}'.format(changes))
+                    for change in changes:
+                        self.consume_event(change)
+            except (MPDError, OSError) as exc:
+                logger.warning('Lost MPD connection; reconnecting in %.0fs',
+                               self.retry_delay)
+                logger.debug(exc)
+            finally:
+                self.connected.clear()
+                if self.mpd is not None:
+                    self.mpd.disconnect()
+                    self.mpd = None
+
+            await asyncio.sleep(self.retry_delay)
@@ -2,8 +2,7 @@ from suggestive.util import retry_function, retry
 from suggestive.error import RetryError
 
 import logging
-import webbrowser
-import pylastfm
+import sys
 
 
 logger = logging.getLogger(__name__)
@@ -24,6 +23,16 @@ def get(data, keys, default=None):
     return get(data[key], rest, default=default)
 
 
+def lastfm_errors():
+    """
+    Return a tuple of the exception types raised by pylastfm, for use in except
+    clauses.  pylastfm is slow to import, and can only have raised an error if
+    it has already been imported, so it is never imported here
+    """
+    module = sys.modules.get('pylastfm')
+    return (module.LastfmError,) if module is not None else ()
+
+
 class LastFM(object):
 
     """
@@ -38,6 +47,8 @@ class LastFM(object):
         """Attempt to open up authorization URL in browser.  If this fails, simply
         display a message in the console asking user to manually open URL"""
 
+        import webbrowser
+
         url = 'http://www.last.fm/api/auth/?api_key={0}&token={1}'.format(
             self.config.lastfm.api_key, token)
 
@@ -65,6 +76,8 @@ class LastFM(object):
     def _authorize_application(self, client):
         """Go through the LastFM desktop application authorization process, saving
         a session key to a file for future use"""
+        import pylastfm
+
         token = retry_function(client.auth.get_token)
         self._get_user_permission(token)
 
@@ -79,6 +92,8 @@ class LastFM(object):
 
     @retry(exceptions=RetryError)
     def _initialize_client(self):
+        import pylastfm
+
         config = self.config
 
         client = pylastfm.LastFM(config.lastfm.api_key,
@@ -114,6 +129,8 @@ class LastFM(object):
 
     def love_track(self, artist, track):
         """Mark the given track loved"""
+        import pylastfm
+
         try:
             self.client.track.love(artist, track)
             return True
@@ -123,6 +140,8 @@ class LastFM(object):
 
     def unlove_track(self, artist, track):
         """Set the track as not loved"""
+        import pylastfm
+
         try:
             self.client.track.unlove(artist, track)
             return True
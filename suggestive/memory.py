@@ -0,0 +1,150 @@
+"""
+Memory diagnostics: allocation sites from tracemalloc snapshots, and counts of
+live model, view and database objects
+"""
+
+import gc
+import logging
+import tracemalloc
+from collections import Counter
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Stack frames stored per traced allocation
+TRACE_FRAMES = 1
+
+# Number of allocation sites in a report
+TOP_ALLOCATIONS = 15
+
+# Modules whose live instances are counted
+COUNTED_MODULES = ('suggestive.mvc', 'suggestive.db.model')
+
+# Allocations made by the tracing itself
+IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def format_size(size, sign=False):
+    return '{}{:.1f} KiB'.format('+' if sign and size >= 0 else '',
+                                 size / 1024)
+
+
+def object_counts(modules=COUNTED_MODULES):
+    """
+    Return a Counter of the number of live instances of each class defined in
+    the given modules, by qualified class name
+    """
+    counts = Counter()
+    for obj in gc.get_objects():
+        cls = type(obj)
+        module = getattr(cls, '__module__', None)
+
+        # Some extension types have a descriptor instead of a module name
+        if isinstance(module, str) and module.startswith(modules):
+            counts['{}.{}'.format(module, cls.__qualname__)] += 1
+
+    return counts
+
+
+class MemoryReport(object):
+
+    """Changes in memory use between two MemoryTracker snapshots"""
+
+    def __init__(self, traced, traced_change, allocations, counts,
+                 count_changes):
+        self.traced = traced
+        self.traced_change = traced_change
+        self.allocations = allocations
+        self.counts = counts
+        self.count_changes = count_changes
+
+    @property
+    def baseline(self):
+        """True if there was no previous snapshot to compare against"""
+        return self.traced_change is None
+
+    def lines(self):
+        if self.baseline:
+            lines = ['Started tracing allocations; take another snapshot to '
+                     'see what was allocated since']
+        else:
+            lines = ['Traced memory: {} ({})'.format(
+                format_size(self.traced),
+                format_size(self.traced_change, sign=True))]
+            lines.append('Top allocation sites since the last snapshot:')
+            lines.extend('  {}'.format(stat) for stat in self.allocations)
+
+        lines.append('Live objects:')
+        for name, count in sorted(self.counts.items()):
+            if self.baseline:
+                lines.append('  {}: {}'.format(name, count))
+            else:
+                lines.append('  {}: {} ({:+d})'.format(
+                    name, count, self.count_changes[name]))
+
+        return lines
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+
+class MemoryTracker(object):
+
+    """
+    Takes tracemalloc snapshots and object counts, and reports the
+    difference from the previous snapshot.  Allocations are only traced from
+    the first snapshot until `stop`, since tracing slows everything down
+    """
+
+    def __init__(self, frames=TRACE_FRAMES, limit=TOP_ALLOCATIONS):
+        self.frames = frames
+        self.limit = limit
+        self.snapshot = None
+        self.counts = Counter()
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def take(self):
+        """Take a snapshot and return a MemoryReport"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.snapshot = None
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+        traced = sum(stat.size for stat in snapshot.statistics('filename'))
+
+        counts = object_counts()
+        count_changes = Counter(counts)
+        count_changes.subtract(self.counts)
+
+        if self.snapshot is None:
+            traced_change, allocations = None, []
+        else:
+            previous = sum(stat.size
+                           for stat in self.snapshot.statistics('filename'))
+            traced_change = traced - previous
+            allocations = snapshot.compare_to(
+                self.snapshot, 'lineno')[:self.limit]
+
+        self.snapshot = snapshot
+        self.counts = counts
+
+        return MemoryReport(traced, traced_change, allocations, counts,
+                            count_changes)
+
+    def stop(self):
+        """Stop tracing allocations and forget the last snapshot"""
+        tracemalloc.stop()
+        self.snapshot = None
+        self.counts = Counter()
+
+
+# Tracker shared by the whole application
+tracker = MemoryTracker()
@@ -1,9 +1,21 @@
 from suggestive.db.session import initialize, session_scope
-from alembic.config import Config
-from alembic import command
+
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Revision of the newest migration in suggestive/alembic/versions.  This must
+# be updated whenever a migration is added, which is checked by the test suite
+HEAD_REVISION = 'b928344df489'
 
 
 def alembic_conf(conf):
+    from alembic.config import Config
+
     a_conf = Config()
     a_conf.set_main_option('script_location', 'suggestive:alembic')
     a_conf.set_main_option('url', conf.general.sqlalchemy_url)
@@ -12,6 +24,8 @@ def alembic_conf(conf):
 
 
 def initialize_database(conf):
+    from alembic import command
+
     a_conf = alembic_conf(conf)
     initialize(conf)
     with session_scope(conf) as session:
@@ -20,6 +34,33 @@ def initialize_database(conf):
     command.stamp(a_conf, 'head')
 
 
+def current_revision(conf):
+    """
+    Return the alembic revision of the database, or None if it has not been
+    stamped with one
+    """
+    with session_scope(conf, read_only=True) as session:
+        try:
+            rows = session.execute(
+                text('SELECT version_num FROM alembic_version')).fetchall()
+        except OperationalError:
+            return None
+
+    return rows[0][0] if len(rows) == 1 else None
+
+
 def migrate(conf):
+    """
+    Upgrade the database to the newest revision.  Alembic is only loaded if
+    the database is not already up to date
+    """
+    revision = current_revision(conf)
+    if revision == HEAD_REVISION:
+        logger.debug('Database is at revision %s; not migrating', revision)
+        return
+
+    from alembic import command
+
+    logger.info('Migrating database from revision %s', revision)
     a_conf = alembic_conf(conf)
     command.upgrade(a_conf, 'head')
@@ -1,26 +1,43 @@
 import logging
+import string
 from collections import defaultdict, OrderedDict
 from datetime import datetime, timedelta
 from difflib import get_close_matches
 from itertools import chain
 from mpd import MPDClient
 from mpd import MPDError
+from mpd.asyncio import MPDClient as AsyncMPDClient
 from os.path import basename, dirname
-from pylastfm import LastfmError
-from sqlalchemy import func
-from sqlalchemy.orm import subqueryload
+from sqlalchemy import func, bindparam
+from sqlalchemy.orm import joinedload
 
-from suggestive.lastfm import LastFM
+from suggestive.lastfm import LastFM, lastfm_errors
 from suggestive.db.session import session_scope
 from suggestive.db.model import (
     Artist, ArtistCorrection, Album, Scrobble, Track,
     ScrobbleInfo, LastfmTrackInfo)
 from suggestive.util import partition
+from suggestive.catalog import catalog
+import suggestive.records as records
+import suggestive.stats as stats
 
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
+# Maximum number of values bound to a single IN (...) clause; older versions of
+# SQLite allow at most 999 parameters per statement
+SQL_CHUNK_SIZE = 500
+
+# Number of files above which MPD track info is taken from a single listing of
+# the whole library, rather than one listallinfo per file
+MPD_INFO_BATCH = 100
+
+# Number of scrobbles loaded at a time by ScrobbleLoader.load_scrobbles
+SCROBBLE_BATCH = 200
+
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
 
 ######################################################################
 # Helper functions
@@ -41,6 +58,35 @@ def mpd_retry(func):
     return wrapper
 
 
+def fold_case(value):
+    """
+    Lower-case a string the way SQLite's lower() does, i.e. only ASCII
+    characters, so that the result matches the model's case-insensitive
+    comparisons
+    """
+    return value.translate(ASCII_LOWER)
+
+
+def get_or_insert(session, table, rows_by_key, lookup):
+    """
+    Return a dict of key to id for each row in rows_by_key.  lookup(keys) must
+    return the ids of the rows that exist for the given keys; the others are
+    inserted with a single statement
+    """
+    ids = lookup(list(rows_by_key))
+    missing = [key for key in rows_by_key if key not in ids]
+    if missing:
+        session.execute(table.insert(), [rows_by_key[key] for key in missing])
+        ids.update(lookup(missing))
+
+    return ids
+
+
+def scrobble_key(artist, album, title):
+    """Return the case-folded (artist, album, title) of a track"""
+    return fold_case(artist), fold_case(album), fold_case(title)
+
+
 def get(data, keys, default=None):
     """
     For a nested hash, return the result of evaluating
@@ -71,6 +117,20 @@ def earliest_scrobble(session):
     return session.query(func.min(Scrobble.time)).scalar()
 
 
+def count_scrobbles(session, start=None, end=None):
+    """
+    Return the number of scrobbles that took place between the start and end
+    dates
+    """
+    query = session.query(func.count(Scrobble.id))
+    if start is not None:
+        query = query.filter(Scrobble.time >= start)
+    if end is not None:
+        query = query.filter(Scrobble.time <= end)
+
+    return query.scalar()
+
+
 def get_playlist_track(session, config, index):
     """
     Get the database Track object corresponding to the given index in the
@@ -90,106 +150,105 @@ def get_playlist_track(session, config, index):
 
 def database_track_from_mpd(conf, track_info):
     """
-    Return the database Track object corresponding to track info from MPD
+    Return the TrackRecord corresponding to track info from MPD
     """
     tracks = database_tracks_from_mpd(conf, [track_info])
     return tracks[0] if tracks else None
 
 
 def get_unknown_track(info):
-    """Create a mock Track for a MPD track not in the database"""
+    """Create a TrackRecord for a MPD track not in the database"""
     filename = info['file']
-    title = info.get('title', basename(filename))
-
-    artist = Artist(name='Unknown')
-    return Track(
-        name=title,
-        filename=filename,
-        album=Album(name='Unknown', artist=artist),
-        artist=artist,
-    )
+    return records.unknown_track(filename,
+                                 info.get('title', basename(filename)))
 
 
+@stats.timed
 def database_tracks_from_mpd(conf, tracks_info):
     """
-    Return the database Track object corresponding to track info from MPD
+    Return the TrackRecords corresponding to track info from MPD.  Tracks are
+    looked up in the catalog, and only those that are not in it are looked up
+    in the database
     """
     track_filenames = [info['file'] for info in tracks_info]
     info_by_filename = OrderedDict((info['file'], info)
                                    for info in tracks_info)
 
-    def _get_db_tracks(session, chunk):
-        return (session.query(Track).
-                options(subqueryload(Track.album),
-                        subqueryload(Track.artist),
-                        subqueryload(Track.lastfm_info)).
-                filter(Track.filename.in_(chunk)).
-                all())
+    catalog.ensure_loaded(conf)
+    tracks_by_filename = catalog.tracks_by_filename(info_by_filename)
+    if len(tracks_by_filename) < len(info_by_filename):
+        tracks_by_filename.update(_database_tracks(
+            conf, [filename for filename in info_by_filename
+                   if filename not in tracks_by_filename]))
 
-    with session_scope(conf, commit=False) as session:
-        tracks_by_filename = {}
-        missing = []
+    return [tracks_by_filename.get(filename) or
+            get_unknown_track(info_by_filename[filename])
+            for filename in track_filenames]
 
-        chunk_size = 128
-        for chunk in partition(info_by_filename.keys(), chunk_size):
-            db_tracks = _get_db_tracks(session, chunk)
-            by_filename = {t.filename: t for t in db_tracks}
 
-            if len(db_tracks) != chunk_size:
-                missing.extend((filename for filename in chunk
-                                if filename not in by_filename))
-
-            tracks_by_filename.update(by_filename)
+def _database_tracks(conf, filenames):
+    """
+    Return a dict of filename to TrackRecord for tracks that are not in the
+    catalog.  Tracks that are not in the database either are left out; only
+    the database writer adds them, on its next update
+    """
+    intern = records.Interner()
+    tracks_by_filename = {}
 
-        if missing:
-            logger.info(
-                'Updating database with %d missing track%s in playlist',
-                len(missing), 's' if len(missing) > 1 else '')
+    with session_scope(conf, read_only=True) as session:
+        for chunk in partition(filenames, SQL_CHUNK_SIZE):
+            tracks_by_filename.update(
+                (track.filename, track)
+                for track in records.track_records(
+                    records.track_query(session).
+                    filter(Track.filename.in_(chunk)).
+                    all(),
+                    intern))
 
-            MpdLoader(conf).load_mpd_tracks(session, missing)
-            for chunk in partition(missing, chunk_size):
-                db_tracks = _get_db_tracks(session, chunk)
-                by_filename = {t.filename: t for t in db_tracks}
-                tracks_by_filename.update(by_filename)
+    missing = len(filenames) - len(tracks_by_filename)
+    if missing:
+        logger.info('%d track%s in playlist not in the database yet',
+                    missing, 's' if missing > 1 else '')
 
-        filename_and_info = ((filename, info_by_filename[filename])
-                             for filename in track_filenames)
-        return [tracks_by_filename.get(filename, get_unknown_track(info))
-                for filename, info in filename_and_info]
+    return tracks_by_filename
 
 
 def get_scrobbles(conf, limit, offset=None):
     """
-    Get the specified number of scrobbles with an optional offset
+    Get ScrobbleRecords for the specified number of scrobbles with an optional
+    offset
     """
     if not limit:
         return []
 
-    with session_scope(conf, commit=False) as session:
-        query = session.query(Scrobble).\
-            join(Track).\
-            options(
-                subqueryload('track').subqueryload('*'),
-            ).\
+    with session_scope(conf, read_only=True) as session:
+        query = session.query(Scrobble.id, Scrobble.time, Scrobble.track_id).\
+            join(Track, Track.id == Scrobble.track_id).\
             order_by(Scrobble.time.desc()).\
             limit(limit)
 
         if offset is not None:
             query = query.offset(offset)
 
-        return query.all()
+        scrobbles = query.all()
+
+        # Scrobbles of the same track share its record
+        catalog.ensure_loaded(conf)
+        track_ids = set(track_id for _, _, track_id in scrobbles)
+        tracks = catalog.tracks_by_id(track_ids)
+        if len(tracks) < len(track_ids):
+            tracks.update((track.id, track) for track in records.track_records(
+                records.track_query(session).
+                filter(Track.id.in_(track_ids - set(tracks)))))
+
+    return [records.ScrobbleRecord(id, time, tracks[track_id])
+            for id, time, track_id in scrobbles]
 
 
 def get_album_tracks(conf, album):
-    with session_scope(conf, commit=False) as session:
-        return session.query(Track).\
-            options(
-                subqueryload(Track.album),
-                subqueryload(Track.artist),
-                subqueryload(Track.lastfm_info)
-            ).\
-            filter(Track.album_id == album.id).\
-            all()
+    """Return the TrackRecords of an album, from the catalog"""
+    catalog.ensure_loaded(conf)
+    return catalog.album_tracks(album.id)
 
 
 ######################################################################
@@ -208,116 +267,126 @@ class ScrobbleLoader(object):
         self.retention = config.lastfm.scrobble_days
         self._track_mapping = {}
 
-    @classmethod
-    def check_duplicates(cls, session):
-        logger.debug('Checking for duplicate scrobbles')
-
-        return session.query(Scrobble).\
-            group_by(Scrobble.time, Scrobble.scrobble_info_id).\
-            having(func.min(Scrobble.id) != func.max(Scrobble.id)).\
-            count()
-
-    @classmethod
-    def delete_duplicates(cls, session):
-        n_duplicates = cls.check_duplicates(session)
-        if not n_duplicates:
-            return
-
-        ids = session.query(func.min(Scrobble.id).label('scrobble_id')).\
-            group_by(Scrobble.time, Scrobble.scrobble_info_id).\
-            subquery('ids')
-
-        duplicates = session.query(Scrobble).\
-            outerjoin(ids, ids.c.scrobble_id == Scrobble.id).\
-            filter(ids.c.scrobble_id.is_(None)).\
-            all()
-
-        # The two duplicate check queries should match
-        assert len(duplicates) == n_duplicates
-
-        logger.info('Deleting {} duplicate scrobbles'.format(n_duplicates))
-
-        for item in duplicates:
-            session.delete(item)
-
-    def scrobble_info(self, session, artist, album, track):
+    def scrobble_info_ids(self, session, names):
         """
-        Return for scrobble information for the given track. If none is found,
-        insert and return a new scrobble record
+        Return a dict of case-folded (artist, album, title) to the id of its
+        scrobble information, inserting records for names that have none
         """
-
-        db_scrobble_info = (session.query(ScrobbleInfo)
-                            .filter(ScrobbleInfo.title_insensitive == track,
-                                    ScrobbleInfo.artist_insensitive == artist,
-                                    ScrobbleInfo.album_insensitive == album)
-                            .first())
-
-        if not db_scrobble_info:
-            logger.debug('Creating scrobble info for %s - %s - %s',
-                         artist, album, track)
-
-            db_scrobble_info = ScrobbleInfo(
-                title=track,
-                artist=artist,
-                album=album
-            )
-            session.add(db_scrobble_info)
-
-        return db_scrobble_info
-
-    def db_scrobble(self, session, when, db_scrobble_info):
-        scrobble = (session.query(Scrobble)
-                    .filter(Scrobble.time == when, Scrobble.scrobble_info == db_scrobble_info)
-                    .first())
-        if not scrobble:
-            logger.debug('Creating scrobble: %s - %s - %s @ %s',
-                         db_scrobble_info.artist, db_scrobble_info.album, db_scrobble_info.title,
-                         when)
-
-            scrobble = Scrobble(time=when)
-            db_scrobble_info.scrobbles.append(scrobble)
-            session.add(scrobble)
-
-        return scrobble
-
-    def load_scrobble(self, session, fm_track):
+        rows_by_key = OrderedDict()
+        for artist, album, title in names:
+            rows_by_key.setdefault(
+                scrobble_key(artist, album, title),
+                dict(title=title, artist=artist, album=album))
+
+        def lookup(keys):
+            ids = {}
+            titles = set(title for _, _, title in keys)
+            for chunk in partition(titles, SQL_CHUNK_SIZE):
+                rows = (session.query(ScrobbleInfo.id, ScrobbleInfo.artist,
+                                      ScrobbleInfo.album, ScrobbleInfo.title)
+                        .filter(func.lower(ScrobbleInfo.title).in_(chunk))
+                        .order_by(ScrobbleInfo.id))
+                for info_id, artist, album, title in rows:
+                    if artist is None or album is None:
+                        continue
+                    ids.setdefault(scrobble_key(artist, album, title), info_id)
+
+            return {key: ids[key] for key in keys if key in ids}
+
+        return get_or_insert(session, ScrobbleInfo.__table__, rows_by_key,
+                             lookup)
+
+    def db_scrobbles(self, session, rows):
+        """
+        Insert scrobbles, given as dicts of time, scrobble_info_id and
+        track_id, ignoring those that have already been loaded.  Existing
+        scrobbles that were never matched to a track are assigned to theirs
         """
-        Load a raw scrobble from the LastFM API
+        session.execute(Scrobble.__table__.insert().prefix_with('OR IGNORE'),
+                        rows)
+
+        matched = [dict(when=row['time'],
+                        info_id=row['scrobble_info_id'],
+                        new_track_id=row['track_id'])
+                   for row in rows if row['track_id'] is not None]
+        if matched:
+            session.execute(
+                Scrobble.__table__.update().
+                where(Scrobble.time == bindparam('when')).
+                where(Scrobble.scrobble_info_id == bindparam('info_id')).
+                where(Scrobble.track_id.is_(None)).
+                values(track_id=bindparam('new_track_id')),
+                matched)
+
+    def exact_matches(self, session, fm_tracks):
         """
+        Return a dict of case-folded (artist, album, title) to the (track id,
+        (artist, album, title)) of the database track that matches each
+        LastFM track exactly, ignoring case
+        """
+        wanted = set(scrobble_key(fm_track.artist_name, fm_track.album_name,
+                                  fm_track.name)
+                     for fm_track in fm_tracks)
+        titles = set(title for _, _, title in wanted)
+
+        matches = {}
+        for chunk in partition(titles, SQL_CHUNK_SIZE):
+            rows = (session.query(Track.id, Artist.name, Album.name, Track.name)
+                    .join(Artist, Artist.id == Track.artist_id)
+                    .join(Album, Album.id == Track.album_id)
+                    .filter(func.lower(Track.name).in_(chunk))
+                    .order_by(Track.id))
+            for track_id, artist, album, title in rows:
+                key = scrobble_key(artist, album, title)
+                if key in wanted:
+                    matches.setdefault(key, (track_id, (artist, album, title)))
+
+        return matches
+
+    def valid_scrobble(self, fm_track):
         if not (fm_track.artist_name and fm_track.album_name and fm_track.name and
                 fm_track.date):
             logger.debug('Invalid scrobble: %s - %s - %s @ %s',
                          fm_track.artist_name, fm_track.album_name, fm_track.name,
                          fm_track.date)
-            return
+            return False
 
-        closest_track = self.find_closest_track(session, fm_track)
-        if closest_track:
-            artist_name = closest_track.artist.name
-            album_name = closest_track.album.name
-            track_name = closest_track.name
-        else:
-            artist_name = fm_track.artist_name
-            album_name = fm_track.album_name
-            track_name = fm_track.name
-
-        db_scrobble_info = self.scrobble_info(session, artist_name, album_name, track_name)
-        scrobble = self.db_scrobble(session, fm_track.date, db_scrobble_info)
-        if scrobble is None:
-            logger.debug('Creating scrobble: %s - %s - %s @ %s',
-                         artist_name, album_name, track_name, fm_track.date)
-
-            scrobble = Scrobble(time=fm_track.date)
-            db_scrobble_info.scrobbles.append(scrobble)
-            session.add(scrobble)
-
-        # If this scrobble is already assigned to a track in the database, we know it's already
-        # been loaded and can therefore ignore it
-        if scrobble.track:
+        return True
+
+    def load_batch(self, session, fm_tracks):
+        """
+        Load a batch of raw scrobbles from the LastFM API.  Tracks, scrobble
+        information and scrobbles are looked up and inserted for the whole
+        batch at once
+        """
+        fm_tracks = [fm_track for fm_track in fm_tracks
+                     if self.valid_scrobble(fm_track)]
+        if not fm_tracks:
             return
 
-        if closest_track:
-            closest_track.scrobbles.append(scrobble)
+        exact = self.exact_matches(session, fm_tracks)
+
+        matches = []
+        for fm_track in fm_tracks:
+            key = scrobble_key(fm_track.artist_name, fm_track.album_name,
+                               fm_track.name)
+            match = exact.get(key) or self.find_closest_track(session, fm_track)
+            if match is None:
+                match = (None, (fm_track.artist_name, fm_track.album_name,
+                                fm_track.name))
+            matches.append(match)
+
+        info_ids = self.scrobble_info_ids(
+            session, [names for _, names in matches])
+
+        self.db_scrobbles(session, [
+            dict(time=fm_track.date,
+                 scrobble_info_id=info_ids[scrobble_key(*names)],
+                 track_id=track_id)
+            for fm_track, (track_id, names) in zip(fm_tracks, matches)
+        ])
+        catalog.update_plays(session, [track_id for track_id, _ in matches
+                                       if track_id is not None])
 
     def track_mapping(self, session):
         """
@@ -335,17 +404,11 @@ class ScrobbleLoader(object):
         return self._track_mapping
 
     def find_closest_track(self, session, track):
-        exact_match = (session.query(Track)
-                       .join(Track.artist)
-                       .join(Track.album)
-                       .filter(
-                           Artist.name_insensitive == track.artist_name,
-                           Album.name_insensitive == track.album_name,
-                           Track.name_insensitive == track.name)
-                       .first())
-        if exact_match:
-            return exact_match
-
+        """
+        Return the (track id, (artist, album, title)) of the database track
+        whose artist, album and title are closest to those of a LastFM track
+        that has no exact match, or None
+        """
         mapping = self.track_mapping(session)
         track_string = '\x01'.join((track.artist_name, track.album_name, track.name))
 
@@ -353,17 +416,19 @@ class ScrobbleLoader(object):
         if not closest_matches:
             return None
 
-        closest_track_mapping = OrderedDict((mapping[match].name, mapping[match])
+        closest_track_mapping = OrderedDict((mapping[match].name, match)
                                             for match in closest_matches)
         closest_track_name = get_close_matches(track.name, closest_track_mapping.keys(), n=1)
         if not closest_track_name:
             return None
 
-        return closest_track_mapping[closest_track_name[0]]
+        match = closest_track_mapping[closest_track_name[0]]
+        return mapping[match].id, tuple(match.split('\x01'))
 
     def load_recent_scrobbles(self, session):
         """
-        Load scrobbles that were added since the last check
+        Load scrobbles that were added since the last check.  Return the number
+        of new scrobbles
         """
         start = last_updated(session)
         if not start:
@@ -372,22 +437,27 @@ class ScrobbleLoader(object):
         logger.info('Get scrobbles since %s',
                     start.strftime('%Y-%m-%d %H:%M'))
 
-        return self.load_scrobbles(session, start=start)
+        # Only look at the window being loaded, so that the cost of an update
+        # does not grow with the size of the scrobble history
+        loaded_before = count_scrobbles(session, start=start)
+        self.load_scrobbles(session, start=start)
+
+        return count_scrobbles(session, start=start) - loaded_before
 
+    @stats.timed
     def load_scrobbles(self, session, start=None, end=None):
         """
         Load scrobbles that took place between the start and end dates
         """
         n_scrobbles = 0
-        for item in self.lastfm.scrobbles(self.user, start=start, end=end):
-            self.load_scrobble(session, item)
-            n_scrobbles += 1
-
-        logger.debug('Checking for duplicate scrobbles')
-        self.delete_duplicates(session)
+        scrobbles = self.lastfm.scrobbles(self.user, start=start, end=end)
+        for batch in partition(scrobbles, SCROBBLE_BATCH):
+            self.load_batch(session, batch)
+            n_scrobbles += len(batch)
 
         return n_scrobbles
 
+    @stats.timed
     def load_scrobbles_from_list(self, session, scrobbles):
         """
         Load scrobbles from a list generated by the LastFM API
@@ -396,15 +466,9 @@ class ScrobbleLoader(object):
             return 0
 
         n_scrobbles = len(scrobbles)
+        self.load_batch(session, scrobbles)
 
-        first = scrobbles[0]
-        self.load_scrobble(session, first)
-
-        track = None  # Necessary if there was only one scrobble total
-        for track in scrobbles[1:]:
-            self.load_scrobble(session, track)
-
-        last = track or first
+        first, last = scrobbles[0], scrobbles[-1]
         logger.info('Loaded %d scrobbles from %s to %s', n_scrobbles, first.date, last.date)
 
         return n_scrobbles
@@ -428,65 +492,104 @@ class MpdLoader(object):
     def conf(self):
         return self._conf
 
-    def load_track(self, session, db_artist, db_album, info):
+    def artist_ids(self, session, artists):
         """
-        Atempt to load a track into the suggestive database
+        Return a dict of case-folded artist name to artist id, inserting the
+        artists that are not in the database
         """
-        filename = info['file']
-        if not session.query(Track).filter_by(filename=filename).first():
-            title = info.get('title', basename(filename))
+        rows_by_key = OrderedDict()
+        for artist in artists:
+            rows_by_key.setdefault(fold_case(artist), dict(name=artist))
 
-            db_track = Track(
-                name=title,
-                filename=filename,
-            )
-            db_album.tracks.append(db_track)
-            db_artist.tracks.append(db_track)
-            session.add(db_track)
-
-    def load_artist_albums(self, session, db_artist, albums):
-        """
-        Load albums from a given artist
-        """
-        for album, info_list in albums.items():
-            # ignore missing albums
-            if not album:
-                continue
+        def lookup(keys):
+            ids = {}
+            for chunk in partition(keys, SQL_CHUNK_SIZE):
+                rows = (session.query(Artist.id, Artist.name)
+                        .filter(func.lower(Artist.name).in_(chunk))
+                        .order_by(Artist.id))
+                for artist_id, name in rows:
+                    ids.setdefault(fold_case(name), artist_id)
 
-            logger.debug("Loading %d tracks from '%s - %s'",
-                         len(info_list), db_artist.name, album)
+            return ids
 
-            db_album = session.query(Album).\
-                filter(Album.name_insensitive == album).\
-                filter(Album.artist == db_artist).\
-                first()
-            if not db_album:
-                db_album = Album(name=album)
-                db_artist.albums.append(db_album)
-                session.add(db_album)
+        return get_or_insert(session, Artist.__table__, rows_by_key, lookup)
 
-            for info in info_list:
-                self.load_track(session, db_artist, db_album, info)
+    def album_ids(self, session, albums):
+        """
+        Return a dict of (artist id, case-folded album name) to album id for
+        the given (artist id, album name) pairs, inserting the albums that are
+        not in the database
+        """
+        rows_by_key = OrderedDict()
+        for artist_id, album in albums:
+            rows_by_key.setdefault(
+                (artist_id, fold_case(album)),
+                dict(name=album, artist_id=artist_id))
+
+        def lookup(keys):
+            ids = {}
+            artist_ids = set(artist_id for artist_id, _ in keys)
+            for chunk in partition(artist_ids, SQL_CHUNK_SIZE):
+                rows = (session.query(Album.id, Album.artist_id, Album.name)
+                        .filter(Album.artist_id.in_(chunk))
+                        .order_by(Album.id))
+                for album_id, artist_id, name in rows:
+                    ids.setdefault((artist_id, fold_case(name)), album_id)
+
+            return {key: ids[key] for key in keys if key in ids}
+
+        return get_or_insert(session, Album.__table__, rows_by_key, lookup)
 
     def load_by_artist_album(self, session, by_artist_album):
         """
-        Load albums from a dict of artist-albums pairs
+        Load tracks from a dict of artist -> album -> track info.  Artists,
+        albums and tracks are each looked up and inserted in bulk, rather than
+        one at a time
         """
-        for artist, albums in by_artist_album.items():
-            # ignore missing artists
-            if not artist:
-                logger.error('No artist found')
-                continue
+        if any(not artist for artist in by_artist_album):
+            logger.error('No artist found')
 
+        by_artist_album = OrderedDict(
+            (artist, albums) for artist, albums in by_artist_album.items()
+            if artist)
+        for artist, albums in by_artist_album.items():
             logger.debug("Loading %d albums from artist '%s'", len(albums), artist)
 
-            db_artist = session.query(Artist).filter_by(
-                name_insensitive=artist).first()
-            if not db_artist:
-                db_artist = Artist(name=artist)
-                session.add(db_artist)
+        artist_ids = self.artist_ids(session, by_artist_album.keys())
 
-            self.load_artist_albums(session, db_artist, albums)
+        # Tracks without an album are ignored
+        albums = [(artist_ids[fold_case(artist)], album)
+                  for artist, by_album in by_artist_album.items()
+                  for album in by_album if album]
+        album_ids = self.album_ids(session, albums)
+
+        tracks = OrderedDict()
+        for artist, by_album in by_artist_album.items():
+            artist_id = artist_ids[fold_case(artist)]
+            for album, info_list in by_album.items():
+                if not album:
+                    continue
+
+                album_id = album_ids[(artist_id, fold_case(album))]
+                for info in info_list:
+                    filename = info['file']
+                    tracks.setdefault(filename, dict(
+                        name=info.get('title', basename(filename)),
+                        filename=filename,
+                        album_id=album_id,
+                        artist_id=artist_id,
+                    ))
+
+        existing = set()
+        for chunk in partition(tracks, SQL_CHUNK_SIZE):
+            existing.update(filename for filename, in session.query(
+                Track.filename).filter(Track.filename.in_(chunk)))
+
+        rows = [row for filename, row in tracks.items()
+                if filename not in existing]
+        if rows:
+            session.execute(Track.__table__.insert(), rows)
+            catalog.update_tracks(session, [row['filename'] for row in rows])
 
     def delete_orphaned(self, session, deleted):
         """
@@ -502,6 +605,8 @@ class MpdLoader(object):
                 for track in tracks_to_delete:
                     session.delete(track)
 
+            catalog.delete_tracks(session, deleted)
+
         info_to_delete = session.query(LastfmTrackInfo).\
             filter(LastfmTrackInfo.track_id.is_(None)).\
             all()
@@ -522,6 +627,8 @@ class MpdLoader(object):
         for album in empty:
             session.delete(album)
 
+        catalog.delete_albums(session, [album.id for album in empty])
+
         logger.debug('Deleted %d empty albums', len(empty))
 
     @mpd_retry
@@ -573,22 +680,42 @@ class MpdLoader(object):
 
     @mpd_retry
     def _list_mpd_files(self):
-        return self.mpd.list('file')
+        # python-mpd2 1.0 and later return {'file': ...} dicts
+        return [item['file'] if isinstance(item, dict) else item
+                for item in self.mpd.list('file')]
 
     @mpd_retry
     def _mpd_info(self, path):
         return self.mpd.listallinfo(path)
 
+    @mpd_retry
+    def _all_mpd_info(self):
+        return self.mpd.listallinfo()
+
+    def mpd_track_info(self, filenames):
+        """
+        Return the MPD track info for each of the given files.  Many files are
+        looked up with a single listing of the whole library, rather than one
+        command per file
+        """
+        if len(filenames) <= MPD_INFO_BATCH:
+            return list(chain.from_iterable(
+                self._mpd_info(path) for path in filenames))
+
+        wanted = set(filenames)
+        return [info for info in self._all_mpd_info()
+                if info.get('file') in wanted]
+
     def load_mpd_tracks(self, session, filenames):
         if not filenames:
             return
 
-        missing_info = list(
-            chain.from_iterable(self._mpd_info(path) for path in filenames))
+        missing_info = self.mpd_track_info(filenames)
 
         by_artist_album = self.segregate_track_info(missing_info)
         self.load_by_artist_album(session, by_artist_album)
 
+    @stats.timed
     def load(self, session):
         """
         Synchronize MPD and suggestive databases
@@ -620,22 +747,6 @@ class TrackInfoLoader(object):
         self.lastfm = lastfm
         self.user = config.lastfm.user
 
-    def update_track_info(self, session, db_track, loved):
-        """
-        Attempt to update the loved status of a track. If the track does
-        not have a corresponding LastFM info record, insert that record into
-        the database
-        """
-        logger.debug('update_track_info: %s, %s', db_track.name, loved)
-        db_track_info = db_track.lastfm_info
-        if not db_track_info:
-            logger.debug('New track info')
-            db_track_info = LastfmTrackInfo()
-            db_track.lastfm_info = db_track_info
-            session.add(db_track_info)
-
-        db_track_info.loved = loved
-
     def find_track(self, session, artist, track):
         """
         Find a database record for a track
@@ -711,25 +822,50 @@ class TrackInfoLoader(object):
                 if db_track:
                     return db_track
 
-    def load_track_info(self, session, artist, loved_tracks):
+    def exact_matches(self, session, loved_tracks):
         """
-        Load loved tracks into the database
+        Return a dict of case-folded (artist, title) to the id of the database
+        track that matches each loved track exactly, ignoring case
         """
-        artist_names = [a.name for a in session.query(Artist).all()]
-
-        for track in loved_tracks:
-            db_track = self.db_track_from_lastfm(
-                session, artist_names, artist, track)
+        wanted = set((fold_case(artist), fold_case(track))
+                     for artist, tracks in loved_tracks.items()
+                     for track in tracks)
+        titles = set(title for _, title in wanted)
+
+        matches = {}
+        for chunk in partition(titles, SQL_CHUNK_SIZE):
+            rows = (session.query(Track.id, Artist.name, Track.name)
+                    .join(Artist, Artist.id == Track.artist_id)
+                    .filter(func.lower(Track.name).in_(chunk))
+                    .order_by(Track.id))
+            for track_id, artist, title in rows:
+                key = (fold_case(artist), fold_case(title))
+                if key in wanted:
+                    matches.setdefault(key, track_id)
+
+        return matches
+
+    def mark_loved(self, session, track_ids):
+        """
+        Mark tracks loved, inserting LastFM info records for the tracks that
+        have none
+        """
+        info = LastfmTrackInfo.__table__
+        existing = set()
+        for chunk in partition(sorted(track_ids), SQL_CHUNK_SIZE):
+            existing.update(track_id for track_id, in session.query(
+                LastfmTrackInfo.track_id).filter(
+                    LastfmTrackInfo.track_id.in_(chunk)))
+            session.execute(info.update().
+                            where(info.c.track_id.in_(chunk)).
+                            values(loved=True))
+
+        missing = sorted(set(track_ids) - existing)
+        if missing:
+            session.execute(info.insert(), [dict(track_id=track_id, loved=True)
+                                            for track_id in missing])
 
-            if db_track:
-                self.update_track_info(
-                    session,
-                    db_track,
-                    track in loved_tracks,
-                )
-            else:
-                logger.error('Could not find database entry for LastFM item: %s - %s',
-                             artist, track)
+        catalog.set_loved(session, track_ids)
 
     def get_loved_tracks(self):
         """
@@ -746,18 +882,37 @@ class TrackInfoLoader(object):
 
         return loved_tracks
 
+    @stats.timed
     def load(self, session):
         """
         Synchronize LastFM track information with suggestive database
         """
         loved_tracks = self.get_loved_tracks()
+        exact = self.exact_matches(session, loved_tracks)
 
+        artist_names = None
+        track_ids = set()
         for artist, tracks in loved_tracks.items():
-            self.load_track_info(
-                session,
-                artist,
-                tracks,
-            )
+            for track in tracks:
+                track_id = exact.get((fold_case(artist), fold_case(track)))
+
+                # Fall back to looking for the closest match one at a time
+                if track_id is None:
+                    if artist_names is None:
+                        artist_names = [name for name, in session.query(
+                            Artist.name)]
+
+                    db_track = self.db_track_from_lastfm(
+                        session, artist_names, artist, track)
+                    track_id = db_track.id if db_track else None
+
+                if track_id is None:
+                    logger.error('Could not find database entry for LastFM item: %s - %s',
+                                 artist, track)
+                else:
+                    track_ids.add(track_id)
+
+        self.mark_loved(session, track_ids)
 
 
 ######################################################################
@@ -771,7 +926,17 @@ def initialize_mpd(config):
     client = MPDClient()
     client.connect(config.mpd.host, config.mpd.port)
 
-    return client
+    return stats.timed_mpd(client)
+
+
+async def initialize_async_mpd(config):
+    """
+    Return an asyncio MPD client connection
+    """
+    client = AsyncMPDClient()
+    await client.connect(config.mpd.host, config.mpd.port)
+
+    return stats.timed_mpd(client)
 
 
 def initialize_lastfm(config):
@@ -837,13 +1002,9 @@ def update_mpd(config):
 
 
 def _update_lastfm(config, session):
-    scrobbles_start = session.query(Scrobble).count()
-
     lastfm = initialize_lastfm(config)
     scrobble_loader = ScrobbleLoader(lastfm, config)
-    scrobble_loader.load_recent_scrobbles(session)
-
-    new_scrobbles = session.query(Scrobble).count() - scrobbles_start
+    new_scrobbles = scrobble_loader.load_recent_scrobbles(session)
 
     logger.info('Inserted %d scrobbles', new_scrobbles)
 
@@ -870,7 +1031,7 @@ def update_database(config):
 
     try:
         update_lastfm(config)
-    except LastfmError as exc:
+    except lastfm_errors() as exc:
         logger.error('Could not contact LastFM server during database update')
         logger.debug('Encountered exception', exc_info=exc)
 
@@ -882,6 +1043,7 @@ def reinitialize_scrobbles(config):
     with session_scope(config) as session:
         session.query(Scrobble).delete()
         session.query(ScrobbleInfo).delete()
+        catalog.clear_plays(session)
         _update_lastfm(config, session)
 
 
@@ -902,21 +1064,21 @@ def load_scrobble_batch(session, lastfm, conf, batch):
 ######################################################################
 
 def get_db_track(conf, track_id):
-    with session_scope(conf, commit=False) as session:
+    with session_scope(conf, read_only=True) as session:
         return session.query(Track).\
             options(
-                subqueryload(Track.album),
-                subqueryload(Track.artist),
-                subqueryload(Track.lastfm_info)
+                joinedload(Track.album),
+                joinedload(Track.artist),
+                joinedload(Track.lastfm_info)
             ).\
             get(track_id)
 
 
 def lastfm_love(lastfm, track, loved):
     method = lastfm.love_track if loved else lastfm.unlove_track
-    success = method(track.artist.name, track.name)
+    success = method(track.artist_name, track.name)
     logger.info("Marking '%s - %s' %s... %s",
-                track.artist.name,
+                track.artist_name,
                 track.name,
                 'loved' if loved else 'unloved',
                 'successful' if success else 'failed')
@@ -940,9 +1102,11 @@ def db_track_love(conf, track, loved=True):
 
         # Mark loved in DB
         db_track_info.loved = bool(loved)
+        catalog.set_loved(session, [track.id], loved)
 
 
 def db_album_ignore(conf, album, ignore=True):
     with session_scope(conf, commit=True) as session:
         db_album = session.query(Album).get(album.id)
         db_album.ignored = ignore
+        catalog.set_ignored(session, album.id, ignore)
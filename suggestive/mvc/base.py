@@ -1,6 +1,8 @@
 import asyncio
 import logging
 
+from suggestive.threads import submit_write
+
 
 logger = logging.getLogger('suggestive')
 logger.addHandler(logging.NullHandler())
@@ -13,6 +15,10 @@ class Model(object):
     will be updated when the model is.
     """
 
+    # Subclasses that are instantiated once per row should also define
+    # __slots__
+    __slots__ = ('_views',)
+
     def __init__(self):
         self._views = []
 
@@ -61,9 +67,14 @@ class Controller(object):
     Note that controllers should be de facto singletons.  If you instantiate
     more than one instance of any controller, it will be registered in place of
     the existing controller.
+
+    Controllers that are expensive to construct may instead register a factory
+    with 'register_factory', which is called the first time the controller is
+    requested.
     """
 
     _registry = {}
+    _factories = {}
 
     def __init__(self, model, conf, loop):
         self._model = model
@@ -93,12 +104,38 @@ class Controller(object):
     def conf(self):
         return self._conf
 
-    def controller_for(self, name):
-        return self._registry[name.lower()]
+    @classmethod
+    def register_factory(cls, name, factory):
+        """
+        Register a function that constructs (and therefore registers) the named
+        controller when it is first requested
+        """
+        cls._factories[name.lower()] = factory
+
+    def controller_for(self, name, create=True):
+        """
+        Return the named controller.  If it has not been constructed yet,
+        construct it using its registered factory, or return None if `create`
+        is False
+        """
+        name = name.lower()
+        if name not in self._registry:
+            if not create:
+                return None
+            self._factories[name]()
+
+        return self._registry[name]
 
     def async_run(self, func, *args):
         asyncio.ensure_future(self.loop.run_in_executor(None, func, *args))
 
+    def async_write(self, func, *args):
+        """
+        Submit a database mutation to the database writer thread.  Return an
+        asyncio future that completes once it has been written
+        """
+        return asyncio.wrap_future(submit_write(func, *args), loop=self.loop)
+
 
 ######################################################################
 # Common models
@@ -107,39 +144,41 @@ class Controller(object):
 class TrackModel(Model):
 
     """
-    Represents an album track with LastFM metadata.
+    Represents an album track with LastFM metadata.  The track is an immutable
+    TrackRecord; assign a new record to change it
     """
 
-    def __init__(self, db_track, number):
+    __slots__ = ('_track', '_number')
+
+    def __init__(self, track, number):
         super(TrackModel, self).__init__()
-        self._db_track = db_track
+        self._track = track
         self._number = number
 
     @property
-    def db_track(self):
-        return self._db_track
+    def track(self):
+        return self._track
 
-    @db_track.setter
-    def db_track(self, track):
-        self._db_track = track
+    @track.setter
+    def track(self, track):
+        self._track = track
         self.update()
 
     @property
-    def db_album(self):
-        return self.db_track.album
+    def name(self):
+        return self._track.name
 
     @property
-    def db_artist(self):
-        return self.db_track.artist
+    def artist_name(self):
+        return self._track.artist_name
 
     @property
-    def name(self):
-        return self.db_track.name
+    def album_name(self):
+        return self._track.album_name
 
     @property
     def loved(self):
-        info = self.db_track.lastfm_info
-        return info and info.loved
+        return self._track.loved
 
     @property
     def number(self):
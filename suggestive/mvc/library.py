@@ -3,6 +3,8 @@ import suggestive.mstat as mstat
 import suggestive.util as util
 import suggestive.analytics as analytics
 import suggestive.signals as signals
+import suggestive.snapshot as snapshot
+import suggestive.stats as stats
 from suggestive.buffer import Buffer
 from suggestive.action import lastfm_love_track
 
@@ -10,6 +12,9 @@ from suggestive.mvc.base import View, Model, Controller, TrackModel
 
 import urwid
 import logging
+import threading
+from contextlib import contextmanager
+from functools import partial
 from itertools import chain
 
 
@@ -23,9 +28,16 @@ logger.addHandler(logging.NullHandler())
 
 class AlbumModel(Model):
 
-    def __init__(self, db_album, score):
+    """
+    An album and its score.  The album is an immutable AlbumRecord; assign a
+    new record to change it
+    """
+
+    __slots__ = ('_album', '_score')
+
+    def __init__(self, album, score):
         super(AlbumModel, self).__init__()
-        self._db_album = db_album
+        self._album = album
         self._score = score
 
     @property
@@ -33,8 +45,13 @@ class AlbumModel(Model):
         return self._score
 
     @property
-    def db_album(self):
-        return self._db_album
+    def album(self):
+        return self._album
+
+    @album.setter
+    def album(self, album):
+        self._album = album
+        self.update()
 
 
 class LibraryModel(Model):
@@ -67,8 +84,8 @@ class LibraryModel(Model):
     def tracks(self):
         return self._tracks
 
-    def track_model_for(self, db_track):
-        return self.tracks.get(db_track.id)
+    def track_model_for(self, track):
+        return self.tracks.get(track.id)
 
 
 ######################################################################
@@ -86,8 +103,15 @@ class LibraryController(Controller):
         self._mpd = mstat.initialize_mpd(conf)
         self._anl = analytics.Analytics(conf)
 
-        self._orderers = None
-        self.orderers = self._default_orderers.copy()
+        # The (future, cancellation event) of the reordering in progress
+        self._reorder = None
+
+        # Batch depth, and whether albums must be reordered once it reaches 0
+        self._batch_depth = 0
+        self._batch_pending = False
+
+        self._orderers = self._default_orderers.copy()
+        self.log_orderers()
 
     @property
     def orderers(self):
@@ -108,14 +132,99 @@ class LibraryController(Controller):
         logger.debug('Orderers: {}'.format(
             ', '.join(map(repr, self.orderers))))
 
+    @property
+    def reordering(self):
+        return self._reorder is not None
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that defers reordering the albums until the end of the
+        (outermost) batch, so that several orderer changes are evaluated once
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._batch_pending:
+                self._batch_pending = False
+                self.update_model()
+
     def update_model(self):
         """
-        Set the model album order, which in turn updates the views
+        Order the albums in an executor, then set the model album order, which
+        in turn updates the views.  The current order is kept until then, and
+        any reordering still in progress is superseded.  Within a batch, the
+        albums are only ordered once the batch ends
         """
-        self.model.albums = self.order_albums()
+        if self._batch_depth:
+            self._batch_pending = True
+            return
+
+        self.cancel_reorder()
+
+        cancelled = threading.Event()
+        future = self.loop.run_in_executor(
+            None, self.order_albums, list(self._orderers), cancelled)
+        future.add_done_callback(partial(self.reorder_done, cancelled))
+        self._reorder = (future, cancelled)
+
+        urwid.emit_signal(self, signals.REORDER, True)
+
+    def cancel_reorder(self):
+        if self._reorder is None:
+            return
+
+        future, cancelled = self._reorder
+        cancelled.set()
+        future.cancel()
+        self._reorder = None
+
+    def reorder_done(self, cancelled, future):
+        if cancelled.is_set():
+            logger.debug('Discarding superseded album order')
+            return
+
+        self._reorder = None
+        exc = future.exception()
+        if exc is not None:
+            logger.error('Unable to order albums', exc_info=exc)
+        else:
+            self.model.albums = future.result()
+            self.save_snapshot(background=True)
+
+        urwid.emit_signal(self, signals.REORDER, False)
+
+    def load_snapshot(self):
+        """
+        Display the album order saved by the last session, until the albums
+        have been ordered
+        """
+        albums = snapshot.load(self.conf.general.library_snapshot)
+        if albums:
+            logger.debug('Loaded library snapshot with %d albums', len(albums))
+            self.model.albums = [
+                AlbumModel(album, score) for album, score in albums]
+
+    def save_snapshot(self, background=False):
+        """Save the current album order, optionally in an executor"""
+        rows = snapshot.album_rows(
+            (album.album, album.score) for album in self.model.albums)
+        path = self.conf.general.library_snapshot
+        if background:
+            self.async_run(snapshot.save, path, rows)
+        else:
+            snapshot.save(path, rows)
+
+    def order_albums(self, orderers=None, cancelled=None):
+        if orderers is None:
+            orderers = self._orderers
+
+        suggestions = self._anl.order_albums(orderers, cancelled)
+        if suggestions is None:
+            return None
 
-    def order_albums(self):
-        suggestions = self._anl.order_albums(self._orderers)
         return [AlbumModel(s.album, s.order) for s in suggestions]
 
     def add_orderer(self, orderer_class, *args, **kwArgs):
@@ -143,56 +252,61 @@ class LibraryController(Controller):
 
     # signal_handler
     def enqueue_album(self, view):
-        self.enqueue_tracks(self.album_tracks(view.db_album))
+        self.enqueue_tracks(self.album_tracks(view.album))
 
     # signal_handler
     def enqueue_track(self, view):
-        self.enqueue_tracks([view.db_track])
+        self.enqueue_tracks([view.track])
 
     # signal_handler
     def play_album(self, view):
-        self.play_tracks(self.album_tracks(view.db_album))
+        self.play_tracks(self.album_tracks(view.album))
 
     # signal_handler
     def play_track(self, view):
-        self.play_tracks([view.db_track])
+        self.play_tracks([view.track])
 
     # Signal handler
     def love_track(self, view):
-        db_track = view.model.db_track
-        if not db_track.id:
+        track = view.model.track
+        if not track.id:
             logger.error('Can not mark invalid track loved')
             return
 
         logger.info('Toggle loved for playlist track: {}'.format(
-            db_track.name))
+            track.name))
 
-        loved = db_track.lastfm_info.loved if db_track.lastfm_info else False
+        loved = not track.loved
 
-        self.async_run(lastfm_love_track, self.conf, db_track, not loved)
-        mstat.db_track_love(self.conf, db_track, loved=not loved)
+        self.async_run(lastfm_love_track, self.conf, track, loved)
+        self.async_write(mstat.db_track_love, self.conf, track, loved)
 
-        new_track = mstat.get_db_track(self.conf, db_track.id)
-        view.model.db_track = new_track
+        # Display the change without waiting for the database write
+        track = track._replace(loved=loved)
+        view.model.track = track
 
-        model = self.controller_for('playlist').track_model_for(new_track)
+        playlist = self.controller_for('playlist', create=False)
+        model = playlist and playlist.track_model_for(track)
         if model:
-            model.db_track = new_track
+            model.track = track
 
     # Signal handler
     def ignore_album(self, view):
-        db_album = view.model.db_album
-        if not db_album.id:
+        album = view.model.album
+        if not album.id:
             logger.error('Can not (un)ignore invalid album')
             return
 
+        ignore = not album.ignored
         logger.info('Toggle ignored for playlist album: %s, ignore=%s',
-                    db_album.name, not db_album.ignored)
+                    album.name, ignore)
 
-        mstat.db_album_ignore(self.conf, db_album,
-                              ignore=not db_album.ignored)
+        written = self.async_write(mstat.db_album_ignore, self.conf, album,
+                                   ignore)
+        written.add_done_callback(lambda _: self.update_model())
 
-        self.update_model()
+        # Display the change without waiting for the database write
+        view.model.album = album._replace(ignored=ignore)
 
     @mstat.mpd_retry
     def mpd_tracks(self, tracks):
@@ -234,6 +348,9 @@ class LibraryController(Controller):
             reverse=True)
 
 
+urwid.register_signal(LibraryController, [signals.REORDER])
+
+
 ######################################################################
 # Views
 ######################################################################
@@ -253,15 +370,15 @@ class TrackView(urwid.WidgetWrap, View, widget.Searchable):
     def __init__(self, model, conf):
         View.__init__(self, model)
 
-        self.content = model.db_track
+        self.content = model.track
         self._icon = urwid.SelectableIcon(self.text)
 
         super(TrackView, self).__init__(
             urwid.AttrMap(self._icon, 'track', 'focus track'))
 
     @property
-    def db_track(self):
-        return self.model.db_track
+    def track(self):
+        return self.model.track
 
     @property
     def text(self):
@@ -306,7 +423,7 @@ class AlbumView(urwid.WidgetWrap, View, widget.Searchable):
     def __init__(self, model, conf):
         View.__init__(self, model)
 
-        self.content = model.db_album
+        self.content = model.album
         self._expanded = False
 
         self._show_score = conf.library.show_score
@@ -320,8 +437,8 @@ class AlbumView(urwid.WidgetWrap, View, widget.Searchable):
         return self._model.score
 
     @property
-    def db_album(self):
-        return self._model.db_album
+    def album(self):
+        return self._model.album
 
     @property
     def show_score(self):
@@ -329,8 +446,8 @@ class AlbumView(urwid.WidgetWrap, View, widget.Searchable):
 
     @property
     def canonical_text(self):
-        album = self.db_album
-        return '{} - {}'.format(album.artist.name, album.name)
+        album = self.album
+        return '{} - {}'.format(album.artist_name, album.name)
 
     @property
     def searchable_text(self):
@@ -338,7 +455,7 @@ class AlbumView(urwid.WidgetWrap, View, widget.Searchable):
 
     @property
     def text(self):
-        if self.db_album.ignored:
+        if self.album.ignored:
             return '{} [I]'.format(self.canonical_text)
 
         if self.show_score:
@@ -354,6 +471,9 @@ class AlbumView(urwid.WidgetWrap, View, widget.Searchable):
     def expanded(self, value):
         self._expanded = value
 
+    def update(self):
+        self._w.original_widget.set_text(self.text)
+
 
 class LibraryView(widget.SuggestiveListBox, View):
     def __init__(self, model, controller, conf):
@@ -370,6 +490,7 @@ class LibraryView(widget.SuggestiveListBox, View):
     def controller(self):
         return self._controller
 
+    @stats.timed
     def update(self):
         logger.debug('Updating LibraryView')
         walker = self.body
@@ -410,13 +531,13 @@ class LibraryView(widget.SuggestiveListBox, View):
         return urwid.SimpleFocusListWalker(body)
 
     def expand_album(self, view):
-        album = view.db_album
+        album = view.album
         current = self.focus_position
 
         album_tracks = self.controller.album_tracks(album)
         sorted_tracks = self.controller.sort_tracks(album_tracks)
-        for track_no, db_track in sorted_tracks:
-            model = TrackModel(db_track, track_no)
+        for track_no, track in sorted_tracks:
+            model = TrackModel(track, track_no)
             track_view = TrackView(model, self._conf)
 
             urwid.connect_signal(
@@ -438,7 +559,7 @@ class LibraryView(widget.SuggestiveListBox, View):
                 self.controller.love_track)
 
             self.body.insert(current + 1, track_view)
-            self.controller.model.tracks[db_track.id] = model
+            self.controller.model.tracks[track.id] = model
 
         view.expanded = True
         self.set_focus_valign('top')
@@ -450,10 +571,10 @@ class LibraryView(widget.SuggestiveListBox, View):
     def collapse_album(self, view):
         album_index = self.album_index(view)
 
-        album_tracks = self.controller.album_tracks(view.db_album)
+        album_tracks = self.controller.album_tracks(view.album)
         for i in range(len(album_tracks)):
             track_view = self.body.pop(album_index + 1)
-            del self.controller.model.tracks[track_view.model.db_track.id]
+            del self.controller.model.tracks[track_view.model.track.id]
 
         view.expanded = False
         self.body.set_focus(album_index)
@@ -487,15 +608,40 @@ class LibraryBuffer(Buffer):
         self.model = LibraryModel([])
         self.controller = LibraryController(self.model, conf, loop)
         self.view = LibraryView(self.model, self.controller, conf)
+        self.status = 'Library'
 
         super(LibraryBuffer, self).__init__(self.view)
 
-        # Set up default orderers
-        self.init_default_orderers(conf)
-        self.controller.set_current_order_as_default()
+        urwid.connect_signal(self.controller, signals.REORDER,
+                             self.update_reorder_status)
+
+        # Show the last known order while the albums are ordered
+        self.controller.load_snapshot()
+
+        # Set up default orderers, ordering the library once they are all set
+        with self.controller.batch():
+            self.controller.update_model()
+            self.init_default_orderers(conf)
+            self.controller.set_current_order_as_default()
 
         self.update_status('Library')
 
+    def update_status(self, value):
+        """
+        Update the status footer, noting whether the albums are being
+        reordered
+        """
+        if isinstance(value, str):
+            self.status = value
+            if self.controller.reordering:
+                value = '{} | reordering...'.format(value)
+
+        super(LibraryBuffer, self).update_status(value)
+
+    def update_reorder_status(self, reordering):
+        self.update_status(self.status)
+        self.redraw()
+
     def search(self, searcher):
         self.view.search(searcher)
 
@@ -526,9 +672,10 @@ class LibraryBuffer(Buffer):
         orderers = {}
         for name, cmds in conf.custom_orderers.items():
             def orderer_cmd(cmds=cmds):
-                for cmd in cmds:
-                    logger.debug('order: {}'.format(cmd))
-                    self.execute_command(cmd)
+                with self.controller.batch():
+                    for cmd in cmds:
+                        logger.debug('order: {}'.format(cmd))
+                        self.execute_command(cmd)
             orderers[name] = orderer_cmd
 
         return orderers
@@ -1,6 +1,7 @@
 import suggestive.widget as widget
 import suggestive.mstat as mstat
 import suggestive.signals as signals
+import suggestive.stats as stats
 from suggestive.error import CommandError
 from suggestive.mvc.base import View, Model, Controller, TrackModel
 from suggestive.buffer import Buffer
@@ -60,7 +61,7 @@ class PlaylistModel(Model):
         self.update_playlist_tracks()
 
     def track_ids(self, tracks):
-        return [track.db_track.id for track in tracks]
+        return [track.track.id for track in tracks]
 
     def update_playlist_tracks(self):
         self._playlist_tracks = {
@@ -86,6 +87,9 @@ class PlaylistController(Controller):
         # Connections
         self._mpd = mstat.initialize_mpd(conf)
 
+        # (playlist, current track) that an asynchronous update is looking up
+        self._updating = None
+
         # Initialize
         self.update_model()
 
@@ -110,24 +114,25 @@ class PlaylistController(Controller):
         logger.info('Toggle loved for playlist track: {}'.format(
             view.canonical_text))
 
-        db_track = view.model.db_track
-        if not db_track.id:
+        track = view.model.track
+        if not track.id:
             logger.error('Can not mark invalid track loved')
             return
 
-        loved = db_track.lastfm_info.loved if db_track.lastfm_info else False
+        loved = not track.loved
 
-        self.async_run(lastfm_love_track, self.conf, db_track, not loved)
-        mstat.db_track_love(self.conf, db_track, loved=not loved)
+        self.async_run(lastfm_love_track, self.conf, track, loved)
+        self.async_write(mstat.db_track_love, self.conf, track, loved)
 
-        new_track = mstat.get_db_track(self.conf, db_track.id)
-        view.model.db_track = new_track
+        # Display the change without waiting for the database write
+        track = track._replace(loved=loved)
+        view.model.track = track
 
         # Update expanded track model
-        lib_ctrl = self.controller_for('library')
-        track_model = lib_ctrl.model.track_model_for(db_track)
+        lib_ctrl = self.controller_for('library', create=False)
+        track_model = lib_ctrl and lib_ctrl.model.track_model_for(track)
         if track_model:
-            track_model.db_track = new_track
+            track_model.track = track
 
     @mstat.mpd_retry
     def clear(self):
@@ -156,7 +161,10 @@ class PlaylistController(Controller):
 
     @mstat.mpd_retry
     def now_playing(self):
-        current = self._mpd.currentsong()
+        return self.current_position(self._mpd.currentsong())
+
+    @staticmethod
+    def current_position(current):
         if current and 'pos' in current:
             return int(current['pos'])
         else:
@@ -165,12 +173,12 @@ class PlaylistController(Controller):
     def playlist_tracks(self, playlist, positions):
         logger.debug('Get playlist tracks from db')
 
-        db_tracks = mstat.database_tracks_from_mpd(self.conf, playlist)
+        tracks = mstat.database_tracks_from_mpd(self.conf, playlist)
 
         logger.debug('Create models')
         return [
-            TrackModel(db_track, position)
-            for db_track, position in zip(db_tracks, positions)
+            TrackModel(track, position)
+            for track, position in zip(tracks, positions)
         ]
 
     def track_models(self, playlist, current_tracks):
@@ -183,7 +191,7 @@ class PlaylistController(Controller):
         for position, item in enumerate(playlist):
             if item['id'] in current_tracks:
                 track = TrackModel(
-                    current_tracks[item['id']].db_track,
+                    current_tracks[item['id']].track,
                     position)
                 new_tracks[position] = track
             else:
@@ -200,36 +208,100 @@ class PlaylistController(Controller):
 
         return new_tracks
 
+    def playlist_changed(self, playlist, now_playing):
+        """
+        Return True if the playlist or current track differ from the model, or
+        from the playlist that is being looked up if an update is in progress
+        """
+        if self._updating is not None:
+            latest = self._updating
+        else:
+            latest = (self.model.mpd_playlist, self.model.now_playing)
+
+        if (playlist, now_playing) == latest:
+            logger.debug('No playlist changes; aborting')
+            return False
+
+        return True
+
+    def set_model_playlist(self, playlist, now_playing, models):
+        """
+        Set the model's playlist, current track and track models together, so
+        that the model never pairs the new playlist with the old track models
+        """
+        logger.debug('Set model playlist and track models')
+        self.model.mpd_playlist = playlist
+        self.model.now_playing = now_playing
+        self.model.tracks = models
+
+    @stats.timed
     def update_model(self):
         logger.debug('Begin playlist model update')
         playlist = self.mpd_playlist()
         now_playing = self.now_playing()
-        if (playlist == self.model.mpd_playlist and
-                now_playing == self.model.now_playing):
-            logger.debug('No playlist changes; aborting')
+
+        # Any asynchronous update in progress is out of date
+        self._updating = None
+        if not self.playlist_changed(playlist, now_playing):
             return
 
-        logger.debug('Get current tracks')
-        current_tracks = self.model.playlist_tracks
+        logger.debug('Get track models')
+        models = self.track_models(playlist, self.model.playlist_tracks)
 
-        logger.debug('Set model playlist')
+        self.set_model_playlist(playlist, now_playing, models)
+        logger.debug('Finished playlist model update')
 
-        # Update the playlist immediately so that extraneous attempts to update
-        # the playlist will be ignored
-        self.model.mpd_playlist = playlist
-        self.model.now_playing = now_playing
+    @stats.timed
+    async def async_update_model(self, mpd):
+        """
+        Update the model using an asyncio MPD connection.  Tracks that are new
+        to the playlist are looked up in the database in an executor, and the
+        model is only changed once they have been.  An update that is started
+        during the lookup supersedes it
+        """
+        logger.debug('Begin playlist model update')
+        playlist = await mpd.playlistinfo()
+        now_playing = self.current_position(await mpd.currentsong())
+        if not self.playlist_changed(playlist, now_playing):
+            return
 
-        logger.debug('Get track models')
-        models = self.track_models(playlist, current_tracks)
+        update = self._updating = (playlist, now_playing)
+        try:
+            logger.debug('Get track models')
+            models = await self.loop.run_in_executor(
+                None, self.track_models, playlist, self.model.playlist_tracks)
 
-        logger.debug('Set track models')
-        self.model.tracks = models
-        logger.debug('Finished playlist model update')
+            if self._updating is not update:
+                logger.debug('Playlist update superseded; discarding')
+                return
+
+            self.set_model_playlist(playlist, now_playing, models)
+            logger.debug('Finished playlist model update')
+        finally:
+            if self._updating is update:
+                self._updating = None
+
+    def update_unknown_tracks(self):
+        """
+        Look up the tracks that were not in the database when they were added
+        to the playlist, after the database has been updated
+        """
+        unknown = [(model, info) for model, info in
+                   zip(self.model.tracks, self.model.mpd_playlist)
+                   if model.track.id is None]
+        if not unknown:
+            return
+
+        models, playlist = zip(*unknown)
+        tracks = mstat.database_tracks_from_mpd(self.conf, playlist)
+        for model, track in zip(models, tracks):
+            if track.id is not None:
+                model.track = track
 
-    def track_model_for(self, db_track):
+    def track_model_for(self, track):
         return next(
-            (track for track in self.model.tracks if
-             track.db_track.id == db_track.id),
+            (model for model in self.model.tracks if
+             model.track.id == track.id),
             None
         )
 
@@ -278,7 +350,7 @@ class TrackView(urwid.WidgetWrap, View, widget.Searchable):
 
         self._show_bumper = show_bumper
 
-        self.content = model.db_track
+        self.content = model.track
         self._icon = urwid.SelectableIcon(self.text)
 
         styles = self.styles(playing, focused)
@@ -320,8 +392,8 @@ class TrackView(urwid.WidgetWrap, View, widget.Searchable):
             suffix = ''
 
         text = self.TRACK_FORMAT.format(
-            artist=model.db_artist.name,
-            album=model.db_album.name,
+            artist=model.artist_name,
+            album=model.album_name,
             title=model.name,
             suffix=suffix)
 
@@ -334,8 +406,8 @@ class TrackView(urwid.WidgetWrap, View, widget.Searchable):
     def canonical_text(self):
         model = self.model
         return self.TRACK_FORMAT.format(
-            artist=model.db_artist.name,
-            album=model.db_album.name,
+            artist=model.artist_name,
+            album=model.album_name,
             title=model.name,
             suffix='')
 
@@ -397,7 +469,7 @@ class PlaylistView(widget.SuggestiveListBox, View):
                 pass
 
     def track_views(self, show_bumper=False):
-        current = self.controller.now_playing()
+        current = self.model.now_playing
         focus = self.focus_position if show_bumper else None
 
         if not self.model.tracks:
@@ -554,22 +626,28 @@ class PlaylistBuffer(Buffer):
         self.update()
 
     def now_playing_index(self, mpd):
-        current = mpd.currentsong()
-        if current and 'pos' in current:
-            return int(current['pos'])
-        else:
-            return None
+        return self.controller.current_position(mpd.currentsong())
 
     def track_changed(self):
         mpd = mstat.initialize_mpd(self.conf)
         return self.current_track != self.now_playing_index(mpd)
 
+    async def async_track_changed(self, mpd):
+        current = await mpd.currentsong()
+        return self.current_track != self.controller.current_position(current)
+
     def update(self, *args):
         self.controller.update_model()
 
+    async def async_update(self, mpd):
+        await self.controller.async_update_model(mpd)
+
     def update_playing_status(self):
         self.update_status(self.status_text())
 
+    async def async_update_playing_status(self, mpd):
+        self.update_status(await self.async_status_text(mpd))
+
     def status_params(self, status, track):
         elapsed_time = int(status.get('time', '0').split(':')[0])
         total_time = int(track.get('time', '0').split(':')[0])
@@ -604,15 +682,22 @@ class PlaylistBuffer(Buffer):
         mpd = mstat.initialize_mpd(self.conf)
         status = mpd.status()
 
-        text = ''
+        songid = status.get('songid')
+        track = mpd.playlistid(songid) if songid else None
+        return self.format_status(status, track)
+
+    async def async_status_text(self, mpd):
+        status = await mpd.status()
 
         songid = status.get('songid')
-        if songid:
-            track = mpd.playlistid(songid)
-            if track:
-                params = self.status_params(status, track[0])
-                text = self.status_format.format(**params)
-                return 'Playlist | ' + text
+        track = (await mpd.playlistid(songid)) if songid else None
+        return self.format_status(status, track)
+
+    def format_status(self, status, track):
+        if track:
+            params = self.status_params(status, track[0])
+            text = self.status_format.format(**params)
+            return 'Playlist | ' + text
 
         return 'Playlist'
 
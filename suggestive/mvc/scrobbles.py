@@ -6,7 +6,7 @@ from mpd import CommandError as MpdCommandError
 import suggestive.signals as signals
 import suggestive.mstat as mstat
 import suggestive.widget as widget
-from suggestive.mvc.base import View, Model, Controller
+from suggestive.mvc.base import View, Model, Controller, TrackModel
 from suggestive.buffer import Buffer
 
 
@@ -29,65 +29,33 @@ class DayModel(Model):
         return self._date
 
 
-class PlayModel(Model):
+class PlayModel(TrackModel):
 
-    def __init__(self, db_track):
-        super(PlayModel, self).__init__()
-        self._db_track = db_track
+    """A track played locally, which may not have been scrobbled"""
 
-    @property
-    def db_track(self):
-        return self._db_track
+    __slots__ = ()
 
-    @property
-    def db_artist(self):
-        return self._db_track.artist
+    def __init__(self, track):
+        super(PlayModel, self).__init__(track, None)
 
-    @property
-    def db_album(self):
-        return self._db_track.album
 
-    @property
-    def loved(self):
-        info = self._db_track.lastfm_info
-        return info and info.loved
+class ScrobbleModel(TrackModel):
 
+    """A scrobble, from an immutable ScrobbleRecord"""
 
-class ScrobbleModel(Model):
+    __slots__ = ('_scrobble',)
 
-    def __init__(self, db_scrobble):
-        super(ScrobbleModel, self).__init__()
-        self._db_scrobble = db_scrobble
+    def __init__(self, scrobble):
+        super(ScrobbleModel, self).__init__(scrobble.track, None)
+        self._scrobble = scrobble
 
     @property
-    def db_scrobble(self):
-        return self._db_scrobble
-
-    @db_scrobble.setter
-    def db_scrobble(self, scrobble):
-        self._db_scrobble = scrobble
-        self.update()
+    def scrobble(self):
+        return self._scrobble
 
     @property
     def date(self):
-        return self.db_scrobble.time.date()
-
-    @property
-    def db_track(self):
-        return self._db_scrobble.track
-
-    @property
-    def db_artist(self):
-        return self.db_track.artist
-
-    @property
-    def db_album(self):
-        return self.db_track.album
-
-    @property
-    def loved(self):
-        info = self.db_track.lastfm_info
-        return info and info.loved
+        return self._scrobble.time.date()
 
 
 class ScrobbleListModel(Model):
@@ -156,11 +124,34 @@ class ScrobbleListController(Controller):
         if songid != self.current_song_id:
             try:
                 info = mpd.playlistid(songid)[0]
-                db_track = mstat.database_track_from_mpd(
+                track = mstat.database_track_from_mpd(
                     self.conf,
                     info)
 
-                play_model = PlayModel(db_track)
+                play_model = PlayModel(track)
+                self.model.plays.insert(0, play_model)
+                self.model.update()
+                logger.debug('Plays: {}'.format(self.model.plays))
+
+                self.current_song_id = songid
+            except (MpdCommandError, IndexError):
+                pass
+
+    async def async_insert_new_song_played(self, mpd):
+        """
+        Like insert_new_song_played, but using an asyncio MPD connection and
+        looking up the track in the database in an executor
+        """
+        status = await mpd.status()
+
+        songid = status.get('songid')
+        if songid != self.current_song_id:
+            try:
+                info = (await mpd.playlistid(songid))[0]
+                track = await self.loop.run_in_executor(
+                    None, mstat.database_track_from_mpd, self.conf, info)
+
+                play_model = PlayModel(track)
                 self.model.plays.insert(0, play_model)
                 self.model.update()
                 logger.debug('Plays: {}'.format(self.model.plays))
@@ -213,17 +204,17 @@ class ScrobbleView(urwid.WidgetWrap, View, widget.Searchable):
             suffix = ''
 
         return self.TRACK_FORMAT.format(
-            artist=model.db_artist.name,
-            album=model.db_album.name,
-            title=model.db_track.name,
+            artist=model.artist_name,
+            album=model.album_name,
+            title=model.name,
             suffix=suffix)
 
     @property
     def canonical_text(self):
         model = self.model
         return self.TRACK_FORMAT.format(
-            artist=model.db_artist.name,
-            album=model.db_album.name,
+            artist=model.artist_name,
+            album=model.album_name,
             title=model.name,
             suffix='')
 
@@ -375,6 +366,12 @@ class ScrobbleBuffer(Buffer):
         self.body._invalidate()
         self.set_focus('body')
 
+    async def async_update(self, mpd):
+        await self.controller.async_insert_new_song_played(mpd)
+
+        self.body._invalidate()
+        self.set_focus('body')
+
     def reload(self, *args):
         self.controller.reload()
 
@@ -0,0 +1,164 @@
+"""
+cProfile across suggestive's threads.  The thread that starts the profiler,
+i.e. the thread running the urwid and asyncio loops, is profiled
+continuously; other threads are profiled while they run executor jobs and
+database writes
+"""
+
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Number of functions in the logged profile summary
+SUMMARY_LIMIT = 30
+
+
+class Profiler(object):
+
+    """
+    Collects one cProfile profile per thread, and merges them when stopped.
+    Jobs only run under a profile if they are started through `call` or
+    `wrap`
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.running = False
+        self.generation = 0
+
+        # Profile by thread name, and the threads that are running a job
+        self.profiles = {}
+        self.busy = set()
+
+    def start(self):
+        """Start profiling the calling thread, and jobs in other threads"""
+        with self.lock:
+            if self.running:
+                raise RuntimeError('Profiler is already running')
+
+            self.generation += 1
+            self.profiles.clear()
+            self.busy.clear()
+            self.running = True
+
+        profile = self._thread_profile()
+        self.local.active = True
+        profile.enable()
+
+    def stop(self):
+        """
+        Stop profiling, and return the merged pstats.Stats of every thread, or
+        None if nothing was profiled.  Must be called from the thread that
+        started the profiler.  Jobs that are still running are left out
+        """
+        with self.lock:
+            if not self.running:
+                raise RuntimeError('Profiler is not running')
+            self.running = False
+
+        self.local.profile.disable()
+        self.local.active = False
+
+        with self.lock:
+            profiles = [(name, profile)
+                        for name, profile in sorted(self.profiles.items())
+                        if name not in self.busy]
+            for name in sorted(self.busy):
+                logger.warning('Job still running in thread %s; leaving it '
+                               'out of the profile', name)
+
+        merged = None
+        for name, profile in profiles:
+            try:
+                stats = pstats.Stats(profile)
+            except TypeError:
+                # Nothing ran under this profile
+                continue
+
+            if merged is None:
+                merged = stats
+            else:
+                merged.add(stats)
+
+        return merged
+
+    def _thread_profile(self):
+        """Return the calling thread's profile for the current run"""
+        if getattr(self.local, 'generation', None) != self.generation:
+            self.local.profile = cProfile.Profile()
+            self.local.generation = self.generation
+            self.local.active = False
+
+            with self.lock:
+                self.profiles[threading.current_thread().name] = \
+                    self.local.profile
+
+        return self.local.profile
+
+    def call(self, func, *args, **kwArgs):
+        """Call func, under this thread's profile if profiling is running"""
+        if not self.running or getattr(self.local, 'active', False):
+            return func(*args, **kwArgs)
+
+        name = threading.current_thread().name
+        profile = self._thread_profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12 and later allow only one active profiler, which
+            # already profiles every thread
+            return func(*args, **kwArgs)
+
+        self.local.active = True
+        with self.lock:
+            self.busy.add(name)
+
+        try:
+            return func(*args, **kwArgs)
+        finally:
+            profile.disable()
+            self.local.active = False
+            with self.lock:
+                self.busy.discard(name)
+
+    def wrap(self, func):
+        """Return func wrapped so that it runs through `call`"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwArgs):
+            return self.call(func, *args, **kwArgs)
+
+        return wrapper
+
+
+class ProfiledExecutor(ThreadPoolExecutor):
+
+    """Thread pool whose jobs are profiled while the profiler is running"""
+
+    def __init__(self, profiler, *args, **kwArgs):
+        super(ProfiledExecutor, self).__init__(*args, **kwArgs)
+        self.profiler = profiler
+
+    def submit(self, fn, *args, **kwArgs):
+        return super(ProfiledExecutor, self).submit(
+            self.profiler.call, fn, *args, **kwArgs)
+
+
+def summary(stats, limit=SUMMARY_LIMIT, sort='cumulative'):
+    """Return the top functions of a pstats.Stats as text"""
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+# Profiler shared by the whole application
+profiler = Profiler()
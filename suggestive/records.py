@@ -0,0 +1,95 @@
+"""
+Immutable read records of albums, tracks and scrobbles.  Models and views hold
+these instead of ORM instances, so each row costs a tuple of ids, display
+strings and flags rather than a session-bound object graph.  Records are built
+from column queries; the ORM is only used to write
+"""
+
+from collections import namedtuple
+
+from suggestive.db.model import Album, Artist, Track, LastfmTrackInfo
+
+
+# Shown for tracks that MPD knows about but the database does not
+UNKNOWN = 'Unknown'
+
+
+class AlbumRecord(namedtuple(
+        'AlbumRecord', 'id name artist_id artist_name ignored')):
+
+    __slots__ = ()
+
+
+class TrackRecord(namedtuple(
+        'TrackRecord',
+        'id name filename album_id album_name artist_id artist_name loved')):
+
+    __slots__ = ()
+
+
+class ScrobbleRecord(namedtuple('ScrobbleRecord', 'id time track')):
+
+    __slots__ = ()
+
+
+class Interner(object):
+
+    """
+    Share one string object between equal strings, e.g. the artist name of
+    every track by that artist
+    """
+
+    def __init__(self):
+        self.strings = {}
+
+    def __call__(self, value):
+        return self.strings.setdefault(value, value)
+
+
+######################################################################
+# Column queries
+######################################################################
+
+def album_query(session):
+    """Query the columns of AlbumRecord"""
+    return session.query(Album.id, Album.name, Album.artist_id, Artist.name,
+                         Album.ignored).\
+        outerjoin(Artist, Album.artist_id == Artist.id)
+
+
+def track_query(session, *columns):
+    """Query the columns of TrackRecord, followed by any extra columns"""
+    return session.query(Track.id, Track.name, Track.filename,
+                         Track.album_id, Album.name, Track.artist_id,
+                         Artist.name, LastfmTrackInfo.loved, *columns).\
+        outerjoin(Album, Track.album_id == Album.id).\
+        outerjoin(Artist, Track.artist_id == Artist.id).\
+        outerjoin(LastfmTrackInfo, LastfmTrackInfo.track_id == Track.id)
+
+
+######################################################################
+# Record construction
+######################################################################
+
+def album_records(rows, intern=None):
+    intern = intern or Interner()
+    return [
+        AlbumRecord(id, name, artist_id, intern(artist_name), bool(ignored))
+        for id, name, artist_id, artist_name, ignored in rows
+    ]
+
+
+def track_records(rows, intern=None):
+    intern = intern or Interner()
+    return [
+        TrackRecord(id, name, filename, album_id, intern(album_name),
+                    artist_id, intern(artist_name), bool(loved))
+        for (id, name, filename, album_id, album_name, artist_id, artist_name,
+             loved) in rows
+    ]
+
+
+def unknown_track(filename, name):
+    """Return a TrackRecord for a file that is not in the database"""
+    return TrackRecord(None, name, filename, None, UNKNOWN, None, UNKNOWN,
+                       False)
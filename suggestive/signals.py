@@ -33,4 +33,6 @@ UPDATE_INDEX = 'update_index'
 SET_FOCUS = 'set_focus'
 SET_FOOTER = 'set_footer'
 SET_STATUS = 'set_status'
+REDRAW = 'redraw'
+REORDER = 'reorder'
 IGNORE = 'ignore'
@@ -0,0 +1,72 @@
+"""
+On-disk snapshot of the last library ordering, so that the library can be
+displayed at startup before the real ordering has been computed
+"""
+
+import json
+import logging
+import os
+
+from suggestive.records import AlbumRecord
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+VERSION = 1
+
+
+def album_rows(albums):
+    """Return snapshot rows for a list of (AlbumRecord, score) pairs"""
+    return [
+        (album.id, album.artist_name, album.name, bool(album.ignored), score)
+        for album, score in albums
+    ]
+
+
+def save(path, rows):
+    """Atomically write the snapshot rows to path"""
+    data = {'version': VERSION, 'albums': rows}
+    temp_path = '{}.tmp'.format(path)
+    try:
+        with open(temp_path, 'w') as handle:
+            json.dump(data, handle, separators=(',', ':'))
+
+        os.replace(temp_path, path)
+    except OSError as exc:
+        logger.error('Unable to save library snapshot to %s', path,
+                     exc_info=exc)
+        return False
+
+    logger.debug('Saved library snapshot with %d albums', len(rows))
+    return True
+
+
+def load(path):
+    """
+    Return the list of (AlbumRecord, score) pairs saved in the snapshot at
+    path, or an empty list if there is no usable snapshot.  The records do not
+    have an artist id
+    """
+    try:
+        with open(path) as handle:
+            data = json.load(handle)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as exc:
+        logger.warning('Unable to read library snapshot %s', path,
+                       exc_info=exc)
+        return []
+
+    if not isinstance(data, dict) or data.get('version') != VERSION:
+        logger.info('Ignoring library snapshot with unknown version')
+        return []
+
+    try:
+        return [
+            (AlbumRecord(id, name, None, artist, ignored), score)
+            for id, artist, name, ignored, score in data['albums']
+        ]
+    except (KeyError, TypeError, ValueError) as exc:
+        logger.warning('Invalid library snapshot %s', path, exc_info=exc)
+        return []
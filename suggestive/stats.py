@@ -0,0 +1,211 @@
+"""
+Timing statistics for suggestive's expensive operations, e.g. album ordering,
+playlist updates and MPD commands.  Timing is disabled by default, in which
+case timed functions cost one extra function call
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Upper bounds, in seconds, of the latency histogram buckets.  The last bucket
+# holds everything slower
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Client methods that are not timed as MPD commands
+UNTIMED_MPD_METHODS = frozenset(('connect', 'disconnect', 'idle', 'noidle'))
+
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return '{:.1f}ms'.format(seconds * 1000)
+    return '{:.2f}s'.format(seconds)
+
+
+class TimingStats(object):
+
+    """Call count and latency histogram for a single operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    @property
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.histogram[bisect_left(BUCKETS, elapsed)] += 1
+
+    def format_histogram(self):
+        labels = ['<={}'.format(format_seconds(bound)) for bound in BUCKETS]
+        labels.append('>{}'.format(format_seconds(BUCKETS[-1])))
+
+        return ' '.join('{}:{}'.format(label, count)
+                        for label, count in zip(labels, self.histogram)
+                        if count)
+
+    def __str__(self):
+        return 'count={} total={} mean={} max={} [{}]'.format(
+            self.count,
+            format_seconds(self.total),
+            format_seconds(self.mean),
+            format_seconds(self.max),
+            self.format_histogram())
+
+
+class StatsRegistry(object):
+
+    """
+    Thread-safe collection of TimingStats by operation name.  Nothing is
+    recorded unless `enabled` is set
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, elapsed):
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = TimingStats()
+            stats.record(elapsed)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+    @contextmanager
+    def timer(self, name):
+        """Context manager that times its body as the given operation"""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, func=None, name=None):
+        """
+        Decorator that times each call to a function or coroutine function.
+        The operation name defaults to the function's qualified name
+        """
+        if func is None:
+            return functools.partial(self.timed, name=name)
+
+        name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwArgs):
+                if not self.enabled:
+                    return await func(*args, **kwArgs)
+
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwArgs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwArgs):
+            if not self.enabled:
+                return func(*args, **kwArgs)
+
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwArgs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    def summary(self, limit=None):
+        """
+        Return a list of (name, TimingStats) pairs, ordered by total time
+        spent, descending
+        """
+        with self.lock:
+            items = sorted(self.stats.items(),
+                           key=lambda item: item[1].total,
+                           reverse=True)
+
+        return items[:limit] if limit is not None else items
+
+    def log_stats(self):
+        for name, stats in self.summary():
+            logger.info('Timing %s: %s', name, stats)
+
+
+class TimedMpdClient(object):
+
+    """
+    Proxy for a MPD client, sync or asyncio, that times every MPD command as
+    the operation mpd.<command>.  Asyncio commands are timed until their
+    result is ready
+    """
+
+    def __init__(self, client, registry):
+        self._client = client
+        self._registry = registry
+
+    def __getattr__(self, attr):
+        value = getattr(self._client, attr)
+        if attr.startswith('_') or attr in UNTIMED_MPD_METHODS or \
+                not callable(value):
+            return value
+
+        name = 'mpd.{}'.format(attr)
+        registry = self._registry
+
+        def command(*args):
+            start = time.perf_counter()
+            result = value(*args)
+            if isinstance(result, asyncio.Future):
+                result.add_done_callback(
+                    lambda _: registry.record(
+                        name, time.perf_counter() - start))
+            else:
+                registry.record(name, time.perf_counter() - start)
+
+            return result
+
+        return command
+
+
+# Registry shared by the whole application
+registry = StatsRegistry()
+timed = registry.timed
+timer = registry.timer
+
+
+def timed_mpd(client):
+    """
+    Return the MPD client wrapped so that its commands are timed, if timing is
+    enabled
+    """
+    if not registry.enabled:
+        return client
+    return TimedMpdClient(client, registry)
@@ -1,23 +1,21 @@
 import suggestive.mstat as mstat
+from suggestive.catalog import catalog
 from suggestive.util import partition
+from suggestive.lastfm import lastfm_errors
 from suggestive.db.session import session_scope
+from suggestive.profiling import profiler
 
-from pylastfm import LastfmError
 import threading
 import logging
 import traceback
-from queue import PriorityQueue, Empty
+from concurrent.futures import Future, TimeoutError
+from queue import Queue, Empty
 
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
-# Synchronization primitives
-db_lock = threading.Lock()
-updating_database = threading.Event()
-
-
 def log_errors(cls):
     orig_run = cls.run
 
@@ -34,40 +32,18 @@ def log_errors(cls):
     return cls
 
 
-class PriorityEventQueue(PriorityQueue):
-
-    unique = {'player', 'playlist', 'database'}
-
-    def __init__(self):
-        self.events = set()
-        self.set_lock = threading.Lock()
-        super(PriorityEventQueue, self).__init__()
-
-    def in_queue(self, event):
-        return (
-            event in self.events and
-            event in self.unique
-        )
-
-    def put(self, item, *args, **kwArgs):
-        with self.set_lock:
-            event = item[-1]
-            if self.in_queue(event):
-                logger.debug('{} already in queue'.format(item))
-                return
-
-            self.events.add(event)
-            super(PriorityEventQueue, self).put(item, *args, **kwArgs)
-
-    def get(self, *args, **kwArgs):
-        item = super(PriorityEventQueue, self).get(*args, **kwArgs)
-        with self.set_lock:
-            event = item[-1]
-            self.events.discard(event)
-            return item
+# Database mutations waiting to be run by the DatabaseWriter
+write_queue = Queue()
 
 
-event_queue = PriorityEventQueue()
+def submit_write(func, *args, **kwArgs):
+    """
+    Queue a database mutation to be run by the database writer thread.  Return
+    a concurrent.futures.Future for its result
+    """
+    future = Future()
+    write_queue.put((future, func, args, kwArgs))
+    return future
 
 
 class AppThread(threading.Thread):
@@ -78,80 +54,33 @@ class AppThread(threading.Thread):
         super(AppThread, self).__init__(*args, **kwArgs)
         self.quit_event = quit_event
 
+    def wait_for(self, future, timeout=1):
+        """
+        Wait for a future to complete and return its result.  Return None
+        instead if the application exits first
+        """
+        while not self.quit_event.is_set():
+            try:
+                return future.result(timeout)
+            except TimeoutError:
+                pass
 
-class MpdObserver(AppThread):
-
-    """
-    database: the song database has been modified after update.
-    update: a database update has started or finished. If the database was
-        modified during the update, the database event is also emitted.
-    stored_playlist: a stored playlist has been modified, renamed, created or
-        deleted
-    playlist: the current playlist has been modified
-    player: the player has been started, stopped or seeked
-    mixer: the volume has been changed
-    output: an audio output has been enabled or disabled
-    options: options like repeat, random, crossfade, replay gain
-    sticker: the sticker database has been modified.
-    subscription: a client has subscribed or unsubscribed to a channel
-    message: a message was received on a channel this client is subscribed to;
-        this event is only emitted when the queue is empty
-    """
-
-    order = (
-        'player',
-        'playlist',
-        'database',
-        'update',
-        'stored_playlist',
-        'mixer',
-        'output',
-        'options',
-        'sticker',
-        'subscription',
-        'message',
-    )
-
-    def __init__(self, conf, events, quit_event):
-        super(MpdObserver, self).__init__(quit_event)
-
-        self.conf = conf
-        self.events = events
-        self.priorities = self.build_priority()
-
-        # Thread properties
-        self.daemon = True
-
-    def build_priority(self):
-        return {event: i for i, event in enumerate(self.order)}
-
-    def consume_event(self, event):
-        callback = self.events.get(event)
-        if not callable(callback):
-            logger.error('Event {} has no associated callback'.format(
-                event))
-            return
-
-        priority = self.priorities.get(event, 0)
-        event_queue.put((priority, callback))
+        future.cancel()
 
-    def run(self):
-        mpd = mstat.initialize_mpd(self.conf)
-
-        while not self.quit_event.is_set():
-            logger.debug('MPD: idle')
-            changes = mpd.idle()
-            logger.debug('Mpd changes: {}'.format(changes))
-            for change in changes:
-                self.consume_event(change)
 
+@log_errors
+class DatabaseWriter(AppThread):
 
-class EventDispatcher(AppThread):
+    """
+    Run all database mutations, one at a time, in the order in which they were
+    submitted.  Since SQLite only allows a single writer, every other thread
+    only needs read-only sessions, which are never blocked by a long update
+    """
 
     default_timeout = 1
 
     def __init__(self, quit_event, timeout=None):
-        super(EventDispatcher, self).__init__(quit_event)
+        super(DatabaseWriter, self).__init__(quit_event)
         if timeout is None:
             timeout = self.default_timeout
 
@@ -160,40 +89,135 @@ class EventDispatcher(AppThread):
     def run(self):
         while not self.quit_event.is_set():
             try:
-                _, callback = event_queue.get(True, self.timeout)
-                callback()
+                future, func, args, kwArgs = write_queue.get(
+                    True, self.timeout)
             except Empty:
-                pass
+                continue
 
+            if not future.set_running_or_notify_cancel():
+                continue
 
+            try:
+                future.set_result(profiler.call(func, *args, **kwArgs))
+            except Exception as exc:
+                logger.error('Database write %s failed', func.__name__,
+                             exc_info=exc)
+                future.set_exception(exc)
+
+        # Don't leave anyone waiting on writes that will never happen
+        while True:
+            try:
+                future, *_ = write_queue.get_nowait()
+            except Empty:
+                break
+
+            future.cancel()
+
+
+@log_errors
 class DatabaseUpdater(AppThread):
 
-    def __init__(self, conf, quit_event, update_status):
+    """
+    Update the database from MPD and LastFM whenever an update is requested.
+    Requests that arrive less than `delay` seconds apart are coalesced into a
+    single update, and any requests that arrive while an update is running
+    cause exactly one more update once it has finished
+    """
+
+    default_delay = 2
+    default_timeout = 1
+
+    def __init__(self, conf, quit_event, update_status, finished,
+                 delay=None, timeout=None):
         super(DatabaseUpdater, self).__init__(quit_event)
+        if delay is None:
+            delay = self.default_delay
+        if timeout is None:
+            timeout = self.default_timeout
+
         self.conf = conf
         self.update_status = update_status
+        self.finished = finished
+        self.delay = float(delay)
+        self.timeout = float(timeout)
+
+        self.requested = threading.Event()
+        self.running = False
+        self.n_requests = 0
+
         self.daemon = False
 
+    @property
+    def status(self):
+        """Return a short description of the update queue, if not idle"""
+        if self.running and self.requested.is_set():
+            return 'updating database; update queued'
+        elif self.running:
+            return 'updating database...'
+        elif self.requested.is_set():
+            return 'database update queued'
+        else:
+            return None
+
+    def request(self):
+        """Request a database update"""
+        self.n_requests += 1
+        self.requested.set()
+        (self.update_status)()
+
+    def wait_until_quiet(self):
+        """
+        Wait until no update has been requested for `delay` seconds.  Return
+        False if the application exits first
+        """
+        n_requests = None
+        while n_requests != self.n_requests:
+            n_requests = self.n_requests
+            if self.quit_event.wait(self.delay):
+                return False
+
+        return True
+
     def run(self):
-        if updating_database.is_set():
-            logger.debug('Ignoring database update; already running')
-            return
+        while not self.quit_event.is_set():
+            if not self.requested.wait(self.timeout):
+                continue
 
-        logger.debug('Waiting for database lock')
-        with db_lock:
-            if self.quit_event.is_set():
+            if not self.wait_until_quiet():
                 return
 
-            logger.info('Starting database update')
-            updating_database.set()
+            logger.info('Starting database update (%d requests)',
+                        self.n_requests)
+            self.n_requests = 0
+            self.running = True
+            self.requested.clear()
+            (self.update_status)()
 
-            mstat.update_database(self.conf)
+            try:
+                self.update()
+            finally:
+                self.running = False
 
-            logger.debug('Finished database update')
-            updating_database.clear()
+            if self.quit_event.is_set():
+                return
 
+            logger.debug('Finished database update')
+            (self.finished)()
             (self.update_status)()
 
+    def update(self):
+        try:
+            # Submit MPD and LastFM updates separately, so that other writes,
+            # e.g. scrobble initialization, can be interleaved
+            self.wait_for(submit_write(mstat.update_mpd, self.conf))
+            self.wait_for(submit_write(mstat.update_lastfm, self.conf))
+        except lastfm_errors() as exc:
+            logger.error(
+                'Could not contact LastFM server during database update')
+            logger.debug('Encountered exception', exc_info=exc)
+
+        catalog.save()
+
 
 @log_errors
 class ScrobbleInitializeThread(AppThread):
@@ -211,14 +235,14 @@ class ScrobbleInitializeThread(AppThread):
         logger.info('Start initializing scrobbles')
 
         lastfm = mstat.initialize_lastfm(conf)
-        with session_scope(conf) as session:
+        with session_scope(conf, read_only=True) as session:
             earliest = mstat.earliest_scrobble(session)
 
         try:
             batches = partition(
                 lastfm.scrobbles(conf.lastfm.user, end=earliest),
                 200)
-        except LastfmError as exc:
+        except lastfm_errors() as exc:
             logger.error('Could not contact LastFM server', exc_info=exc)
             batches = []
 
@@ -226,17 +250,17 @@ class ScrobbleInitializeThread(AppThread):
             if self.quit_event.is_set():
                 return
 
-            logger.debug('ScrobbleInitializeThread: Waiting for lock')
+            # Wait for each batch to be written, so that scrobbles are not
+            # fetched from LastFM faster than they can be loaded
+            self.wait_for(submit_write(self.load_batch, lastfm, batch))
 
-            with db_lock:
-                logger.debug('ScrobbleInitializeThread: Acquired lock')
-
-                with session_scope(conf) as session:
-                    mstat.load_scrobble_batch(session, lastfm, conf, batch)
-
-        with db_lock:
-            with session_scope(conf) as session:
-                mstat.ScrobbleLoader.delete_duplicates(session)
+        if self.quit_event.is_set():
+            return
 
         logger.info('Finished initializing scrobbles')
+        catalog.save()
         (self.callback)()
+
+    def load_batch(self, lastfm, batch):
+        with session_scope(self.conf) as session:
+            return mstat.load_scrobble_batch(session, lastfm, self.conf, batch)
@@ -1,7 +1,6 @@
 import suggestive.bindings as bindings
 import suggestive.signals as signals
 
-from unidecode import unidecode
 import urwid
 import logging
 
@@ -198,7 +197,11 @@ class Searchable(object):
 
     def search_text(self, fuzzy_unicode=False):
         text = self.searchable_text
-        return unidecode(text) if fuzzy_unicode else text
+        if not fuzzy_unicode:
+            return text
+
+        from unidecode import unidecode
+        return unidecode(text)
 
 
 class SelectableScrobble(urwid.WidgetWrap):
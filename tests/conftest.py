@@ -1,5 +1,7 @@
 from suggestive.config import Config
+from suggestive.db.session import initialize, Session, ReadSession
 
+import os
 import pytest
 from configparser import RawConfigParser
 from tempfile import NamedTemporaryFile, mkdtemp
@@ -49,3 +51,17 @@ def mock_config(config_dir):
 
         with patch('suggestive.config.CONFIG_PATHS', [temp.name]):
             return Config()
+
+
+@pytest.fixture
+def database(request, mock_config):
+    """Initialize an empty suggestive database for a single test"""
+    initialize(mock_config)
+
+    @request.addfinalizer
+    def remove_database():
+        Session.remove()
+        ReadSession.remove()
+        os.remove(mock_config.general.database)
+
+    return mock_config
@@ -0,0 +1,40 @@
+from suggestive.app import Application
+
+import pytest
+import urwid
+from unittest.mock import patch, MagicMock
+
+
+@pytest.fixture
+def app():
+    app = MagicMock()
+    app.conf.playlist.save_playlist_on_close = True
+    app.conf.playlist.playlist_save_name = 'saved'
+    app.save_mpd_playlist = lambda name: Application.save_mpd_playlist(
+        app, name)
+    return app
+
+
+@patch('suggestive.app.mstat')
+def test_exit_saves_playlist_without_buffer(mstat, app):
+    app.top.loaded_buffer.return_value = None
+    mpd = mstat.initialize_mpd.return_value
+    mpd.rm.side_effect = Exception('No such playlist')
+
+    with pytest.raises(urwid.ExitMainLoop):
+        Application.exit(app)
+
+    mpd.rm.assert_called_once_with('saved')
+    mpd.save.assert_called_once_with('saved')
+    app.top.buffer.assert_not_called()
+
+
+@patch('suggestive.app.mstat')
+def test_exit_saves_playlist_with_buffer(mstat, app):
+    playlist = app.top.loaded_buffer.return_value
+
+    with pytest.raises(urwid.ExitMainLoop):
+        Application.exit(app)
+
+    playlist.save_playlist.assert_called_once_with('saved')
+    mstat.initialize_mpd.assert_not_called()
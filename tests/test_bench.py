@@ -0,0 +1,77 @@
+from suggestive.bench.datagen import Dataset
+from suggestive.bench import runner
+from suggestive.bench.scenarios import SCENARIOS
+
+import pytest
+from unittest.mock import patch
+
+
+@pytest.fixture(scope='module')
+def env(request):
+    dataset = Dataset(artists=4, albums_per_artist=2, tracks_per_album=5,
+                      scrobbles=200, loved_rate=0.2)
+    env = runner.Environment(dataset)
+    request.addfinalizer(env.close)
+    return env
+
+
+@pytest.mark.parametrize('name', list(SCENARIOS))
+def test_scenario(env, name):
+    result = runner.run_scenario(env, name, repeat=1)
+
+    assert result['wall_time'] > 0
+    assert result['queries'] >= 0
+    assert result['peak_memory'] > 0
+
+
+def test_mpd_sync_loads_library(env):
+    _, full, _ = runner.run_once(env, 'mpd_sync')
+    _, incremental, _ = runner.run_once(env, 'mpd_sync_incremental')
+
+    assert 0 < incremental < full
+
+
+def test_run_in_process(env):
+    env.reset_database(1.0, True)
+    result = runner.run_in_process(env, 'library_load')
+
+    assert result['wall_time'] > 0
+    assert result['queries'] > 0
+    assert result['peak_rss'] >= result['baseline_rss'] > 0
+
+
+def result(wall_time, queries, peak_memory):
+    return dict(wall_time=wall_time, queries=queries,
+                peak_memory=peak_memory)
+
+
+def test_regressions():
+    before = {
+        'same': result(1.0, 10, 1000),
+        'slower': result(1.0, 10, 1000),
+        'queries': result(1.0, 10, 1000),
+        'removed': result(1.0, 10, 1000),
+    }
+    after = {
+        'same': result(1.05, 10, 1050),
+        'slower': result(1.5, 10, 1000),
+        'queries': result(0.5, 11, 500),
+        'added': result(1.0, 10, 1000),
+    }
+
+    assert runner.regressions(before, after) == [
+        ('queries', 'queries', 10, 11),
+        ('slower', 'wall_time', 1.0, 1.5),
+    ]
+    assert runner.regressions(before, after, threshold=1.0) == [
+        ('queries', 'queries', 10, 11),
+    ]
+
+
+@pytest.mark.parametrize('repeat', ['0', '-1'])
+def test_repeat_must_be_positive(repeat):
+    with patch('sys.argv', ['bench', 'run', '--repeat', repeat]), \
+            pytest.raises(SystemExit) as exc:
+        runner.main()
+
+    assert exc.value.code == 2
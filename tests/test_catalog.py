@@ -0,0 +1,205 @@
+from suggestive.catalog import Catalog, Table, database_generation
+from suggestive.db.model import (
+    Artist, Album, Track, Scrobble, LastfmTrackInfo)
+from suggestive.db.session import (
+    session_scope, initialize, Session, ReadSession)
+
+import os
+import pytest
+from datetime import datetime
+
+
+@pytest.fixture
+def library(database):
+    with session_scope(database) as session:
+        artist = Artist(name='Artist')
+        album = Album(name='Album', artist=artist)
+        loved = Track(name='Loved', filename='loved.mp3', album=album,
+                      artist=artist, lastfm_info=LastfmTrackInfo(loved=True))
+        plain = Track(name='Plain', filename='plain.mp3', album=album,
+                      artist=artist)
+        session.add_all([loved, plain])
+        session.add_all([
+            Scrobble(time=datetime(2014, 5, day), track=plain)
+            for day in (1, 2, 3)
+        ])
+
+    return database
+
+
+@pytest.fixture
+def catalog(library):
+    catalog = Catalog()
+    catalog.ensure_loaded(library)
+    return catalog
+
+
+def add_track(session, name):
+    session.execute(Track.__table__.insert(), [
+        dict(name=name, filename='{}.mp3'.format(name), album_id=1,
+             artist_id=1)])
+
+
+def ignore_album(session, catalog, ignored=True):
+    session.execute(Album.__table__.update().values(ignored=ignored))
+    catalog.set_ignored(session, 1, ignored)
+
+
+def test_load(catalog):
+    [album] = catalog.album_records()
+    assert (album.name, album.artist_name, album.ignored) == \
+        ('Album', 'Artist', False)
+
+    tracks = catalog.album_tracks(album.id)
+    assert [(track.name, track.album_name, track.artist_name, track.loved)
+            for track in tracks] == [
+        ('Loved', 'Album', 'Artist', True),
+        ('Plain', 'Album', 'Artist', False),
+    ]
+
+    assert catalog.album_totals() == {album.id: (2, 1, 3)}
+    assert set(catalog.tracks_by_filename(['plain.mp3', 'missing.mp3'])) == \
+        {'plain.mp3'}
+
+
+def test_changes_applied_on_commit(catalog, library):
+    with session_scope(library) as session:
+        add_track(session, 'New')
+        catalog.update_tracks(session, ['New.mp3'])
+        catalog.delete_tracks(session, ['loved.mp3'])
+        catalog.set_ignored(session, 1)
+
+        # Nothing changes until the session commits
+        assert 'New.mp3' not in catalog.filenames
+
+    assert [track.name for track in catalog.album_tracks(1)] == \
+        ['Plain', 'New']
+    assert catalog.album(1).ignored
+
+
+def test_changes_discarded_on_rollback(catalog, library):
+    with pytest.raises(ValueError):
+        with session_scope(library) as session:
+            add_track(session, 'New')
+            catalog.update_tracks(session, ['New.mp3'])
+            catalog.set_loved(session, [2])
+            raise ValueError
+
+    # The next commit does not apply the discarded changes
+    with session_scope(library) as session:
+        catalog.clear_plays(session)
+
+    tracks = catalog.album_tracks(1)
+    assert [(track.name, track.loved) for track in tracks] == \
+        [('Loved', True), ('Plain', False)]
+    assert catalog.album_totals() == {1: (2, 1, 0)}
+
+
+def test_reload_on_new_database(catalog, library):
+    Session.remove()
+    ReadSession.remove()
+    initialize(library)
+    with session_scope(library) as session:
+        session.query(Track).filter(Track.name == 'Loved').delete()
+
+    catalog.ensure_loaded(library)
+    assert [track.name for track in catalog.album_tracks(1)] == ['Plain']
+
+
+def test_generation(catalog, library):
+    with session_scope(library, read_only=True) as session:
+        assert database_generation(session) == catalog.generation == 0
+
+    with session_scope(library) as session:
+        catalog.set_loved(session, [2])
+        ignore_album(session, catalog)
+
+    with session_scope(library, read_only=True) as session:
+        generation = database_generation(session)
+
+    assert generation == catalog.generation != 0
+
+    with session_scope(library) as session:
+        catalog.set_loved(session, [2], False)
+
+    assert catalog.generation == generation + 1
+
+
+def test_snapshot(catalog, library):
+    # A database that has never been changed has no snapshot
+    assert not catalog.save()
+
+    with session_scope(library) as session:
+        add_track(session, 'New')
+        catalog.update_tracks(session, ['New.mp3'])
+        ignore_album(session, catalog)
+    assert catalog.save()
+
+    opened = Catalog()
+    assert opened.open(library)
+    assert opened.generation == catalog.generation
+    assert opened.album_records() == catalog.album_records()
+    assert opened.album_tracks(1) == catalog.album_tracks(1)
+    assert opened.album_totals() == catalog.album_totals()
+    assert opened.tracks_by_filename(['New.mp3']) == \
+        catalog.tracks_by_filename(['New.mp3'])
+
+    # The opened catalog is kept up to date like a loaded one
+    with session_scope(library) as session:
+        add_track(session, 'Newer')
+        opened.update_tracks(session, ['Newer.mp3'])
+        opened.delete_tracks(session, ['loved.mp3', 'plain.mp3'])
+    assert [track.name for track in opened.album_tracks(1)] == \
+        ['New', 'Newer']
+
+    assert opened.save()
+    reopened = Catalog()
+    reopened.ensure_loaded(library)
+    assert reopened.album_tracks(1) == opened.album_tracks(1)
+
+
+def test_stale_snapshot(catalog, library):
+    with session_scope(library) as session:
+        ignore_album(session, catalog)
+    assert catalog.save()
+
+    # Changed after the snapshot was saved
+    with session_scope(library) as session:
+        ignore_album(session, catalog, False)
+
+    assert not Catalog().open(library)
+
+
+def test_invalid_snapshot(catalog, library):
+    with session_scope(library) as session:
+        ignore_album(session, catalog)
+    assert catalog.save()
+
+    path = library.general.catalog_snapshot
+    with open(path, 'r+b') as handle:
+        handle.truncate(os.path.getsize(path) - 1)
+
+    opened = Catalog()
+    assert not opened.open(library)
+
+    # Loaded from the database instead
+    opened.ensure_loaded(library)
+    assert opened.album(1).ignored
+
+
+def test_table_compact():
+    table = Table(('names', None), ('counts', 'l'))
+    for id in range(1, 5):
+        table.set(id, str(id), id * 10)
+
+    table.delete(2)
+    assert table.deleted == 1
+    assert len(table.ids) == 4
+
+    # Compacted once more than half of the rows are deleted
+    table.delete(1)
+    table.delete(4)
+    assert table.deleted == 0
+    assert list(table.ids) == [3]
+    assert table.names[table.rows[3]] == '3'
+    assert table.counts[table.rows[3]] == 30
@@ -58,8 +58,19 @@ def test_empty_config():
     assert conf.general.log == '$HOME/.suggestive/log.txt'
     assert not conf.general.verbose
     assert not conf.general.log_sql_queries
+    assert not conf.general.timing_stats
+    assert conf.general.similar_query_threshold == 50
     assert conf.general.session_file == '$HOME/.suggestive/session'
+    assert conf.general.library_snapshot == '$HOME/.suggestive/library.json'
+    assert conf.general.catalog_snapshot == '$HOME/.suggestive/catalog.bin'
     assert not conf.general.update_on_startup
+    assert conf.general.database_update_delay == 2.0
+    assert conf.general.journal_mode == 'wal'
+    assert conf.general.synchronous == 'normal'
+    assert conf.general.cache_size == -32768
+    assert conf.general.mmap_size == 268435456
+    assert conf.general.temp_store == 'memory'
+    assert conf.general.busy_timeout == 5000
 
     assert conf.mpd.host == 'localhost'
     assert conf.mpd.port == 6600
@@ -122,3 +133,13 @@ def test_custom_orderers(orderers, result):
         conf = Config(argv)
 
     assert conf.custom_orderers == result
+
+
+def test_sqlite_settings():
+    with make_config(general={'journal_mode': 'DELETE', 'synchronous': 'full',
+                              'busy_timeout': -1}) as argv:
+        conf = Config(argv)
+
+    assert conf.general.journal_mode == 'delete'
+    assert conf.general.synchronous == 'full'
+    assert conf.general.busy_timeout == 0
@@ -0,0 +1,62 @@
+from suggestive.bench.datagen import Dataset
+from suggestive.db.session import session_scope
+from suggestive.db.model import Album, Track, Scrobble, ScrobbleInfo
+import suggestive.migrate as migrate
+
+
+def summary(dataset):
+    return (
+        [track.mpd_info() for track in dataset.tracks],
+        [(s.artist, s.album, s.title, s.time) for s in dataset.scrobbles],
+    )
+
+
+def test_deterministic():
+    first = Dataset(artists=5, scrobbles=200, seed=3)
+    second = Dataset(artists=5, scrobbles=200, seed=3)
+    other = Dataset(artists=5, scrobbles=200, seed=4)
+
+    assert summary(first) == summary(second)
+    assert summary(first) != summary(other)
+
+
+def test_counts():
+    dataset = Dataset(artists=4, albums_per_artist=3, tracks_per_album=7,
+                      scrobbles=500)
+
+    assert len(dataset.tracks) == 4 * 3 * 7
+    assert len({t.filename for t in dataset.tracks}) == len(dataset.tracks)
+    assert len(dataset.scrobbles) == 500
+
+    times = [s.time for s in dataset.scrobbles]
+    assert times == sorted(times, reverse=True)
+
+
+def test_unicode_and_typos():
+    plain = Dataset(artists=10, scrobbles=300, unicode_density=0,
+                    typo_rate=0)
+    assert all(t.artist.isascii() and t.title.isascii() for t in plain.tracks)
+    assert all((s.artist, s.album, s.title) ==
+               (s.track.artist, s.track.album, s.track.title)
+               for s in plain.scrobbles)
+
+    fancy = Dataset(artists=10, scrobbles=300, unicode_density=1,
+                    typo_rate=1)
+    assert not any(t.artist.isascii() for t in fancy.tracks)
+    assert all((s.artist, s.album, s.title) !=
+               (s.track.artist, s.track.album, s.track.title)
+               for s in fancy.scrobbles)
+
+
+def test_write_database(database):
+    dataset = Dataset(artists=3, albums_per_artist=2, tracks_per_album=5,
+                      scrobbles=100)
+    dataset.write_database(database, track_fraction=0.5)
+
+    with session_scope(database, commit=False) as session:
+        assert session.query(Album).count() == 3
+        assert session.query(Track).count() == 15
+        assert session.query(Scrobble).count() == 100
+        assert session.query(ScrobbleInfo).count() > 0
+
+    assert migrate.current_revision(database) == migrate.HEAD_REVISION
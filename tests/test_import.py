@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+
+# Cumulative time, in microseconds, that `import suggestive.app` may take
+IMPORT_BUDGET = 1000000
+
+# Slow dependencies that must only be imported when they are first used
+DEFERRED_MODULES = {'alembic', 'pylastfm', 'unidecode', 'requests'}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times():
+    """
+    Return a dict of module name to cumulative import time (in microseconds)
+    for `import suggestive.app`, as reported by `python -X importtime`
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-W', 'ignore', '-c',
+         'import suggestive.app'],
+        stderr=subprocess.PIPE, universal_newlines=True, cwd=ROOT, env=env,
+        check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def test_deferred_imports():
+    imported = {name.split('.')[0] for name in import_times()}
+    assert not DEFERRED_MODULES & imported
+
+
+def test_import_budget():
+    # Take the best of a few runs, to avoid failing due to a busy machine
+    best = min(import_times()['suggestive.app'] for _ in range(3))
+    assert best < IMPORT_BUDGET
@@ -0,0 +1,87 @@
+from suggestive.bench.datagen import Dataset
+from suggestive.bench.lastfmserver import LastfmServer
+from suggestive.config import Config
+from suggestive.db.session import session_scope
+from suggestive.db.model import LastfmTrackInfo, Scrobble
+from suggestive.lastfm import LastFM
+import suggestive.mstat as mstat
+
+import pytest
+import pylastfm
+
+
+@pytest.fixture
+def dataset():
+    return Dataset(artists=3, albums_per_artist=2, tracks_per_album=5,
+                   scrobbles=450, loved_rate=0.3)
+
+
+@pytest.fixture
+def server(request, dataset):
+    server = LastfmServer(dataset)
+    server.start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+@pytest.fixture
+def conf(server, database):
+    data = database.to_dict()
+    data['lastfm']['url'] = server.url
+
+    with open(data['general']['session_file'], 'w') as handle:
+        handle.write('sessionkey')
+
+    return Config(configuration=data)
+
+
+def test_scrobbles(conf, dataset):
+    lastfm = LastFM(conf)
+
+    scrobbles = list(lastfm.scrobbles('user'))
+    assert len(scrobbles) == 450
+    assert [s.name for s in scrobbles] == [s.title for s in dataset.scrobbles]
+
+    middle = dataset.scrobbles[200].time
+    recent = list(lastfm.scrobbles('user', start=middle))
+    assert 200 <= len(recent) < 210
+
+
+def test_loved_tracks(conf, dataset, server):
+    lastfm = LastFM(conf)
+    track = dataset.tracks[0]
+
+    loved = {(t.artist_name, t.name) for t in lastfm.loved_tracks('user')}
+    assert loved == {(t.artist, t.title) for t in dataset.loved_tracks}
+
+    assert lastfm.love_track(track.artist, track.title)
+    assert (track.artist, track.title) in server.loved
+
+    assert lastfm.unlove_track(track.artist, track.title)
+    assert (track.artist, track.title) not in server.loved
+
+
+def test_rate_limit(conf, server):
+    server.rate_limit_every = 2
+    lastfm = LastFM(conf)
+
+    list(lastfm.loved_tracks('user'))
+    with pytest.raises(pylastfm.APIError):
+        list(lastfm.loved_tracks('user'))
+
+    assert server.errors == 1
+
+
+def test_loaders(conf, dataset):
+    dataset.write_database(conf, scrobbles=False)
+    lastfm = LastFM(conf)
+
+    with session_scope(conf) as session:
+        mstat.ScrobbleLoader(lastfm, conf).load_scrobbles(session)
+        mstat.TrackInfoLoader(lastfm, conf).load(session)
+
+    with session_scope(conf, commit=False) as session:
+        assert session.query(Scrobble).count() > 0
+        n_loved = session.query(LastfmTrackInfo).filter_by(loved=True).count()
+
+    assert n_loved == len(dataset.loved_tracks)
@@ -1,17 +1,20 @@
 from suggestive.mvc import library
+from suggestive.mvc.base import Controller
+from suggestive.records import AlbumRecord
+import suggestive.analytics as analytics
+import suggestive.signals as signals
 
+import asyncio
+import os
 import pytest
-from unittest.mock import Mock
+import threading
+import urwid
+from unittest.mock import Mock, patch
 
 
 @pytest.fixture
 def model():
-    artist = Mock()
-    artist.name = 'Test Artist'
-
-    album = Mock(ignored=False, artist=artist)
-    album.name = 'Test Album'
-
+    album = AlbumRecord(1, 'Test Album', 1, 'Test Artist', False)
     return library.AlbumModel(album, 1.0)
 
 
@@ -34,10 +37,144 @@ def test_without_score(model):
 
 
 def test_ignored(model):
-    model.db_album.ignored = True
+    model.album = model.album._replace(ignored=True)
     conf = Mock(library=Mock(show_score=False))
 
     v = library.AlbumView(model, conf)
 
     assert v.text == 'Test Artist - Test Album [I]'
     assert v.score == 1.0
+
+
+def test_album_update(model):
+    conf = Mock(library=Mock(show_score=False))
+    v = library.AlbumView(model, conf)
+
+    model.album = model.album._replace(ignored=True)
+    assert v._icon.text == 'Test Artist - Test Album [I]'
+
+    with pytest.raises(AttributeError):
+        model.album.ignored = False
+
+
+@pytest.fixture
+def controller(request, config_dir):
+    patchers = [patch('suggestive.mvc.library.mstat.initialize_mpd'),
+                patch('suggestive.mvc.library.analytics.Analytics')]
+    for patcher in patchers:
+        patcher.start()
+
+    loop = asyncio.new_event_loop()
+
+    def fin():
+        for patcher in patchers:
+            patcher.stop()
+        Controller._registry.clear()
+        loop.close()
+
+    request.addfinalizer(fin)
+
+    conf = Mock()
+    conf.general.library_snapshot = os.path.join(config_dir, 'library.json')
+
+    ctrl = library.LibraryController(library.LibraryModel([]), conf, loop)
+    loop.run_until_complete(asyncio.sleep(0.05))
+    return ctrl
+
+
+def test_reorder_supersedes(controller):
+    release = threading.Event()
+    first, second = Mock(order=1.0), Mock(order=2.0)
+
+    def order_albums(orderers, cancelled):
+        if not release.is_set():
+            release.wait(1)
+            return None if cancelled.is_set() else [first]
+        return [second]
+
+    controller._anl.order_albums.side_effect = order_albums
+    reorders = []
+    urwid.connect_signal(controller, signals.REORDER, reorders.append)
+
+    controller.update_model()
+    assert controller.reordering
+
+    release.set()
+    controller.update_model()
+    controller.loop.run_until_complete(asyncio.sleep(0.05))
+
+    assert not controller.reordering
+    assert [a.album for a in controller.model.albums] == [second.album]
+    assert reorders == [True, True, False]
+
+
+def test_reorder_keeps_order_on_error(controller):
+    album = Mock(order=1.0)
+    controller._anl.order_albums.return_value = [album]
+    controller.update_model()
+    controller.loop.run_until_complete(asyncio.sleep(0.05))
+
+    controller._anl.order_albums.side_effect = ValueError('oops')
+    controller.update_model()
+    controller.loop.run_until_complete(asyncio.sleep(0.05))
+
+    assert not controller.reordering
+    assert [a.album for a in controller.model.albums] == [album.album]
+
+
+def test_batch_orders_once(controller):
+    controller._anl.order_albums.return_value = []
+
+    with controller.batch():
+        controller.add_orderer(analytics.FractionLovedOrder)
+        with controller.batch():
+            controller.add_orderer(analytics.PlaycountOrder)
+        assert not controller.reordering
+
+    assert controller.reordering
+    controller.loop.run_until_complete(asyncio.sleep(0.05))
+
+    assert controller._anl.order_albums.call_count == 1
+    orderers, _ = controller._anl.order_albums.call_args[0]
+    assert [type(o) for o in orderers] == [
+        analytics.BaseOrder,
+        analytics.FractionLovedOrder,
+        analytics.PlaycountOrder]
+
+
+def test_reorder_saves_snapshot(controller):
+    album = AlbumRecord(1, 'Album', 1, 'Artist', False)
+    controller._anl.order_albums.return_value = [
+        Mock(album=album, order=2.0)]
+
+    controller.update_model()
+    controller.loop.run_until_complete(asyncio.sleep(0.05))
+
+    controller.model.albums = []
+    controller.load_snapshot()
+
+    [album] = controller.model.albums
+    assert album.album.id == 1
+    assert album.album.artist_name == 'Artist'
+    assert album.score == 2.0
+
+
+def test_modified_order_matches_whole_album_names():
+    live, leeds, unknown = [
+        AlbumRecord(id, name, 1, 'Artist', False)
+        for id, name in enumerate(['Live', 'Live at Leeds', 'Unknown'], 1)
+    ]
+
+    mpd = Mock()
+    mpd.listallinfo.return_value = [
+        {'album': 'live', 'last-modified': '2014-01-01T00:00:00Z'},
+        {'album': 'Live at Leeds', 'last-modified': '2015-01-01T00:00:00Z'},
+        {'album': ['Live', 'Other'], 'last-modified': '2013-01-01T00:00:00Z'},
+        {'file': 'untagged.mp3', 'last-modified': '2016-01-01T00:00:00Z'},
+    ]
+
+    # Names match ignoring case, but not as substrings of longer names, and
+    # albums that MPD doesn't know about come first
+    order = analytics.ModifiedOrder().order([leeds, unknown, live], None, mpd)
+    assert order == {unknown: 1, live: 2, leeds: 3}
+    mpd.listallinfo.assert_called_once_with()
@@ -0,0 +1,34 @@
+from suggestive.memory import MemoryTracker, object_counts
+from suggestive.mvc.base import TrackModel
+
+import tracemalloc
+
+
+def test_object_counts():
+    models = [TrackModel(None, None) for _ in range(5)]
+    assert object_counts()['suggestive.mvc.base.TrackModel'] >= len(models)
+
+
+def test_snapshots():
+    tracker = MemoryTracker()
+    assert not tracker.tracing
+
+    try:
+        report = tracker.take()
+        assert report.baseline
+        assert tracker.tracing
+
+        models = [TrackModel(None, None) for _ in range(100)]
+        report = tracker.take()
+
+        assert not report.baseline
+        assert report.traced_change > 0
+        assert report.allocations
+        assert report.count_changes['suggestive.mvc.base.TrackModel'] >= \
+            len(models)
+        assert 'TrackModel' in str(report)
+    finally:
+        tracker.stop()
+
+    assert not tracemalloc.is_tracing()
+    assert not tracker.tracing
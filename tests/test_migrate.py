@@ -0,0 +1,38 @@
+from suggestive import migrate
+from suggestive.db.session import session_scope
+
+import pytest
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from unittest.mock import patch
+
+
+def test_head_revision(mock_config):
+    script = ScriptDirectory.from_config(migrate.alembic_conf(mock_config))
+    assert script.get_current_head() == migrate.HEAD_REVISION
+
+
+def stamp(conf, revision):
+    with session_scope(conf) as session:
+        session.execute(text(
+            'CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL)'))
+        session.execute(
+            text('INSERT INTO alembic_version VALUES (:revision)'),
+            {'revision': revision})
+
+
+@pytest.mark.parametrize('revision, upgraded', [
+    (migrate.HEAD_REVISION, False),
+    ('bb1854a2dbf8', True),
+    (None, True),
+])
+def test_migrate_only_when_needed(database, mock_config, revision, upgraded):
+    if revision is not None:
+        stamp(mock_config, revision)
+
+    assert migrate.current_revision(mock_config) == revision
+
+    with patch('alembic.command.upgrade') as upgrade:
+        migrate.migrate(mock_config)
+
+    assert upgrade.called == upgraded
@@ -0,0 +1,127 @@
+from suggestive.bench.datagen import Dataset
+from suggestive.bench.mpdserver import MpdServer
+from suggestive.db.session import session_scope
+from suggestive.db.model import Track
+import suggestive.mstat as mstat
+
+import asyncio
+import pytest
+from mpd import MPDClient, CommandError
+from mpd.asyncio import MPDClient as AsyncMPDClient
+from unittest.mock import patch
+
+
+@pytest.fixture
+def dataset():
+    return Dataset(artists=3, albums_per_artist=2, tracks_per_album=4,
+                   scrobbles=0)
+
+
+@pytest.fixture
+def server(request, dataset):
+    server = MpdServer(dataset.mpd_catalog())
+    server.address = server.start_thread()
+    request.addfinalizer(server.stop_thread)
+    return server
+
+
+@pytest.fixture
+def client(request, server):
+    client = MPDClient()
+    client.connect(*server.address)
+    request.addfinalizer(client.disconnect)
+    return client
+
+
+def test_library(client, dataset):
+    track = dataset.tracks[0]
+
+    files = [item['file'] for item in client.list('file')]
+    assert files == [t.filename for t in dataset.tracks]
+
+    [info] = client.listallinfo(track.filename)
+    assert info['title'] == track.title
+    assert info['albumartist'] == track.artist
+
+    assert len(client.find('album', track.album)) == 4
+    assert len(client.search('title', track.title.lower())) >= 1
+
+    directories = {item['directory'] for item in client.lsinfo()}
+    assert directories == {t.artist for t in dataset.tracks}
+
+
+def test_playlist(client, dataset):
+    first, second = dataset.tracks[:2]
+
+    status = client.status()
+    assert status['playlistlength'] == '0'
+
+    client.command_list_ok_begin()
+    client.addid(first.filename)
+    client.addid(second.filename)
+    ids = client.command_list_end()
+    version = client.status()['playlist']
+
+    client.move(1, 0)
+    assert [t['file'] for t in client.playlistinfo()] == [
+        second.filename, first.filename]
+    assert len(client.plchanges(version)) == 2
+
+    client.playid(ids[0])
+    assert client.currentsong()['id'] == ids[0]
+    assert client.status()['state'] == 'play'
+
+    with pytest.raises(CommandError):
+        client.addid('missing.flac')
+
+
+def test_idle(server, dataset):
+    async def run():
+        client = AsyncMPDClient()
+        await client.connect(*server.address)
+
+        changes = []
+
+        async def watch():
+            async for subsystems in client.idle(['playlist']):
+                changes.append(subsystems)
+                return
+
+        task = asyncio.ensure_future(watch())
+        await asyncio.sleep(0.05)
+        await client.addid(dataset.tracks[0].filename)
+        await asyncio.wait_for(task, 1)
+
+        client.disconnect()
+        await asyncio.sleep(0.01)
+        return changes
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(run()) == [['playlist']]
+    finally:
+        loop.close()
+
+
+def test_update(client):
+    assert 'updating_db' not in client.status()
+
+    update_id = client.update()
+    assert client.idle('database') == ['database']
+    assert 'updating_db' not in client.status()
+    assert int(client.update()) == int(update_id) + 1
+
+
+def test_mpd_loader(client, dataset, database):
+    dataset.write_database(database, track_fraction=0.5, scrobbles=False)
+
+    with patch('suggestive.mstat.initialize_mpd', return_value=client):
+        loader = mstat.MpdLoader(database)
+
+    with session_scope(database) as session:
+        loader.load(session)
+
+    with session_scope(database, commit=False) as session:
+        filenames = {t.filename for t in session.query(Track)}
+
+    assert filenames == {t.filename for t in dataset.tracks}
@@ -1,65 +1,78 @@
 import os.path
+import pytest
 from contextlib import contextmanager
+from datetime import datetime
 from unittest.mock import patch, MagicMock
 
 from suggestive import mstat
-from suggestive.db.model import Track
+from suggestive.db.model import Artist, Album, Scrobble, Track
+from suggestive.db.session import session_scope
+from suggestive.records import TrackRecord
 
 
+@patch('suggestive.mstat.catalog')
 @patch('suggestive.mstat.MpdLoader')
-def test_playlist_tracks_missing(mpd_loader, mock_config):
+def test_playlist_tracks_missing(mpd_loader, catalog, mock_config):
     """Test that, if the mpd playlist has tracks that don't exist in the
-    playlist, we attempt to load them into the databse, and if that fails, a
-    placeholder is returned"""
+    database, a placeholder is returned for them, and they are left for the
+    database writer to load"""
 
     track1_info = {'file': '/path/to/track1.mp3', 'title': 'test track one'}
     track2_info = {'file': '/path/to/track2.mp3'}
 
-    track1 = Track(name=track1_info['title'], filename=track1_info['file'])
+    track1 = (1, track1_info['title'], track1_info['file'], 1, 'Album', 1,
+              'Artist', None)
+
+    # Neither track is in the catalog
+    catalog.tracks_by_filename.return_value = {}
 
     session = MagicMock()
-    (session.query.return_value.options.return_value.filter.return_value
-     .all.side_effect) = (
-        [track1],
-        [],
-    )
+    track_query = MagicMock()
+    track_query.return_value.filter.return_value.all.return_value = [track1]
 
     @contextmanager
     def make_session(*args, **kwargs):
         yield session
 
-    with patch('suggestive.mstat.session_scope', make_session):
+    with patch('suggestive.mstat.session_scope', make_session), \
+            patch('suggestive.mstat.records.track_query', track_query):
         tracks = mstat.database_tracks_from_mpd(
             mock_config, [track1_info, track2_info])
         assert len(tracks) == 2
-        assert tracks[0] == track1
+        assert tracks[0] == TrackRecord(*track1[:-1], loved=False)
 
         track2 = tracks[1]
+        assert track2.id is None
         assert track2.name == os.path.basename(track2_info['file'])
         assert track2.filename == track2_info['file']
 
-    mpd_loader.return_value.load_mpd_tracks.assert_called_with(
-        session, [track2_info['file']])
+    mpd_loader.assert_not_called()
 
 
-def test_duplicate_filenames(mock_config):
+@patch('suggestive.mstat.catalog')
+def test_duplicate_filenames(catalog, mock_config):
     """Test that the cardinality of the database tracks returned is the same
     as the input list of MPD track information"""
     track1_info = {'file': 'filename1', 'title': 'track one'}
     track2_info = {'file': 'filename2', 'title': 'track two'}
 
-    track1, track2 = (Track(name=info['title'], filename=info['file'])
-                      for info in (track1_info, track2_info))
+    track1, track2 = ((id, info['title'], info['file'], 1, 'Album', 1,
+                       'Artist', False)
+                      for id, info in enumerate((track1_info, track2_info)))
+
+    catalog.tracks_by_filename.return_value = {}
 
     session = MagicMock()
-    (session.query.return_value.options.return_value.filter.return_value
-     .all.return_value) = [track1, track2]
+    track_query = MagicMock()
+    track_query.return_value.filter.return_value.all.return_value = [
+        track1, track2]
 
     @contextmanager
     def make_session(*args, **kwargs):
         yield session
 
-    with patch('suggestive.mstat.session_scope', make_session):
+    with patch('suggestive.mstat.session_scope', make_session), \
+            patch('suggestive.mstat.records.track_query', track_query):
         tracks = mstat.database_tracks_from_mpd(
             mock_config, [track1_info, track2_info, track1_info])
 
@@ -107,3 +120,80 @@ class TestMpdLoader:
         loader._mpd_info(None)
 
         assert init_mpd.call_count == 2
+
+
+class TestScrobbleLoader:
+
+    @staticmethod
+    def fm_track(artist, album, name, date):
+        track = MagicMock(artist_name=artist, album_name=album, date=date)
+        track.name = name
+        return track
+
+    def test_duplicate_scrobbles_ignored(self, database):
+        when = datetime(2014, 5, 6, 12, 0)
+        scrobbles = [
+            self.fm_track('Artist', 'Album', 'Track', when),
+            self.fm_track('Artist', 'Album', 'Track', when),
+        ]
+
+        loader = mstat.ScrobbleLoader(MagicMock(), database)
+        for _ in range(2):
+            with session_scope(database) as session:
+                loader.load_scrobbles_from_list(session, scrobbles)
+
+        with session_scope(database, commit=False) as session:
+            assert session.query(Scrobble).count() == 1
+
+    def test_existing_scrobble_matched_to_track(self, database):
+        when = datetime(2014, 5, 6, 12, 0)
+        scrobble = self.fm_track('Artist', 'Album', 'Track', when)
+
+        loader = mstat.ScrobbleLoader(MagicMock(), database)
+        with session_scope(database) as session:
+            loader.load_scrobbles_from_list(session, [scrobble])
+
+        with session_scope(database) as session:
+            artist = Artist(name='Artist')
+            album = Album(name='Album', artist=artist)
+            session.add(Track(name='Track', filename='track.mp3', album=album,
+                              artist=artist))
+
+        loader = mstat.ScrobbleLoader(MagicMock(), database)
+        with session_scope(database) as session:
+            loader.load_scrobbles_from_list(session, [scrobble])
+
+        with session_scope(database, commit=False) as session:
+            db_scrobble = session.query(Scrobble).one()
+            assert db_scrobble.track.filename == 'track.mp3'
+
+
+@pytest.mark.parametrize('query', [
+    'SELECT MAX(time) FROM scrobble',
+    'SELECT MIN(time) FROM scrobble',
+    'SELECT id FROM scrobble ORDER BY time DESC LIMIT 50',
+    "SELECT COUNT(id) FROM scrobble WHERE time >= '2014-05-06'",
+])
+def test_scrobble_time_indexed(database, query):
+    """Scrobble time queries run on every update and must not scan the
+    entire scrobble table"""
+    with session_scope(database, commit=False) as session:
+        plan = session.execute('EXPLAIN QUERY PLAN ' + query).fetchall()
+
+    details = ' '.join(row[-1] for row in plan)
+    assert 'INDEX' in details
+
+
+def test_count_scrobbles_window(database):
+    loader = mstat.ScrobbleLoader(MagicMock(), database)
+    scrobbles = [TestScrobbleLoader.fm_track('Artist', 'Album', 'Track',
+                                             datetime(2014, 5, day))
+                 for day in range(1, 11)]
+
+    with session_scope(database) as session:
+        loader.load_scrobbles_from_list(session, scrobbles)
+
+    with session_scope(database, commit=False) as session:
+        assert mstat.count_scrobbles(session) == 10
+        assert mstat.count_scrobbles(session, start=datetime(2014, 5, 6)) == 5
+        assert mstat.count_scrobbles(session, end=datetime(2014, 5, 2)) == 2
@@ -1,11 +1,16 @@
 import suggestive.mvc.base as mvc
+from suggestive import records
+from suggestive.mvc.base import TrackModel
 
+import asyncio
 import pytest
+from unittest.mock import patch
 
 
 @pytest.fixture(autouse=True)
 def registry(request):
     request.addfinalizer(mvc.Controller._registry.clear)
+    request.addfinalizer(mvc.Controller._factories.clear)
 
 
 def test_model_view():
@@ -59,3 +64,127 @@ def test_invalid_controller():
     except TypeError as ex:
         assert ex.args[0].startswith('Invalid controller name: NotCtrl'), \
             'Incorrect error thrown'
+
+
+def test_controller_factory():
+    created = []
+
+    class FooController(mvc.Controller):
+        pass
+
+    class BarController(mvc.Controller):
+        pass
+
+    def create_foo():
+        created.append(FooController(None, None, None))
+
+    mvc.Controller.register_factory('foo', create_foo)
+    bar = BarController(None, None, None)
+
+    assert bar.controller_for('foo', create=False) is None
+    assert not created
+
+    foo = bar.controller_for('foo')
+    assert created == [foo]
+    assert bar.controller_for('Foo') is foo
+    assert len(created) == 1
+
+
+@patch('suggestive.mvc.playlist.mstat')
+def test_playlist_unknown_tracks(mstat):
+    from suggestive.mvc.playlist import PlaylistController, PlaylistModel
+
+    known = records.TrackRecord(1, 'Known', 'known.mp3', 1, 'Album', 1,
+                                'Artist', False)
+    added = records.TrackRecord(2, 'Added', 'added.mp3', 1, 'Album', 1,
+                                'Artist', False)
+    playlist = [{'id': '1', 'file': 'known.mp3'},
+                {'id': '2', 'file': 'added.mp3'},
+                {'id': '3', 'file': 'missing.mp3'}]
+
+    model = PlaylistModel()
+    controller = PlaylistController(model, None, None)
+    mstat.reset_mock()
+
+    model.mpd_playlist = playlist
+    model.tracks = [
+        TrackModel(known, 0),
+        TrackModel(records.unknown_track('added.mp3', 'added.mp3'), 1),
+        TrackModel(records.unknown_track('missing.mp3', 'missing.mp3'), 2),
+    ]
+
+    # The database update added one of the unknown tracks
+    mstat.database_tracks_from_mpd.return_value = [
+        added, records.unknown_track('missing.mp3', 'missing.mp3')]
+    controller.update_unknown_tracks()
+
+    mstat.database_tracks_from_mpd.assert_called_once_with(
+        None, (playlist[1], playlist[2]))
+    assert [track.name for track in model.tracks] == \
+        ['Known', 'Added', 'missing.mp3']
+
+
+class AsyncMpd(object):
+
+    def __init__(self, playlist):
+        self.playlist = playlist
+
+    async def playlistinfo(self):
+        return self.playlist
+
+    async def currentsong(self):
+        return {}
+
+
+@patch('suggestive.mvc.playlist.mstat')
+def test_playlist_async_update(mstat):
+    from suggestive.mvc.playlist import PlaylistController, PlaylistModel
+
+    loop = asyncio.new_event_loop()
+    lookups = []
+
+    class Executor(object):
+        def run_in_executor(self, executor, func, *args):
+            lookups.append(loop.create_future())
+            return lookups[-1]
+
+    model = PlaylistModel()
+    controller = PlaylistController(model, None, Executor())
+    initial = model.mpd_playlist
+
+    track = records.TrackRecord(1, 'Track', 'a.mp3', 1, 'Album', 1, 'Artist',
+                                False)
+    first = [{'id': '1', 'file': 'a.mp3'}]
+    second = [{'id': '2', 'file': 'a.mp3'}]
+
+    async def run():
+        update = asyncio.ensure_future(
+            controller.async_update_model(AsyncMpd(first)))
+        await asyncio.sleep(0)
+        assert len(lookups) == 1
+
+        # The model is unchanged until the lookup finishes, and a redundant
+        # update doesn't start another lookup
+        assert model.mpd_playlist is initial
+        await controller.async_update_model(AsyncMpd(first))
+        assert len(lookups) == 1
+
+        # A newer update supersedes the one in progress
+        newer = asyncio.ensure_future(
+            controller.async_update_model(AsyncMpd(second)))
+        await asyncio.sleep(0)
+        assert len(lookups) == 2
+
+        lookups[0].set_result([TrackModel(track, 0)])
+        await update
+        assert model.mpd_playlist is initial
+
+        lookups[1].set_result([TrackModel(track, 0)])
+        await newer
+        assert model.mpd_playlist == second
+        assert model.playlist_tracks['2'].track == track
+
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
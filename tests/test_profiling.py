@@ -0,0 +1,96 @@
+from suggestive.profiling import Profiler, ProfiledExecutor, summary
+
+import pytest
+import threading
+
+
+def main_thread_work():
+    return sum(range(1000))
+
+
+def executor_work():
+    return sorted(range(1000), reverse=True)[0]
+
+
+def wrapped_work():
+    return max(range(1000))
+
+
+def unprofiled_work():
+    return min(range(1000))
+
+
+def function_names(stats):
+    return {name for _, _, name in stats.stats}
+
+
+def test_profile_threads():
+    profiler = Profiler()
+    executor = ProfiledExecutor(profiler, max_workers=1)
+
+    # Not profiling yet
+    executor.submit(unprofiled_work).result()
+
+    profiler.start()
+    main_thread_work()
+    assert executor.submit(executor_work).result() == 999
+
+    thread = threading.Thread(target=profiler.wrap(wrapped_work))
+    thread.start()
+    thread.join()
+
+    stats = profiler.stop()
+    executor.shutdown()
+
+    names = function_names(stats)
+    assert {'main_thread_work', 'executor_work', 'wrapped_work'} <= names
+    assert 'unprofiled_work' not in names
+    assert 'main_thread_work' in summary(stats)
+
+
+def test_restart():
+    profiler = Profiler()
+
+    profiler.start()
+    main_thread_work()
+    profiler.stop()
+
+    profiler.start()
+    wrapped_work()
+    names = function_names(profiler.stop())
+
+    assert 'wrapped_work' in names
+    assert 'main_thread_work' not in names
+
+
+def test_busy_thread_left_out():
+    profiler = Profiler()
+    started, finish = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        finish.wait()
+
+    profiler.start()
+    thread = threading.Thread(target=profiler.wrap(job))
+    thread.start()
+    started.wait()
+
+    stats = profiler.stop()
+    finish.set()
+    thread.join()
+
+    assert 'job' not in function_names(stats)
+
+
+def test_not_running():
+    profiler = Profiler()
+    assert profiler.call(main_thread_work) == 499500
+
+    with pytest.raises(RuntimeError):
+        profiler.stop()
+
+    profiler.start()
+    with pytest.raises(RuntimeError):
+        profiler.start()
+    profiler.stop()
@@ -0,0 +1,125 @@
+"""
+Upper bounds on the SQL statements and MPD commands issued by hot paths.  The
+budgets do not grow with the size of the library, so issuing one query or
+command per track, album or scrobble fails these tests
+"""
+
+from suggestive.bench.datagen import Dataset
+from suggestive.bench import runner
+from suggestive.bench.scenarios import ORDERERS
+from suggestive.catalog import catalog
+from suggestive.db.model import Album, Track
+from suggestive.db.session import session_scope
+from suggestive.lastfm import LastFM
+import suggestive.analytics as analytics
+import suggestive.mstat as mstat
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def env(request):
+    dataset = Dataset(artists=6, albums_per_artist=3, tracks_per_album=8,
+                      scrobbles=300, loved_rate=0.2)
+    env = runner.Environment(dataset)
+    request.addfinalizer(env.close)
+    return env
+
+
+class Budget(object):
+
+    """Count the statements and commands issued against an Environment"""
+
+    def __init__(self, env):
+        self.env = env
+        self.queries = self.commands = None
+
+    def __enter__(self):
+        self.queries = self.env.queries
+        self.commands = self.env.mpd.commands
+        return self
+
+    def __exit__(self, *args):
+        self.queries = self.env.queries - self.queries
+        self.commands = self.env.mpd.commands - self.commands
+
+
+def test_mpd_loader(env):
+    env.reset_database(0.0, False)
+
+    with Budget(env) as budget:
+        with session_scope(env.conf) as session:
+            mstat.MpdLoader(env.conf).load(session)
+
+    assert budget.queries <= 17
+    assert budget.commands <= 3
+
+    with session_scope(env.conf, read_only=True) as session:
+        assert session.query(Track).count() == len(env.dataset.tracks)
+
+
+def test_load_scrobbles_from_list(env):
+    env.reset_database(1.0, False)
+    scrobbles = list(LastFM(env.conf).scrobbles('bench'))
+
+    with Budget(env) as budget:
+        with session_scope(env.conf) as session:
+            loader = mstat.ScrobbleLoader(LastFM(env.conf), env.conf)
+            assert loader.load_scrobbles_from_list(session, scrobbles) == 300
+
+    assert budget.queries <= 10
+
+
+def test_track_info_loader(env):
+    env.reset_database(1.0, False)
+
+    with Budget(env) as budget:
+        with session_scope(env.conf) as session:
+            mstat.TrackInfoLoader(LastFM(env.conf), env.conf).load(session)
+
+    assert budget.queries <= 5
+
+
+def test_database_tracks_from_mpd(env):
+    env.reset_database(1.0, True)
+    tracks_info = [track.mpd_info() for track in env.dataset.tracks]
+    catalog.ensure_loaded(env.conf)
+
+    with Budget(env) as budget:
+        tracks = mstat.database_tracks_from_mpd(env.conf, tracks_info)
+        assert [track.artist_name for track in tracks] == \
+            [track.artist for track in env.dataset.tracks]
+        assert [track.loved for track in tracks] == \
+            [track.loved for track in env.dataset.tracks]
+
+    assert budget.queries == 0
+    assert budget.commands == 0
+
+
+def test_get_album_tracks(env):
+    env.reset_database(1.0, True)
+    with session_scope(env.conf, read_only=True) as session:
+        album = session.query(Album).first()
+    catalog.ensure_loaded(env.conf)
+
+    with Budget(env) as budget:
+        tracks = mstat.get_album_tracks(env.conf, album)
+        assert all(track.album_name == album.name for track in tracks)
+        assert all(track.artist_name for track in tracks)
+
+    assert budget.queries == 0
+
+
+@pytest.mark.parametrize('name', list(ORDERERS))
+def test_order_albums(env, name):
+    env.reset_database(1.0, True)
+    orderers = [analytics.BaseOrder(), ORDERERS[name]()]
+    catalog.ensure_loaded(env.conf)
+
+    with Budget(env) as budget:
+        suggestions = analytics.Analytics(env.conf).order_albums(orderers)
+        assert all(suggestion.album.artist_name
+                   for suggestion in suggestions)
+
+    assert budget.queries == 0
+    assert budget.commands <= 1
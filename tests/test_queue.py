@@ -1,4 +1,10 @@
-from suggestive.threads import PriorityEventQueue
+from suggestive.threads import DatabaseWriter, DatabaseUpdater, submit_write
+from suggestive.events import PriorityEventQueue, MpdObserver, EventDispatcher
+
+import asyncio
+import pytest
+import threading
+from unittest.mock import MagicMock, patch
 
 
 def test_unique_different_priorities():
@@ -30,3 +36,169 @@ def test_nonunique():
     assert queue.get() == (0, 'myevent')
     assert queue.get() == (1, 'myevent')
     assert queue.empty(), 'Queue is not empty'
+
+
+def test_stats():
+    queue = PriorityEventQueue()
+    queue.put((0, 'player'))
+    queue.put((0, 'player'))
+    queue.put((1, 'myevent'))
+    queue.put((1, 'myevent'))
+
+    while not queue.empty():
+        queue.get()
+
+    assert queue.stats['player'].dispatched == 1
+    assert queue.stats['player'].dropped == 1
+    assert queue.stats['myevent'].dispatched == 2
+    assert queue.stats['myevent'].dropped == 0
+    assert queue.stats['myevent'].max_latency >= 0
+
+
+def test_observer_coalesces_by_name(mock_config):
+    calls = []
+
+    async def update_player():
+        calls.append('player')
+
+    events = {'player': update_player, 'playlist': lambda: calls.append('pl')}
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        after_dispatch = MagicMock()
+        dispatcher = EventDispatcher(events, loop, after_dispatch)
+        observer = MpdObserver(mock_config, dispatcher)
+
+        for _ in range(10):
+            observer.consume_event('player')
+        observer.consume_event('playlist')
+        observer.consume_event('mixer')
+
+        task = loop.create_task(dispatcher.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        assert after_dispatch.call_count == 1
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+
+    assert calls == ['player', 'pl']
+    assert dispatcher.queue.stats['player'].dropped == 9
+    assert 'mixer' not in dispatcher.queue.stats
+
+
+def test_dispatcher_survives_callback_errors():
+    calls = []
+
+    def fail():
+        raise ValueError('oops')
+
+    events = {'player': fail, 'playlist': lambda: calls.append('pl')}
+
+    async def run():
+        dispatcher = EventDispatcher(events, asyncio.get_running_loop())
+        dispatcher.post(0, 'player')
+        dispatcher.post(1, 'playlist')
+
+        task = asyncio.get_running_loop().create_task(dispatcher.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(run())
+    assert calls == ['pl']
+
+
+def test_database_writer():
+    quit_event = threading.Event()
+    writer = DatabaseWriter(quit_event, timeout=0.01)
+    writer.start()
+
+    results = []
+    futures = [submit_write(results.append, i) for i in range(10)]
+    for future in futures:
+        future.result(1)
+
+    failed = submit_write(int, 'not a number')
+    pytest.raises(ValueError, failed.result, 1)
+
+    quit_event.set()
+    writer.join(1)
+
+    assert results == list(range(10))
+    assert not writer.is_alive()
+
+
+def test_database_writer_cancels_pending():
+    quit_event = threading.Event()
+    quit_event.set()
+
+    pending = submit_write(int, '1')
+    writer = DatabaseWriter(quit_event, timeout=0.01)
+    writer.start()
+    writer.join(1)
+
+    assert pending.cancelled()
+
+
+@pytest.fixture
+def updater(request, mock_config):
+    quit_event = threading.Event()
+    writer = DatabaseWriter(quit_event, timeout=0.01)
+    finished = threading.Event()
+    updater = DatabaseUpdater(mock_config, quit_event, MagicMock(),
+                              finished.set, delay=0.05, timeout=0.01)
+    updater.finished_event = finished
+
+    patchers = [patch('suggestive.threads.mstat.update_mpd'),
+                patch('suggestive.threads.mstat.update_lastfm')]
+    updater.update_mpd, _ = [patcher.start() for patcher in patchers]
+
+    writer.start()
+    updater.start()
+
+    def fin():
+        quit_event.set()
+        updater.join(1)
+        writer.join(1)
+        for patcher in patchers:
+            patcher.stop()
+
+    request.addfinalizer(fin)
+    return updater
+
+
+def test_database_updater_coalesces(updater):
+    for _ in range(5):
+        updater.request()
+
+    assert updater.status == 'database update queued'
+    assert updater.finished_event.wait(1)
+    assert updater.update_mpd.call_count == 1
+    assert updater.status is None
+
+
+def test_database_updater_trailing_run(updater):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_update(conf):
+        started.set()
+        release.wait(1)
+
+    updater.update_mpd.side_effect = slow_update
+    updater.request()
+    assert started.wait(1)
+
+    # Requests made during an update cause exactly one more update
+    updater.request()
+    updater.request()
+    assert updater.status == 'updating database; update queued'
+
+    updater.update_mpd.side_effect = None
+    release.set()
+    assert updater.finished_event.wait(1)
+    updater.finished_event.clear()
+    assert updater.finished_event.wait(1)
+
+    assert updater.update_mpd.call_count == 2
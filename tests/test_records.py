@@ -0,0 +1,60 @@
+from suggestive import records
+from suggestive.db.model import (
+    Artist, Album, Track, Scrobble, LastfmTrackInfo)
+from suggestive.db.session import session_scope
+
+import pytest
+from datetime import datetime
+
+
+@pytest.fixture
+def library(database):
+    with session_scope(database) as session:
+        artist = Artist(name='Artist')
+        album = Album(name='Album', artist=artist, ignored=True)
+        loved = Track(name='Loved', filename='loved.mp3', album=album,
+                      artist=artist, lastfm_info=LastfmTrackInfo(loved=True))
+        plain = Track(name='Plain', filename='plain.mp3', album=album,
+                      artist=artist)
+        session.add_all([loved, plain])
+        session.add_all([
+            Scrobble(time=datetime(2014, 5, day), track=loved)
+            for day in (1, 2)
+        ])
+
+    return database
+
+
+def test_album_records(library):
+    with session_scope(library, read_only=True) as session:
+        [album] = records.album_records(records.album_query(session))
+
+    assert album == records.AlbumRecord(1, 'Album', 1, 'Artist', True)
+
+    with pytest.raises(AttributeError):
+        album.ignored = False
+    with pytest.raises(AttributeError):
+        album.extra = None
+
+
+def test_track_records(library):
+    with session_scope(library, read_only=True) as session:
+        tracks = records.track_records(
+            records.track_query(session).order_by(Track.id))
+
+    assert [(track.name, track.album_name, track.artist_name, track.loved)
+            for track in tracks] == [
+        ('Loved', 'Album', 'Artist', True),
+        ('Plain', 'Album', 'Artist', False),
+    ]
+
+    # Equal names are shared between records
+    assert tracks[0].artist_name is tracks[1].artist_name
+
+
+def test_unknown_track():
+    track = records.unknown_track('path/to/file.mp3', 'file.mp3')
+
+    assert track.id is None
+    assert track.artist_name == track.album_name == records.UNKNOWN
+    assert not track.loved
@@ -0,0 +1,112 @@
+from suggestive.config import Config
+from suggestive.db.session import (
+    session_scope, initialize, queries, normalize_statement)
+from suggestive.db.model import Artist
+
+import logging
+import pytest
+from sqlalchemy.exc import OperationalError
+
+
+@pytest.fixture
+def tracked(request, database):
+    """Database with query tracking enabled"""
+    data = database.to_dict()
+    data['general'].update(log_sql_queries=True, similar_query_threshold=3)
+    conf = Config(configuration=data)
+    initialize(conf)
+
+    request.addfinalizer(lambda: queries.configure(database))
+    return conf
+
+
+def test_sqlite_pragmas(database):
+    expected = {
+        'journal_mode': 'wal',
+        'synchronous': 1,
+        'cache_size': -32768,
+        'temp_store': 2,
+        'busy_timeout': 5000,
+    }
+
+    with session_scope(database, commit=False) as session:
+        for name, value in expected.items():
+            result = session.execute('PRAGMA {}'.format(name)).scalar()
+            assert result == value, name
+
+
+def test_read_only_session(database):
+    with session_scope(database, read_only=True) as session:
+        session.add(Artist(name='Artist'))
+        pytest.raises(OperationalError, session.flush)
+
+    with session_scope(database) as session:
+        session.add(Artist(name='Artist'))
+
+    with session_scope(database, read_only=True) as session:
+        assert session.query(Artist).count() == 1
+
+
+def test_normalize_statement():
+    assert normalize_statement(
+        'SELECT id\nFROM track\nWHERE filename IN (?, ?, ?)') == \
+        'SELECT id FROM track WHERE filename IN (?)'
+    assert normalize_statement('SELECT ? FROM track WHERE id = ?') == \
+        'SELECT ? FROM track WHERE id = ?'
+
+
+def test_query_summary(tracked, caplog):
+    def add_artists():
+        with session_scope(tracked) as session:
+            session.add(Artist(name='Artist'))
+
+    caplog.set_level(logging.INFO, logger='suggestive.db.session')
+    add_artists()
+
+    with session_scope(tracked, read_only=True, operation='count') as session:
+        assert session.query(Artist).count() == 1
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 2
+    assert messages[0].startswith(
+        'test_query_summary.<locals>.add_artists: 1 statements in ')
+    assert messages[1].startswith('count: 1 statements in ')
+
+
+def test_similar_queries(tracked, caplog):
+    with session_scope(tracked) as session:
+        for i in range(4):
+            session.add(Artist(name='Artist {}'.format(i)))
+            session.flush()
+
+    with session_scope(tracked, operation='batch') as session:
+        session.query(Artist).filter(Artist.id.in_([1, 2])).all()
+        session.query(Artist).filter(Artist.id.in_([1, 2, 3])).all()
+        session.query(Artist).filter(Artist.id.in_([1])).all()
+
+    with session_scope(tracked, operation='n+1') as session:
+        for i in range(1, 5):
+            session.query(Artist).filter_by(id=i).one()
+
+    warnings = [record.getMessage() for record in caplog.records
+                if record.levelno == logging.WARNING]
+    assert len(warnings) == 2
+    assert warnings[0].startswith(
+        'test_similar_queries executed 4 similar statements (N+1 queries?): '
+        'INSERT INTO artist')
+    assert warnings[1].startswith(
+        'n+1 executed 4 similar statements (N+1 queries?): SELECT')
+
+
+def test_nested_scopes(tracked, caplog):
+    caplog.set_level(logging.INFO, logger='suggestive.db.session')
+
+    with session_scope(tracked, operation='outer') as outer:
+        outer.query(Artist).all()
+        with session_scope(tracked, read_only=True, operation='inner') as inner:
+            inner.query(Artist).all()
+            inner.query(Artist).all()
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages[0].startswith('inner: 2 statements')
+    assert messages[1].startswith('outer: 1 statements')
@@ -0,0 +1,50 @@
+from suggestive import snapshot
+from suggestive.records import AlbumRecord
+
+import json
+import os
+import pytest
+from tempfile import mkdtemp
+import shutil
+
+
+@pytest.fixture
+def path(request):
+    directory = mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(directory))
+    return os.path.join(directory, 'library.json')
+
+
+def album(id, artist, name, ignored=False):
+    return AlbumRecord(id, name, id, artist, ignored)
+
+
+def test_roundtrip(path):
+    albums = [(album(2, 'Artist', 'Second'), 3.5),
+              (album(1, 'Ärtist', 'First', ignored=True), 1.0)]
+
+    assert snapshot.save(path, snapshot.album_rows(albums))
+    assert not os.path.exists(path + '.tmp')
+
+    loaded = snapshot.load(path)
+    assert [(a.id, a.artist_name, a.name, a.ignored, score)
+            for a, score in loaded] == [
+        (2, 'Artist', 'Second', False, 3.5),
+        (1, 'Ärtist', 'First', True, 1.0),
+    ]
+
+
+def test_missing(path):
+    assert snapshot.load(path) == []
+
+
+@pytest.mark.parametrize('contents', [
+    'not json',
+    json.dumps({'version': snapshot.VERSION + 1, 'albums': []}),
+    json.dumps({'version': snapshot.VERSION, 'albums': [[1, 'a']]}),
+])
+def test_invalid(path, contents):
+    with open(path, 'w') as handle:
+        handle.write(contents)
+
+    assert snapshot.load(path) == []
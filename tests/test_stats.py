@@ -0,0 +1,124 @@
+from suggestive.stats import StatsRegistry, TimingStats, TimedMpdClient
+
+import asyncio
+import pytest
+from unittest.mock import Mock
+
+
+@pytest.fixture
+def registry():
+    return StatsRegistry(enabled=True)
+
+
+def test_timing_stats():
+    stats = TimingStats()
+    for elapsed in (0.0005, 0.002, 0.003, 10.0):
+        stats.record(elapsed)
+
+    assert stats.count == 4
+    assert stats.max == 10.0
+    assert stats.mean == pytest.approx(10.0055 / 4)
+    assert stats.histogram == [1, 2, 0, 0, 0, 0, 0, 0, 1]
+    assert stats.format_histogram() == '<=1.0ms:1 <=5.0ms:2 >5.00s:1'
+
+
+def test_timed(registry):
+    @registry.timed
+    def double(value):
+        return value * 2
+
+    @registry.timed(name='halve')
+    def half(value):
+        return value / 2
+
+    assert double(2) == 4
+    assert double(3) == 6
+    assert half(2) == 1
+
+    assert registry.stats['test_timed.<locals>.double'].count == 2
+    assert registry.stats['halve'].count == 1
+
+
+def test_timed_exception(registry):
+    @registry.timed(name='fail')
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        fail()
+
+    assert registry.stats['fail'].count == 1
+
+
+def test_timed_coroutine(registry):
+    @registry.timed(name='sleep')
+    async def sleep():
+        await asyncio.sleep(0.01)
+        return 'done'
+
+    assert asyncio.run(sleep()) == 'done'
+    assert registry.stats['sleep'].count == 1
+    assert registry.stats['sleep'].total >= 0.01
+
+
+def test_disabled():
+    registry = StatsRegistry()
+
+    @registry.timed(name='noop')
+    def noop():
+        pass
+
+    noop()
+    with registry.timer('block'):
+        pass
+
+    assert registry.stats == {}
+    assert registry.summary() == []
+
+
+def test_summary(registry):
+    registry.record('fast', 0.001)
+    registry.record('slow', 1.0)
+    registry.record('medium', 0.1)
+    registry.record('medium', 0.1)
+
+    assert [name for name, _ in registry.summary()] == [
+        'slow', 'medium', 'fast']
+    assert [name for name, _ in registry.summary(limit=1)] == ['slow']
+
+    registry.reset()
+    assert registry.summary() == []
+
+
+def test_timed_mpd_client(registry):
+    client = Mock()
+    client.playlistinfo.return_value = [{'file': 'a.flac'}]
+    client.mpd_version = '0.23.0'
+
+    mpd = TimedMpdClient(client, registry)
+    assert mpd.playlistinfo() == [{'file': 'a.flac'}]
+    mpd.status()
+    mpd.status()
+    mpd.connect('localhost', 6600)
+
+    assert mpd.mpd_version == '0.23.0'
+    assert registry.stats['mpd.playlistinfo'].count == 1
+    assert registry.stats['mpd.status'].count == 2
+    assert 'mpd.connect' not in registry.stats
+
+
+def test_timed_async_mpd_client(registry):
+    async def run():
+        future = asyncio.get_running_loop().create_future()
+        client = Mock()
+        client.currentsong.return_value = future
+
+        mpd = TimedMpdClient(client, registry)
+        result = mpd.currentsong()
+        assert 'mpd.currentsong' not in registry.stats
+
+        future.set_result({'file': 'a.flac'})
+        assert await result == {'file': 'a.flac'}
+
+    asyncio.run(run())
+    assert registry.stats['mpd.currentsong'].count == 1